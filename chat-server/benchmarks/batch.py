@@ -0,0 +1,235 @@
+"""Run a large batch job against the fake provider, killing the server partway through to check that the job resumes.
+
+One batch job of --prompts prompts on each of --models is submitted, and its results are followed over a single
+NDJSON connection while the server works through it. Once --kill-after of the results have arrived the server is
+killed without warning, as a crashed worker would be, and started again; the items it was running are claimed again
+when their claims expire after --claim-seconds, and the client reconnects and follows the remaining results.
+
+The run fails when the job does not complete, or when any result is missing, failed or arrives twice. The provider
+streams opened are reported too: one per result, plus those the killed server left unfinished and any retries.
+
+For example:
+    python benchmarks/batch.py --prompts 2000 --concurrency 32 --output results/batch.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+import httpx
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+SERVER_DIR = BENCHMARKS_DIR.parent
+HOST = "127.0.0.1"
+STARTUP_TIMEOUT = 30.0
+REQUEST_TIMEOUT = 600.0
+POLL_INTERVAL = 0.05
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--models", nargs="+", default=["gpt-4o", "claude-3-5-sonnet-20241022"])
+    parser.add_argument("--prompts", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32, help="the server's BATCH_CONCURRENCY")
+    parser.add_argument("--claim-seconds", type=float, default=3.0, help="the server's BATCH_CLAIM_SECONDS")
+    parser.add_argument(
+        "--kill-after",
+        type=float,
+        default=0.3,
+        help="share of the results after which the server is killed; 0 to let it run undisturbed",
+    )
+    parser.add_argument("--database-url", help="default: a temporary SQLite database")
+    parser.add_argument("--output", type=Path, help="where to write the JSON results")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as workdir:
+        provider_port, server_port = _free_port(), _free_port()
+        server_env = {
+            **os.environ,
+            "PYTHONPATH": os.pathsep.join(filter(None, [str(SERVER_DIR / "src"), os.environ.get("PYTHONPATH")])),
+            "DATABASE_URL": args.database_url or f"sqlite+aiosqlite:///{workdir}/batch.db",
+            "REDIS_URL": "localhost",
+            "REDIS_PORT": "6379",
+            "REDIS_DB": "0",
+            "OPENAI_BASE_URL": f"http://{HOST}:{provider_port}/v1",
+            "ANTHROPIC_BASE_URL": f"http://{HOST}:{provider_port}",
+            "OPENAI_API_KEY": "benchmark",
+            "ANTHROPIC_API_KEY": "benchmark",
+            "LOG_LEVEL": "WARNING",
+            "BATCH_CONCURRENCY": str(args.concurrency),
+            "BATCH_CLAIM_SECONDS": str(args.claim_seconds),
+            "BATCH_POLL_INTERVAL": "0.2",
+        }
+        subprocess.run([sys.executable, "-m", "chat_server.migrate"], env=server_env, cwd=workdir, check=True)
+        provider = subprocess.Popen(
+            [
+                sys.executable,
+                str(BENCHMARKS_DIR / "fake_provider.py"),
+                f"--port={provider_port}",
+                "--ttft=0.2",
+                "--tokens-per-second=200",
+                "--response-tokens=50",
+            ],
+        )
+
+        def start_server() -> subprocess.Popen:
+            return subprocess.Popen(
+                [sys.executable, str(BENCHMARKS_DIR / "serve.py"), f"--port={server_port}"],
+                env=server_env,
+                cwd=workdir,
+            )
+
+        servers = [start_server()]
+        try:
+            results = asyncio.run(_run_job(args, provider, servers, start_server, (provider_port, server_port)))
+        finally:
+            for process in (*servers, provider):
+                process.terminate()
+                process.wait()
+
+    failures = _check(results)
+    print(
+        f"{results['items']} results in {results['seconds']:.1f}s ({results['items_per_second']:.0f}/s) over "
+        f"{results['connections']} result connections, {results['provider_streams']} provider streams, "
+        f"server killed after {results['results_before_kill']} results",
+    )
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(results, indent=2))
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if failures:
+        sys.exit(1)
+
+
+async def _run_job(
+    args: argparse.Namespace,
+    provider: subprocess.Popen,
+    servers: list[subprocess.Popen],
+    start_server: Callable[[], subprocess.Popen],
+    ports: tuple[int, int],
+) -> dict:
+    provider_port, server_port = ports
+    provider_url = f"http://{HOST}:{provider_port}"
+    item_count = args.prompts * len(args.models)
+    kill_after = int(item_count * args.kill_after)
+    async with httpx.AsyncClient(base_url=f"http://{HOST}:{server_port}", timeout=REQUEST_TIMEOUT) as client:
+        await _wait_until_ready(client, provider, f"{provider_url}/openapi.json")
+        await _wait_until_ready(client, servers[-1], "/health/live")
+        streams_before = (await client.get(f"{provider_url}/stats")).json()["total_streams"]
+        started = time.perf_counter()
+        prompts = [f"Prompt {index}: summarize the benchmark" for index in range(args.prompts)]
+        response = await client.post("/batch", json={"prompts": prompts, "models": args.models})
+        response.raise_for_status()
+        job_id = response.json()["id"]
+
+        received: list[tuple[int, str, str]] = []
+        connections = 1
+        results_before_kill = None
+        if kill_after:
+            await _follow(client, job_id, received, kill_after)
+            # Items finish in waves, so make sure the server dies with some of them half generated
+            await _wait_for_running_items(client, job_id)
+            servers[-1].send_signal(signal.SIGKILL)
+            servers[-1].wait()
+            results_before_kill = len(received)
+            servers.append(start_server())
+            await _wait_until_ready(client, servers[-1], "/health/live")
+            connections += 1
+        # Results that arrived before the kill are followed again, and only the new ones kept
+        seen = {(prompt_index, model) for prompt_index, model, _ in received}
+        resumed: list[tuple[int, str, str]] = []
+        await _follow(client, job_id, resumed)
+        received.extend(result for result in resumed if result[:2] not in seen)
+        seconds = time.perf_counter() - started
+        job = (await client.get(f"/batch/{job_id}")).json()
+        streams = (await client.get(f"{provider_url}/stats")).json()["total_streams"] - streams_before
+    return {
+        "items": item_count,
+        "job": job,
+        "received": len(received),
+        "distinct": len({result[:2] for result in received}),
+        "failed": sum(1 for _, _, status in received if status != "done"),
+        "seconds": seconds,
+        "items_per_second": item_count / seconds,
+        "connections": connections,
+        "provider_streams": streams,
+        "results_before_kill": results_before_kill,
+        "concurrency": args.concurrency,
+    }
+
+
+async def _follow(
+    client: httpx.AsyncClient,
+    job_id: str,
+    received: list[tuple[int, str, str]],
+    stop_after: int | None = None,
+) -> None:
+    headers = {"Accept": NDJSON_MEDIA_TYPE}
+    async with client.stream("GET", f"/batch/{job_id}/results", headers=headers) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line:
+                continue
+            result = json.loads(line)
+            received.append((result["prompt_index"], result["model"], result["status"]))
+            if stop_after is not None and len(received) >= stop_after:
+                return
+
+
+async def _wait_for_running_items(client: httpx.AsyncClient, job_id: str) -> None:
+    while True:
+        if (await client.get(f"/batch/{job_id}")).json()["running"] > 0:
+            return
+        await asyncio.sleep(POLL_INTERVAL)
+
+
+def _check(results: dict) -> list[str]:
+    failures = []
+    if results["job"]["status"] != "completed":
+        failures.append(f"job is still {results['job']['status']}")
+    if results["distinct"] != results["items"]:
+        failures.append(f"{results['distinct']} of {results['items']} results received")
+    if results["received"] != results["distinct"]:
+        failures.append(f"{results['received'] - results['distinct']} results received twice")
+    if results["failed"]:
+        failures.append(f"{results['failed']} results failed")
+    return failures
+
+
+async def _wait_until_ready(client: httpx.AsyncClient, process: subprocess.Popen, url: str) -> None:
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while True:
+        if process.poll() is not None:
+            exited_error = f"{process.args[1]} exited with status {process.returncode}"
+            raise RuntimeError(exited_error)
+        try:
+            if (await client.get(url)).status_code == httpx.codes.OK:
+                return
+        except httpx.TransportError:
+            if time.monotonic() > deadline:
+                raise
+        await asyncio.sleep(0.1)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind((HOST, 0))
+        return s.getsockname()[1]
+
+
+if __name__ == "__main__":
+    main()
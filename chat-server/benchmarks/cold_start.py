@@ -0,0 +1,175 @@
+"""Measure the chat server's cold start and fail when it exceeds its budget.
+
+Each run starts a fresh interpreter, so nothing is shared through the OS page cache beyond what a new container
+would also see after its first start. Two numbers are reported as medians over --runs:
+
+- import: time to ``import chat_server.main``, with the slowest modules from ``python -X importtime``
+- startup: time from spawning the server process until /health/live answers
+
+Modules that must stay lazy (the provider SDKs) are reported as a failure if the import pulls them in.
+
+For example:
+    python benchmarks/cold_start.py --runs 5 --output results/cold_start.json
+"""
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+SERVER_DIR = BENCHMARKS_DIR.parent
+HOST = "127.0.0.1"
+STARTUP_TIMEOUT = 30.0
+# Median seconds, on a developer machine; tests/test_cold_start.py checks the import against it with headroom
+IMPORT_BUDGET = 1.5
+STARTUP_BUDGET = 3.0
+# Loaded on first use of one of their models, never at import
+LAZY_MODULES = ("openai", "anthropic")
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import chat_server.main; print(time.perf_counter() - t)"
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument(
+        "--import-budget", type=float, default=IMPORT_BUDGET, help="median import time budget, in seconds"
+    )
+    parser.add_argument(
+        "--startup-budget", type=float, default=STARTUP_BUDGET, help="median startup time budget, in seconds"
+    )
+    parser.add_argument("--top", type=int, default=15, help="how many of the slowest imports to report")
+    parser.add_argument("--output", type=Path, help="where to write the JSON results")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as workdir:
+        env = {
+            **os.environ,
+            "PYTHONPATH": os.pathsep.join(filter(None, [str(SERVER_DIR / "src"), os.environ.get("PYTHONPATH")])),
+            "DATABASE_URL": f"sqlite+aiosqlite:///{workdir}/cold_start.db",
+            "REDIS_URL": "localhost",
+            "REDIS_PORT": "6379",
+            "REDIS_DB": "0",
+            "LOG_LEVEL": "WARNING",
+        }
+        subprocess.run([sys.executable, "-m", "chat_server.migrate"], env=env, cwd=workdir, check=True)
+        import_seconds = [_import_seconds(env, workdir) for _ in range(args.runs)]
+        startup_seconds = [_startup_seconds(env, workdir) for _ in range(args.runs)]
+        slowest, loaded = _import_profile(env, workdir)
+
+    results = {
+        "import_seconds": statistics.median(import_seconds),
+        "startup_seconds": statistics.median(startup_seconds),
+        "slowest_imports": slowest[: args.top],
+        "eager_lazy_modules": [module for module in LAZY_MODULES if module in loaded],
+        "runs": args.runs,
+    }
+    failures = _failures(results, args)
+
+    print(f"import: {results['import_seconds'] * 1000:.0f}ms (budget {args.import_budget * 1000:.0f}ms)")
+    print(f"startup: {results['startup_seconds'] * 1000:.0f}ms (budget {args.startup_budget * 1000:.0f}ms)")
+    print("slowest imports (cumulative):")
+    for module, seconds in results["slowest_imports"]:
+        print(f"  {seconds * 1000:8.1f}ms  {module}")
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(results, indent=2))
+    if failures:
+        sys.exit(1)
+
+
+def _import_seconds(env: dict[str, str], workdir: str) -> float:
+    completed = subprocess.run(
+        [sys.executable, "-c", IMPORT_SNIPPET],
+        env=env,
+        cwd=workdir,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return float(completed.stdout.strip().splitlines()[-1])
+
+
+def _startup_seconds(env: dict[str, str], workdir: str) -> float:
+    port = _free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, str(BENCHMARKS_DIR / "serve.py"), f"--port={port}"],
+        env=env,
+        cwd=workdir,
+    )
+    try:
+        with httpx.Client() as client:
+            while time.perf_counter() - started < STARTUP_TIMEOUT:
+                if server.poll() is not None:
+                    server_exited_error = f"Server exited with status {server.returncode} during startup"
+                    raise RuntimeError(server_exited_error)
+                try:
+                    if client.get(f"http://{HOST}:{port}/health/live").is_success:
+                        return time.perf_counter() - started
+                except httpx.TransportError:
+                    pass
+                time.sleep(0.01)
+    finally:
+        server.terminate()
+        server.wait()
+    startup_timeout_error = f"Server did not start within {STARTUP_TIMEOUT:.0f}s"
+    raise RuntimeError(startup_timeout_error)
+
+
+def _import_profile(env: dict[str, str], workdir: str) -> tuple[list[tuple[str, float]], set[str]]:
+    """Return top-level imports of the app by cumulative time, slowest first, and every module loaded."""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import chat_server.main"],
+        env=env,
+        cwd=workdir,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    cumulative = {}
+    loaded = set()
+    # Lines look like "import time:   self [us] |   cumulative |   module", indented by nesting depth
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative_us, module = line.removeprefix("import time:").split("|")
+        loaded.add(module.strip().split(".")[0])
+        # Direct imports of chat_server modules and their own direct imports, the level worth acting on
+        if len(module) - len(module.lstrip()) <= 3:  # noqa: PLR2004
+            cumulative[module.strip()] = int(cumulative_us) / 1_000_000
+    slowest = sorted(cumulative.items(), key=lambda item: item[1], reverse=True)
+    return slowest, loaded
+
+
+def _failures(results: dict, args: argparse.Namespace) -> list[str]:
+    failures = []
+    if results["import_seconds"] > args.import_budget:
+        failures.append(f"import took {results['import_seconds']:.2f}s, over the {args.import_budget:.2f}s budget")
+    if results["startup_seconds"] > args.startup_budget:
+        failures.append(f"startup took {results['startup_seconds']:.2f}s, over the {args.startup_budget:.2f}s budget")
+    failures.extend(f"{module} is imported eagerly" for module in results["eager_lazy_modules"])
+    return failures
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind((HOST, 0))
+        return sock.getsockname()[1]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""Measure the events and bytes a compare stream sends for 2, 5 and 13 models, with and without token coalescing.
+
+Each model's output is coalesced into frames of at most one per STREAM_FLUSH_INTERVAL before it reaches the client.
+This runs --requests compare requests for each of --model-counts models against the fake provider, in turn:
+
+- coalesced: the default flush interval and size
+- per_token: STREAM_FLUSH_INTERVAL=0 and STREAM_FLUSH_BYTES=1, so every token is sent as its own event, as before
+
+For each, it reports the SSE events and response body bytes per request and the events per second the server sent over
+the whole run. The run fails when, for any model count, coalescing does not cut the events per request by at least
+--min-reduction times.
+
+For example:
+    python benchmarks/compare_stream.py --model-counts 2 5 13 --output results/compare_stream.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+SERVER_DIR = BENCHMARKS_DIR.parent
+HOST = "127.0.0.1"
+STARTUP_TIMEOUT = 30.0
+REQUEST_TIMEOUT = 300.0
+PROMPT = "Compare your answers."
+CONFIGURATIONS = {
+    "coalesced": {},
+    "per_token": {"STREAM_FLUSH_INTERVAL": "0", "STREAM_FLUSH_BYTES": "1"},
+}
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model-counts", type=int, nargs="+", default=[2, 5, 13], help="models per comparison")
+    parser.add_argument("--requests", type=int, default=20, help="compare requests per model count")
+    parser.add_argument("--concurrency", type=int, default=2, help="compare requests at a time")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--response-tokens", type=int, default=100)
+    parser.add_argument("--min-reduction", type=float, default=2.0)
+    parser.add_argument("--output", type=Path, help="where to write the JSON results")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    results = {name: _run_configuration(args, overrides) for name, overrides in CONFIGURATIONS.items()}
+    failures = []
+    for model_count in (str(count) for count in args.model_counts):
+        coalesced, per_token = results["coalesced"][model_count], results["per_token"][model_count]
+        for name, result in (("coalesced", coalesced), ("per_token", per_token)):
+            print(
+                f"{name}: {model_count} models: {result['events_per_request']:.0f} events and "
+                f"{result['bytes_per_request'] / 1024:.1f}KiB per request, {result['events_per_second']:.0f} events/s, "
+                f"duration p50 {result['duration_p50'] * 1000:.0f}ms",
+            )
+        reduction = per_token["events_per_request"] / coalesced["events_per_request"]
+        print(f"{model_count} models: coalescing sends {reduction:.1f}x fewer events")
+        if reduction < args.min_reduction:
+            failures.append(f"{model_count} models: {reduction:.1f}x")
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(results, indent=2))
+    if failures:
+        print(f"FAIL coalescing cut events by less than {args.min_reduction:.1f}x: {', '.join(failures)}")
+        sys.exit(1)
+
+
+def _run_configuration(args: argparse.Namespace, overrides: dict[str, str]) -> dict:
+    with tempfile.TemporaryDirectory() as workdir:
+        provider_port, server_port = _free_port(), _free_port()
+        server_env = {
+            **os.environ,
+            "PYTHONPATH": os.pathsep.join(filter(None, [str(SERVER_DIR / "src"), os.environ.get("PYTHONPATH")])),
+            "DATABASE_URL": f"sqlite+aiosqlite:///{workdir}/compare_stream.db",
+            "REDIS_URL": "localhost",
+            "REDIS_PORT": "6379",
+            "REDIS_DB": "0",
+            "OPENAI_BASE_URL": f"http://{HOST}:{provider_port}/v1",
+            "ANTHROPIC_BASE_URL": f"http://{HOST}:{provider_port}",
+            "OPENAI_API_KEY": "benchmark",
+            "ANTHROPIC_API_KEY": "benchmark",
+            "LOG_LEVEL": "WARNING",
+            **overrides,
+        }
+        subprocess.run([sys.executable, "-m", "chat_server.migrate"], env=server_env, cwd=workdir, check=True)
+        provider = subprocess.Popen(
+            [
+                sys.executable,
+                str(BENCHMARKS_DIR / "fake_provider.py"),
+                f"--port={provider_port}",
+                "--ttft=0",
+                f"--tokens-per-second={args.tokens_per_second}",
+                f"--response-tokens={args.response_tokens}",
+            ],
+        )
+        server = subprocess.Popen(
+            [sys.executable, str(BENCHMARKS_DIR / "serve.py"), f"--port={server_port}"],
+            env=server_env,
+            cwd=workdir,
+        )
+        try:
+            return asyncio.run(_benchmark(args, provider, provider_port, server, server_port))
+        finally:
+            for process in (server, provider):
+                process.terminate()
+                process.wait()
+
+
+async def _benchmark(
+    args: argparse.Namespace,
+    provider: subprocess.Popen,
+    provider_port: int,
+    server: subprocess.Popen,
+    server_port: int,
+) -> dict:
+    results = {}
+    async with httpx.AsyncClient(base_url=f"http://{HOST}:{server_port}", timeout=REQUEST_TIMEOUT) as client:
+        await _wait_until_ready(client, provider, f"http://{HOST}:{provider_port}/openapi.json")
+        await _wait_until_ready(client, server, "/health/live")
+        # Every model the server accepts, from its own schema, so the largest comparison can include all of them
+        models = (await client.get("/openapi.json")).json()["components"]["schemas"]["Model"]["enum"]
+        for model_count in args.model_counts:
+            started = time.perf_counter()
+            streams = await _compare_many(client, models[:model_count], args)
+            elapsed = time.perf_counter() - started
+            events = [stream["events"] for stream in streams]
+            results[str(model_count)] = {
+                "events_per_request": statistics.mean(events),
+                "bytes_per_request": statistics.mean(stream["bytes"] for stream in streams),
+                "events_per_second": sum(events) / elapsed,
+                "duration_p50": statistics.median(stream["duration"] for stream in streams),
+            }
+    return results
+
+
+async def _compare_many(client: httpx.AsyncClient, models: list[str], args: argparse.Namespace) -> list[dict]:
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def limited() -> dict:
+        async with semaphore:
+            return await _compare(client, models)
+
+    return await asyncio.gather(*(limited() for _ in range(args.requests)))
+
+
+async def _compare(client: httpx.AsyncClient, models: list[str]) -> dict:
+    thread_id = (await client.post("/thread")).json()["id"]
+    body = bytearray()
+    started = time.perf_counter()
+    async with client.stream(
+        "POST",
+        f"/thread/{thread_id}/chat/compare",
+        json={"content": PROMPT, "models": models},
+    ) as r:
+        r.raise_for_status()
+        async for chunk in r.aiter_raw():
+            body.extend(chunk)
+    duration = time.perf_counter() - started
+    events = [line for line in body.decode("utf-8").splitlines() if line.startswith("data: ")]
+    failed = [line for line in events if json.loads(line.removeprefix("data: ")).get("status") == "error"]
+    if failed:
+        failed_error = f"Compare stream failed: {failed}"
+        raise RuntimeError(failed_error)
+    return {"events": len(events), "bytes": len(body), "duration": duration}
+
+
+async def _wait_until_ready(client: httpx.AsyncClient, process: subprocess.Popen, url: str) -> None:
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while True:
+        if process.poll() is not None:
+            exited_error = f"{process.args[1]} exited with status {process.returncode}"
+            raise RuntimeError(exited_error)
+        try:
+            if (await client.get(url)).status_code == httpx.codes.OK:
+                return
+        except httpx.TransportError:
+            if time.monotonic() > deadline:
+                raise
+        await asyncio.sleep(0.1)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind((HOST, 0))
+        return s.getsockname()[1]
+
+
+if __name__ == "__main__":
+    main()
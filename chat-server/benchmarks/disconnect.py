@@ -0,0 +1,226 @@
+"""Check that a client disconnect stops the upstream provider streams, and that reattaching in time does not.
+
+The fake provider streams slowly enough that every generation is still running when its client goes away, and reports
+how many of its streams the server closed early. Three scenarios run in turn against one server:
+
+- chat: a chat client disconnects after the first chunk; the provider stream must be closed within --max-seconds
+- compare: the same for a comparison, whose every model stream must be closed
+- reattach: a chat client disconnects, then reattaches through GET /generation/{id} before the orphan timeout; the
+  generation must run to completion with its provider stream intact
+
+The run fails when any scenario does not hold.
+
+For example:
+    python benchmarks/disconnect.py --orphan-timeout 2 --output results/disconnect.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+SERVER_DIR = BENCHMARKS_DIR.parent
+HOST = "127.0.0.1"
+STARTUP_TIMEOUT = 30.0
+REQUEST_TIMEOUT = 60.0
+POLL_INTERVAL = 0.05
+GENERATION_ID_HEADER = "X-Generation-Id"
+# Long enough that no generation finishes before its client disconnects
+RESPONSE_TOKENS = 200
+TOKENS_PER_SECOND = 20
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--models", nargs="+", default=["gpt-4o", "claude-3-5-sonnet-20241022"])
+    parser.add_argument("--orphan-timeout", type=float, default=2.0, help="the server's GENERATION_ORPHAN_TIMEOUT")
+    parser.add_argument("--heartbeat-interval", type=float, default=0.5)
+    parser.add_argument(
+        "--max-seconds",
+        type=float,
+        help="time allowed from disconnect to closed provider streams; default: the orphan timeout plus 2 heartbeats",
+    )
+    parser.add_argument("--output", type=Path, help="where to write the JSON results")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    max_seconds = args.max_seconds or args.orphan_timeout + 2 * args.heartbeat_interval
+    with tempfile.TemporaryDirectory() as workdir:
+        provider_port, server_port = _free_port(), _free_port()
+        server_env = {
+            **os.environ,
+            "PYTHONPATH": os.pathsep.join(filter(None, [str(SERVER_DIR / "src"), os.environ.get("PYTHONPATH")])),
+            "DATABASE_URL": f"sqlite+aiosqlite:///{workdir}/disconnect.db",
+            "REDIS_URL": "localhost",
+            "REDIS_PORT": "6379",
+            "REDIS_DB": "0",
+            "OPENAI_BASE_URL": f"http://{HOST}:{provider_port}/v1",
+            "ANTHROPIC_BASE_URL": f"http://{HOST}:{provider_port}",
+            "OPENAI_API_KEY": "benchmark",
+            "ANTHROPIC_API_KEY": "benchmark",
+            "LOG_LEVEL": "WARNING",
+            "GENERATION_ORPHAN_TIMEOUT": str(args.orphan_timeout),
+            "GENERATION_HEARTBEAT_INTERVAL": str(args.heartbeat_interval),
+        }
+        subprocess.run([sys.executable, "-m", "chat_server.migrate"], env=server_env, cwd=workdir, check=True)
+        provider = subprocess.Popen(
+            [
+                sys.executable,
+                str(BENCHMARKS_DIR / "fake_provider.py"),
+                f"--port={provider_port}",
+                "--ttft=0.1",
+                f"--tokens-per-second={TOKENS_PER_SECOND}",
+                f"--response-tokens={RESPONSE_TOKENS}",
+            ],
+        )
+        server = subprocess.Popen(
+            [sys.executable, str(BENCHMARKS_DIR / "serve.py"), f"--port={server_port}"],
+            env=server_env,
+            cwd=workdir,
+        )
+        try:
+            results = asyncio.run(_check(args, provider, provider_port, server, server_port))
+        finally:
+            for process in (server, provider):
+                process.terminate()
+                process.wait()
+
+    failures = []
+    for scenario in ("chat", "compare"):
+        seconds = results[scenario]["seconds_to_close"]
+        print(f"{scenario}: provider streams closed {seconds:.2f}s after the client disconnected")
+        if seconds > max_seconds:
+            failures.append(f"{scenario}: provider streams still open after {max_seconds:.2f}s")
+    reattach = results["reattach"]
+    print(f"reattach: complete response {reattach['complete']}, provider streams closed early {reattach['abandoned']}")
+    if not reattach["complete"] or reattach["abandoned"]:
+        failures.append("reattach: the generation did not survive a reattach within the orphan timeout")
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(results, indent=2))
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if failures:
+        sys.exit(1)
+
+
+async def _check(
+    args: argparse.Namespace,
+    provider: subprocess.Popen,
+    provider_port: int,
+    server: subprocess.Popen,
+    server_port: int,
+) -> dict:
+    provider_url = f"http://{HOST}:{provider_port}"
+    async with httpx.AsyncClient(base_url=f"http://{HOST}:{server_port}", timeout=REQUEST_TIMEOUT) as client:
+        await _wait_until_ready(client, provider, f"{provider_url}/openapi.json")
+        await _wait_until_ready(client, server, "/health/live")
+        thread_id = (await client.post("/thread")).json()["id"]
+        chat_request = {"content": "Tell me a long story", "model": args.models[0]}
+        compare_request = {"content": "Tell me a long story", "models": args.models}
+        return {
+            "chat": await _disconnect(client, provider_url, f"/thread/{thread_id}/chat", chat_request, 1),
+            "compare": await _disconnect(
+                client,
+                provider_url,
+                f"/thread/{thread_id}/chat/compare",
+                compare_request,
+                len(args.models),
+            ),
+            "reattach": await _reattach(client, provider_url, thread_id, chat_request, args.orphan_timeout / 2),
+        }
+
+
+async def _disconnect(
+    client: httpx.AsyncClient,
+    provider_url: str,
+    path: str,
+    request: dict,
+    provider_streams: int,
+) -> dict:
+    before = await _stats(client, provider_url)
+    async with client.stream("POST", path, json=request) as response:
+        response.raise_for_status()
+        await anext(response.aiter_text())
+        # Every provider stream is open before the client goes away
+        await _wait_for_open_streams(client, provider_url, before["open_streams"] + provider_streams)
+    # Leaving the block closes the connection mid-response
+    disconnected_at = time.perf_counter()
+    stats = await _wait_for_open_streams(client, provider_url, before["open_streams"])
+    return {
+        "seconds_to_close": time.perf_counter() - disconnected_at,
+        "abandoned": stats["abandoned_streams"] - before["abandoned_streams"],
+    }
+
+
+async def _reattach(
+    client: httpx.AsyncClient,
+    provider_url: str,
+    thread_id: str,
+    request: dict,
+    away_seconds: float,
+) -> dict:
+    before = await _stats(client, provider_url)
+    async with client.stream("POST", f"/thread/{thread_id}/chat", json=request) as response:
+        response.raise_for_status()
+        generation_id = response.headers[GENERATION_ID_HEADER]
+        await anext(response.aiter_text())
+    await asyncio.sleep(away_seconds)
+    content = ""
+    async with client.stream("GET", f"/generation/{generation_id}") as response:
+        async for line in response.aiter_lines():
+            if line.startswith("data: "):
+                content += json.loads(line.removeprefix("data: ")).get("content", "")
+    stats = await _stats(client, provider_url)
+    return {
+        "complete": f"token{RESPONSE_TOKENS - 1} " in content,
+        "abandoned": stats["abandoned_streams"] - before["abandoned_streams"],
+    }
+
+
+async def _wait_for_open_streams(client: httpx.AsyncClient, provider_url: str, open_streams: int) -> dict:
+    while True:
+        stats = await _stats(client, provider_url)
+        if stats["open_streams"] == open_streams:
+            return stats
+        await asyncio.sleep(POLL_INTERVAL)
+
+
+async def _stats(client: httpx.AsyncClient, provider_url: str) -> dict:
+    return (await client.get(f"{provider_url}/stats")).json()
+
+
+async def _wait_until_ready(client: httpx.AsyncClient, process: subprocess.Popen, url: str) -> None:
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while True:
+        if process.poll() is not None:
+            exited_error = f"{process.args[1]} exited with status {process.returncode}"
+            raise RuntimeError(exited_error)
+        try:
+            if (await client.get(url)).status_code == httpx.codes.OK:
+                return
+        except httpx.TransportError:
+            if time.monotonic() > deadline:
+                raise
+        await asyncio.sleep(0.1)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind((HOST, 0))
+        return s.getsockname()[1]
+
+
+if __name__ == "__main__":
+    main()
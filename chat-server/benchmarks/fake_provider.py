@@ -0,0 +1,333 @@
+"""A local stand-in for the OpenAI and Anthropic streaming APIs, for benchmarking without provider calls.
+
+Both SDKs are pointed at it through OPENAI_BASE_URL and ANTHROPIC_BASE_URL. Every response streams ``response_tokens``
+tokens after ``ttft`` seconds at ``tokens_per_second``, and a fraction ``error_rate`` of requests fail with a 503
+before streaming, which the server treats as retryable. With ``max_concurrent_streams`` set, each API also rate limits
+like a provider's concurrency limit: requests beyond that many open streams get a 429 with a Retry-After header.
+Embeddings are hashed bags of words, so texts sharing words are similar.
+
+Prompt token counts are estimated at four characters per token, and prompt caching is simulated on whole messages:
+OpenAI prompts reuse the longest prefix seen before, while Anthropic prompts reuse and write only the prefixes ending at
+their cache breakpoints, so the reported cache reads and writes show where a client places its breakpoints.
+
+With --ssl-certfile and --ssl-keyfile it serves HTTPS, so clients pay for TLS handshakes as with a real provider.
+
+GET /stats reports how many streams were opened in all, how many are open, how many were closed by the client before
+they finished and how many requests were rate limited.
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import random
+import re
+import time
+import uuid
+import zlib
+from collections import defaultdict
+from collections.abc import AsyncGenerator, Iterator
+from dataclasses import dataclass, field
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+DEFAULT_EMBEDDING_DIMENSIONS = 1536
+# Shorter prompt prefixes are never cached, as with the providers' own minimum
+MIN_CACHEABLE_TOKENS = 1024
+
+
+@dataclass(frozen=True)
+class FakeProviderConfig:
+    ttft: float = 0.3
+    tokens_per_second: float = 50.0
+    response_tokens: int = 100
+    error_rate: float = 0.0
+    # Open streams allowed per API, like a provider's concurrency limit; unlimited when None
+    max_concurrent_streams: int | None = None
+
+
+@dataclass
+class FakeProviderStats:
+    total_streams: int = 0
+    open_streams: int = 0
+    abandoned_streams: int = 0
+    rate_limited_requests: int = 0
+    open_streams_by_api: defaultdict[str, int] = field(default_factory=lambda: defaultdict(int))
+
+    def rate_limited(self, config: FakeProviderConfig, api: str) -> bool:
+        if config.max_concurrent_streams is None or self.open_streams_by_api[api] < config.max_concurrent_streams:
+            return False
+        self.rate_limited_requests += 1
+        return True
+
+    async def track(self, events: AsyncGenerator[str, None], api: str) -> AsyncGenerator[str, None]:
+        self.total_streams += 1
+        self.open_streams += 1
+        self.open_streams_by_api[api] += 1
+        finished = False
+        try:
+            async for event in events:
+                yield event
+            finished = True
+        finally:
+            # Runs when the client closes the connection too, which cancels the response mid-stream
+            self.open_streams -= 1
+            self.open_streams_by_api[api] -= 1
+            if not finished:
+                self.abandoned_streams += 1
+
+
+class FakePromptCache:
+    """Prompt prefixes cached so far, each identified by a hash of the model and the messages up to its end."""
+
+    def __init__(self) -> None:
+        self._prefixes: set[bytes] = set()
+
+    def read_openai(self, model: str, messages: list[dict]) -> int:
+        """Cache every prefix of the prompt, and return how many of its tokens were cached before."""
+        cached = 0
+        for digest, tokens in _prefixes(model, messages):
+            if digest in self._prefixes:
+                cached = tokens
+            elif tokens >= MIN_CACHEABLE_TOKENS:
+                self._prefixes.add(digest)
+        return cached
+
+    def read_anthropic(self, model: str, messages: list[dict]) -> tuple[int, int]:
+        """Cache the prefixes ending at breakpoints, and return the prompt's cache read and cache write tokens."""
+        read = written = 0
+        for message, (digest, tokens) in zip(messages, _prefixes(model, messages), strict=True):
+            if not _has_cache_breakpoint(message):
+                continue
+            if digest in self._prefixes:
+                read = tokens
+            elif tokens >= MIN_CACHEABLE_TOKENS:
+                self._prefixes.add(digest)
+                written = tokens
+        return read, max(0, written - read)
+
+
+def create_fake_provider(config: FakeProviderConfig) -> FastAPI:
+    app = FastAPI()
+    prompt_cache = FakePromptCache()
+    stats = FakeProviderStats()
+
+    @app.post("/v1/chat/completions", response_model=None)
+    async def openai_chat_completions(request: Request) -> StreamingResponse | JSONResponse:
+        body = await request.json()
+        if stats.rate_limited(config, "openai"):
+            return _rate_limit_error({"error": {"message": "Fake rate limit reached", "type": "requests"}})
+        if _should_fail(config):
+            return _overloaded_error({"error": {"message": "Fake provider overloaded", "type": "server_error"}})
+        include_usage = body.get("stream_options", {}).get("include_usage", False)
+        cached_tokens = prompt_cache.read_openai(body["model"], body["messages"])
+        events = _openai_events(config, body["model"], _prompt_tokens(body), cached_tokens, include_usage=include_usage)
+        return StreamingResponse(stats.track(events, "openai"), media_type="text/event-stream")
+
+    @app.post("/v1/messages", response_model=None)
+    async def anthropic_messages(request: Request) -> StreamingResponse | JSONResponse:
+        body = await request.json()
+        if stats.rate_limited(config, "anthropic"):
+            return _rate_limit_error({"type": "error", "error": {"type": "rate_limit_error", "message": "Fake limit"}})
+        if _should_fail(config):
+            return _overloaded_error({"type": "error", "error": {"type": "api_error", "message": "Fake overloaded"}})
+        cache_read_tokens, cache_write_tokens = prompt_cache.read_anthropic(body["model"], body["messages"])
+        usage = {
+            "input_tokens": _prompt_tokens(body) - cache_read_tokens - cache_write_tokens,
+            "cache_read_input_tokens": cache_read_tokens,
+            "cache_creation_input_tokens": cache_write_tokens,
+            "output_tokens": 0,
+        }
+        events = _anthropic_events(config, body["model"], usage)
+        return StreamingResponse(stats.track(events, "anthropic"), media_type="text/event-stream")
+
+    @app.get("/stats")
+    async def get_stats() -> FakeProviderStats:
+        return stats
+
+    @app.post("/v1/embeddings")
+    async def openai_embeddings(request: Request) -> JSONResponse:
+        body = await request.json()
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        vectors = [_embedding(text, body.get("dimensions", DEFAULT_EMBEDDING_DIMENSIONS)) for text in inputs]
+        if body.get("encoding_format") == "base64":
+            embeddings = [base64.b64encode(vector.tobytes()).decode("ascii") for vector in vectors]
+        else:
+            embeddings = [vector.tolist() for vector in vectors]
+        return JSONResponse(
+            {
+                "object": "list",
+                "data": [
+                    {"object": "embedding", "index": index, "embedding": embedding}
+                    for index, embedding in enumerate(embeddings)
+                ],
+                "model": body["model"],
+                "usage": {"prompt_tokens": 0, "total_tokens": 0},
+            },
+        )
+
+    return app
+
+
+def _embedding(text: str, dimensions: int) -> np.ndarray:
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for word in re.findall(r"\w+", text.lower()):
+        vector[zlib.crc32(word.encode("utf-8")) % dimensions] += 1
+    return vector
+
+
+def _prompt_tokens(body: dict) -> int:
+    return sum(_message_tokens(message) for message in body["messages"])
+
+
+def _message_tokens(message: dict) -> int:
+    return len(_message_text(message)) // 4 + 4
+
+
+def _message_text(message: dict) -> str:
+    content = message["content"]
+    return content if isinstance(content, str) else "".join(block.get("text", "") for block in content)
+
+
+def _has_cache_breakpoint(message: dict) -> bool:
+    return not isinstance(message["content"], str) and "cache_control" in message["content"][-1]
+
+
+def _prefixes(model: str, messages: list[dict]) -> Iterator[tuple[bytes, int]]:
+    """Yield the hash and token count of each prefix of ``messages``, ignoring cache breakpoints."""
+    running_hash = hashlib.sha256(model.encode())
+    tokens = 0
+    for message in messages:
+        running_hash.update(json.dumps([message["role"], _message_text(message)]).encode())
+        tokens += _message_tokens(message)
+        yield running_hash.copy().digest(), tokens
+
+
+def _should_fail(config: FakeProviderConfig) -> bool:
+    return random.random() < config.error_rate
+
+
+def _overloaded_error(content: dict) -> JSONResponse:
+    return JSONResponse(status_code=503, content=content)
+
+
+def _rate_limit_error(content: dict) -> JSONResponse:
+    return JSONResponse(status_code=429, content=content, headers={"Retry-After": "1"})
+
+
+async def _tokens(config: FakeProviderConfig) -> AsyncGenerator[str, None]:
+    await asyncio.sleep(config.ttft)
+    for i in range(config.response_tokens):
+        if i:
+            await asyncio.sleep(1 / config.tokens_per_second)
+        yield f"token{i} "
+
+
+async def _openai_events(
+    config: FakeProviderConfig,
+    model: str,
+    prompt_tokens: int,
+    cached_tokens: int,
+    *,
+    include_usage: bool,
+) -> AsyncGenerator[str, None]:
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+
+    def chunk(choices: list[dict], **extra: dict) -> str:
+        payload = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": choices,
+            **extra,
+        }
+        return f"data: {json.dumps(payload)}\n\n"
+
+    def choice(delta: dict, finish_reason: str | None = None) -> list[dict]:
+        return [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+
+    yield chunk(choice({"role": "assistant", "content": ""}))
+    async for token in _tokens(config):
+        yield chunk(choice({"content": token}))
+    yield chunk(choice({}, "stop"))
+    if include_usage:
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": config.response_tokens,
+            "total_tokens": prompt_tokens + config.response_tokens,
+            "prompt_tokens_details": {"cached_tokens": cached_tokens},
+        }
+        yield chunk([], usage=usage)
+    yield "data: [DONE]\n\n"
+
+
+async def _anthropic_events(config: FakeProviderConfig, model: str, usage: dict) -> AsyncGenerator[str, None]:
+    def event(name: str, payload: dict) -> str:
+        return f"event: {name}\ndata: {json.dumps({'type': name, **payload})}\n\n"
+
+    yield event(
+        "message_start",
+        {
+            "message": {
+                "id": f"msg_{uuid.uuid4().hex}",
+                "type": "message",
+                "role": "assistant",
+                "content": [],
+                "model": model,
+                "stop_reason": None,
+                "stop_sequence": None,
+                "usage": usage,
+            },
+        },
+    )
+    yield event("content_block_start", {"index": 0, "content_block": {"type": "text", "text": ""}})
+    async for token in _tokens(config):
+        yield event("content_block_delta", {"index": 0, "delta": {"type": "text_delta", "text": token}})
+    yield event("content_block_stop", {"index": 0})
+    yield event(
+        "message_delta",
+        {
+            "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+            "usage": {"output_tokens": config.response_tokens},
+        },
+    )
+    yield event("message_stop", {})
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--ttft", type=float, default=FakeProviderConfig.ttft)
+    parser.add_argument("--tokens-per-second", type=float, default=FakeProviderConfig.tokens_per_second)
+    parser.add_argument("--response-tokens", type=int, default=FakeProviderConfig.response_tokens)
+    parser.add_argument("--error-rate", type=float, default=FakeProviderConfig.error_rate)
+    parser.add_argument("--max-concurrent-streams", type=int, help="open streams per API before answering 429")
+    parser.add_argument("--ssl-certfile")
+    parser.add_argument("--ssl-keyfile")
+    args = parser.parse_args()
+    config = FakeProviderConfig(
+        ttft=args.ttft,
+        tokens_per_second=args.tokens_per_second,
+        response_tokens=args.response_tokens,
+        error_rate=args.error_rate,
+        max_concurrent_streams=args.max_concurrent_streams,
+    )
+    uvicorn.run(
+        create_fake_provider(config),
+        host=args.host,
+        port=args.port,
+        log_level="warning",
+        ssl_certfile=args.ssl_certfile,
+        ssl_keyfile=args.ssl_keyfile,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""Check that long threads hit the providers' prompt caches, against the fake provider's prompt cache simulation.
+
+One thread per model is grown turn by turn with long prompts until its history no longer fits the model's context
+window, and the cached input tokens of each turn are read from the server's usage report. Every turn after the first
+should read the previous turn's prompt from the cache, except when the history window moves forward. This is compared
+against trimming the history one message at a time (CONTEXT_TRIM_STEP=0) and against sending no cache breakpoints
+(PROMPT_CACHING_ENABLED=false).
+
+The run fails when, with the default settings, the share of turns after the first that hit the cache is below
+--min-hit-rate for any model.
+
+For example:
+    python benchmarks/prompt_cache.py --turns 100 --output results/prompt_cache.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import string
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+SERVER_DIR = BENCHMARKS_DIR.parent
+HOST = "127.0.0.1"
+STARTUP_TIMEOUT = 30.0
+REQUEST_TIMEOUT = 300.0
+COUNTERS = ("input_tokens", "cached_input_tokens")
+CONFIGURATIONS = {
+    "default": {},
+    "per_message_trimming": {"CONTEXT_TRIM_STEP": "0"},
+    "no_breakpoints": {"PROMPT_CACHING_ENABLED": "false"},
+}
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--models", nargs="+", default=["gpt-4o", "claude-3-5-sonnet-20241022"])
+    parser.add_argument("--turns", type=int, default=100)
+    parser.add_argument("--prompt-chars", type=int, default=10_000, help="long enough to outgrow the context window")
+    parser.add_argument("--min-hit-rate", type=float, default=0.75)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="where to write the JSON results")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    results = {name: _run_configuration(args, overrides) for name, overrides in CONFIGURATIONS.items()}
+    failures = []
+    for name, models in results.items():
+        for model, result in models.items():
+            print(
+                f"{name}: {model}: {result['hit_rate']:.0%} of turns hit the cache, "
+                f"{result['cached_share']:.0%} of input tokens cached, "
+                f"{result['cache_write_input_tokens']} tokens written to the cache, ${result['cost_usd']:.2f}",
+            )
+            if name == "default" and result["hit_rate"] < args.min_hit_rate:
+                failures.append(f"{model}: hit rate {result['hit_rate']:.0%} below {args.min_hit_rate:.0%}")
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(results, indent=2))
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if failures:
+        sys.exit(1)
+
+
+def _run_configuration(args: argparse.Namespace, overrides: dict[str, str]) -> dict:
+    with tempfile.TemporaryDirectory() as workdir:
+        provider_port, server_port = _free_port(), _free_port()
+        server_env = {
+            **os.environ,
+            "PYTHONPATH": os.pathsep.join(filter(None, [str(SERVER_DIR / "src"), os.environ.get("PYTHONPATH")])),
+            "DATABASE_URL": f"sqlite+aiosqlite:///{workdir}/prompt_cache.db",
+            "REDIS_URL": "localhost",
+            "REDIS_PORT": "6379",
+            "REDIS_DB": "0",
+            "OPENAI_BASE_URL": f"http://{HOST}:{provider_port}/v1",
+            "ANTHROPIC_BASE_URL": f"http://{HOST}:{provider_port}",
+            "OPENAI_API_KEY": "benchmark",
+            "ANTHROPIC_API_KEY": "benchmark",
+            "LOG_LEVEL": "WARNING",
+            **overrides,
+        }
+        subprocess.run([sys.executable, "-m", "chat_server.migrate"], env=server_env, cwd=workdir, check=True)
+        provider = subprocess.Popen(
+            [
+                sys.executable,
+                str(BENCHMARKS_DIR / "fake_provider.py"),
+                f"--port={provider_port}",
+                "--ttft=0",
+                "--tokens-per-second=10000",
+                "--response-tokens=50",
+            ],
+        )
+        server = subprocess.Popen(
+            [sys.executable, str(BENCHMARKS_DIR / "serve.py"), f"--port={server_port}"],
+            env=server_env,
+            cwd=workdir,
+        )
+        try:
+            return asyncio.run(_grow_threads(args, provider, provider_port, server, server_port))
+        finally:
+            for process in (server, provider):
+                process.terminate()
+                process.wait()
+
+
+async def _grow_threads(
+    args: argparse.Namespace,
+    provider: subprocess.Popen,
+    provider_port: int,
+    server: subprocess.Popen,
+    server_port: int,
+) -> dict:
+    rng = random.Random(args.seed)
+    results = {}
+    async with httpx.AsyncClient(base_url=f"http://{HOST}:{server_port}", timeout=REQUEST_TIMEOUT) as client:
+        await _wait_until_ready(client, provider, f"http://{HOST}:{provider_port}/openapi.json")
+        await _wait_until_ready(client, server, "/health/live")
+        for model in args.models:
+            thread_id = (await client.post("/thread")).json()["id"]
+            turns = []
+            before = dict.fromkeys(COUNTERS, 0)
+            for _ in range(args.turns):
+                prompt = "".join(rng.choices(string.ascii_lowercase + " ", k=args.prompt_chars))
+                response = await client.post(f"/thread/{thread_id}/chat", json={"content": prompt, "model": model})
+                response.raise_for_status()
+                after = (await client.get(f"/thread/{thread_id}/usage")).json()["total"]
+                turns.append({counter: after[counter] - before[counter] for counter in COUNTERS})
+                before = after
+            results[model] = _summarize(turns, before)
+        metrics = (await client.get("/metrics")).text
+    for model, result in results.items():
+        result["cache_write_input_tokens"] = _cache_write_tokens(metrics, model)
+    return results
+
+
+def _summarize(turns: list[dict[str, int]], total: dict) -> dict:
+    hits = sum(1 for turn in turns[1:] if turn["cached_input_tokens"] > 0)
+    return {
+        "turns": turns,
+        "hit_rate": hits / max(1, len(turns) - 1),
+        "cached_share": total["cached_input_tokens"] / max(1, total["input_tokens"]),
+        "cost_usd": total["cost_usd"],
+    }
+
+
+def _cache_write_tokens(metrics: str, model: str) -> int:
+    sample = f'llm_tokens_total{{kind="cache_write_input",model="{model}"}} '
+    return next((int(float(line.removeprefix(sample))) for line in metrics.splitlines() if line.startswith(sample)), 0)
+
+
+async def _wait_until_ready(client: httpx.AsyncClient, process: subprocess.Popen, url: str) -> None:
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while True:
+        if process.poll() is not None:
+            exited_error = f"{process.args[1]} exited with status {process.returncode}"
+            raise RuntimeError(exited_error)
+        try:
+            if (await client.get(url)).status_code == httpx.codes.OK:
+                return
+        except httpx.TransportError:
+            if time.monotonic() > deadline:
+                raise
+        await asyncio.sleep(0.1)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind((HOST, 0))
+        return s.getsockname()[1]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""Compare time to first token with a provider client per request against the shared provider clients.
+
+Before the shared clients, every chat turn constructed its own AsyncOpenAI or AsyncAnthropic, and so paid for a new
+HTTP client, connection and TLS handshake; compare mode paid it once per model. This drives the provider SDKs directly
+against the fake provider, in turn:
+
+- per_request: a new SDK client for every stream, closed when the stream ends, as before
+- shared: the clients of ``chat_server.llm.clients.provider_clients``, as now
+
+The fake provider answers with no delay and serves TLS with a throwaway self-signed certificate, so the difference in
+time to first token is the client and connection setup. Streams run --concurrency at a time.
+
+For example:
+    python benchmarks/provider_clients.py --requests 200 --output results/provider_clients.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections.abc import Awaitable, Callable
+from pathlib import Path
+
+import httpx
+from anthropic import AsyncAnthropic
+from openai import AsyncOpenAI
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+SERVER_DIR = BENCHMARKS_DIR.parent
+HOST = "127.0.0.1"
+STARTUP_TIMEOUT = 30.0
+PROVIDERS = ("openai", "anthropic")
+MESSAGES = [{"role": "user", "content": "benchmark"}]
+# As chat_server.llm.clients sets for the shared clients
+LLM_TIMEOUT = httpx.Timeout(60, connect=5)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="streams per provider and mode")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=1,
+        help="streams at a time; beyond a few, this process and the fake provider are CPU bound",
+    )
+    parser.add_argument("--output", type=Path, help="where to write the JSON results")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as workdir:
+        certfile, keyfile = _self_signed_certificate(Path(workdir))
+        provider_port = _free_port()
+        provider_url = f"https://{HOST}:{provider_port}"
+        # Read by the SDKs' httpx clients, including the shared ones, when they are created
+        os.environ.update(
+            {
+                "SSL_CERT_FILE": str(certfile),
+                "OPENAI_BASE_URL": f"{provider_url}/v1",
+                "ANTHROPIC_BASE_URL": provider_url,
+                "OPENAI_API_KEY": "benchmark",
+                "ANTHROPIC_API_KEY": "benchmark",
+            },
+        )
+        sys.path.insert(0, str(SERVER_DIR / "src"))
+        provider = subprocess.Popen(
+            [
+                sys.executable,
+                str(BENCHMARKS_DIR / "fake_provider.py"),
+                f"--port={provider_port}",
+                "--ttft=0",
+                "--response-tokens=10",
+                "--tokens-per-second=10000",
+                f"--ssl-certfile={certfile}",
+                f"--ssl-keyfile={keyfile}",
+            ],
+        )
+        try:
+            results = asyncio.run(_benchmark(args, provider, provider_url, certfile))
+        finally:
+            provider.terminate()
+            provider.wait()
+
+    for provider_name, modes in results.items():
+        per_request, shared = modes["per_request"]["ttft"], modes["shared"]["ttft"]
+        for mode, result in modes.items():
+            print(f"{provider_name}: {mode}: ttft {_format(result['ttft'])} (p50/p95/p99)")
+        print(
+            f"{provider_name}: shared clients p50 ttft {shared['p50'] / per_request['p50']:.0%} of per-request clients"
+        )
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(results, indent=2))
+
+
+async def _benchmark(args: argparse.Namespace, provider: subprocess.Popen, provider_url: str, certfile: Path) -> dict:
+    from chat_server.llm.clients import provider_clients
+
+    async with httpx.AsyncClient(verify=str(certfile)) as client:
+        await _wait_until_ready(client, provider, f"{provider_url}/openapi.json")
+
+    streams = {
+        "openai": {
+            "per_request": _per_request_openai,
+            "shared": lambda started: _openai_stream(provider_clients.get_openai(), started),
+        },
+        "anthropic": {
+            "per_request": _per_request_anthropic,
+            "shared": lambda started: _anthropic_stream(provider_clients.get_anthropic(), started),
+        },
+    }
+    results = {}
+    try:
+        for provider_name in PROVIDERS:
+            results[provider_name] = {}
+            for mode, stream in streams[provider_name].items():
+                # One untimed stream first, so module imports and the shared client's creation are not counted
+                await stream(time.perf_counter())
+                results[provider_name][mode] = {"ttft": _percentiles(await _time_streams(stream, args))}
+    finally:
+        await provider_clients.aclose()
+    return results
+
+
+# Streams are read to the end, since closing one early closes its connection rather than returning it to the pool
+async def _openai_stream(client: AsyncOpenAI, started: float) -> float:
+    ttft = None
+    stream = await client.chat.completions.create(model="gpt-4o", messages=MESSAGES, stream=True)
+    async with stream:
+        async for chunk in stream:
+            if ttft is None and chunk.choices and chunk.choices[0].delta.content:
+                ttft = time.perf_counter() - started
+    return ttft
+
+
+async def _anthropic_stream(client: AsyncAnthropic, started: float) -> float:
+    ttft = None
+    async with client.messages.stream(model="claude-3-5-sonnet-20241022", messages=MESSAGES, max_tokens=10) as stream:
+        async for _ in stream.text_stream:
+            if ttft is None:
+                ttft = time.perf_counter() - started
+    return ttft
+
+
+async def _per_request_openai(started: float) -> float:
+    async with AsyncOpenAI(timeout=LLM_TIMEOUT, max_retries=0) as client:
+        return await _openai_stream(client, started)
+
+
+async def _per_request_anthropic(started: float) -> float:
+    async with AsyncAnthropic(timeout=LLM_TIMEOUT, max_retries=0) as client:
+        return await _anthropic_stream(client, started)
+
+
+async def _time_streams(stream: Callable[[float], Awaitable[float]], args: argparse.Namespace) -> list[float]:
+    semaphore = asyncio.Semaphore(args.concurrency)
+    seconds = []
+
+    async def timed() -> None:
+        async with semaphore:
+            seconds.append(await stream(time.perf_counter()))
+
+    await asyncio.gather(*(timed() for _ in range(args.requests)))
+    return seconds
+
+
+def _percentiles(values: list[float]) -> dict[str, float]:
+    ordered = sorted(values)
+
+    def at(percentile: float) -> float:
+        return ordered[min(len(ordered) - 1, int(percentile * len(ordered)))]
+
+    return {"p50": at(0.5), "p95": at(0.95), "p99": at(0.99), "max": ordered[-1]}
+
+
+def _format(percentiles: dict[str, float]) -> str:
+    return "/".join(f"{percentiles[p] * 1000:.1f}ms" for p in ("p50", "p95", "p99"))
+
+
+def _self_signed_certificate(directory: Path) -> tuple[Path, Path]:
+    certfile, keyfile = directory / "cert.pem", directory / "key.pem"
+    subprocess.run(
+        [
+            "openssl",
+            "req",
+            "-x509",
+            "-newkey",
+            "rsa:2048",
+            "-nodes",
+            "-days",
+            "1",
+            "-subj",
+            f"/CN={HOST}",
+            "-addext",
+            f"subjectAltName=IP:{HOST}",
+            "-keyout",
+            str(keyfile),
+            "-out",
+            str(certfile),
+        ],
+        capture_output=True,
+        check=True,
+    )
+    return certfile, keyfile
+
+
+async def _wait_until_ready(client: httpx.AsyncClient, process: subprocess.Popen, url: str) -> None:
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while True:
+        if process.poll() is not None:
+            exited_error = f"{process.args[1]} exited with status {process.returncode}"
+            raise RuntimeError(exited_error)
+        try:
+            if (await client.get(url)).status_code == httpx.codes.OK:
+                return
+        except httpx.TransportError:
+            if time.monotonic() > deadline:
+                raise
+        await asyncio.sleep(0.1)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind((HOST, 0))
+        return s.getsockname()[1]
+
+
+if __name__ == "__main__":
+    main()
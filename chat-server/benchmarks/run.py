@@ -0,0 +1,510 @@
+"""Load-test the chat server against a fake streaming provider and record latency, throughput and memory as JSON.
+
+The fake provider, the chat server and this load driver run as separate processes, so the driver's own CPU use does
+not skew the server's numbers. The server uses SQLite (or --database-url) and an in-process fakeredis. Server
+settings are passed with --env, e.g. ``--env LOG_LEVEL=CRITICAL`` to compare against a run with logging enabled, or
+``--env WRITE_BEHIND_ENABLED=true``.
+
+For example:
+    python benchmarks/run.py --scenario chat --concurrency 50 --requests 1000 --output results/chat.json
+    python benchmarks/run.py --scenario compare --baseline results/compare.json
+
+With --baseline, the run exits non-zero when a p95 latency or the throughput regressed by more than --max-regression;
+--check limits the comparison to some of them. --db-latency delays every database statement on the server, so a run
+against a baseline without it shows whether slow queries hold up token streams:
+    python benchmarks/run.py --output results/chat.json
+    python benchmarks/run.py --db-latency 0.05 --baseline results/chat.json --check inter_chunk
+
+The server's database commits per second are reported too, so the write-behind persister is compared against a commit
+per turn with the runs below, given a Postgres --database-url; at this concurrency, SQLite fails requests when locked:
+    python benchmarks/run.py --concurrency 50 --requests 2000 --output results/commits.json
+    python benchmarks/run.py --concurrency 50 --requests 2000 --env WRITE_BEHIND_ENABLED=true
+
+--provider-max-streams makes the fake provider answer 429 beyond that many open streams per API, as a provider's
+concurrency limit does. In the first run below, the scheduler's per-model cap of 16 is above that limit, and requests
+fail once their retries also hit a 429; in the second the cap is at the limit, so requests queue in the server instead
+and the provider reports no rate-limited requests. Runs this concurrent need --database-url, as SQLite locks up:
+    python benchmarks/run.py --concurrency 50 --provider-max-streams 10
+    python benchmarks/run.py --concurrency 50 --provider-max-streams 10 --env MODEL_MAX_CONCURRENT_STREAMS=10
+
+--compare-logging runs the same load twice, once logging at INFO as JSON and once with LOG_LEVEL=CRITICAL, and
+reports the requests per second of both and what logging costs. The server's output is discarded in these runs, so
+the cost measured is that of formatting and writing the logs rather than of a terminal displaying them:
+    python benchmarks/run.py --compare-logging --output results/logging.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+from prometheus_client.parser import text_string_to_metric_families
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+SERVER_DIR = BENCHMARKS_DIR.parent
+HOST = "127.0.0.1"
+STARTUP_TIMEOUT = 30.0
+REQUEST_TIMEOUT = 300.0
+# Lower-is-better metrics checked against a baseline; throughput is checked separately
+REGRESSION_CHECKS = (("ttft", "p95"), ("inter_chunk", "p95"), ("duration", "p95"))
+THROUGHPUT_CHECK = "throughput"
+LOGGING_CONFIGURATIONS = {
+    "logging": {"LOG_LEVEL": "INFO", "LOG_FORMAT": "json"},
+    "no_logging": {"LOG_LEVEL": "CRITICAL"},
+}
+
+
+@dataclass
+class Sample:
+    kind: str
+    ok: bool
+    status: int | None = None
+    ttft: float | None = None
+    duration: float | None = None
+    gaps: list[float] = field(default_factory=list)
+
+
+class RequestBudget:
+    def __init__(self, total: int) -> None:
+        self.remaining = total
+
+    def take(self) -> bool:
+        if self.remaining <= 0:
+            return False
+        self.remaining -= 1
+        return True
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=["chat", "compare"], default="chat")
+    parser.add_argument("--concurrency", type=int, default=20, help="concurrent virtual users")
+    parser.add_argument("--requests", type=int, default=200, help="total chat or compare requests")
+    parser.add_argument("--turns", type=int, default=5, help="requests per thread before a user starts a new one")
+    parser.add_argument(
+        "--models",
+        nargs="+",
+        default=["gpt-4o", "claude-3-5-sonnet-20241022"],
+        help="chat requests rotate through these; compare requests use all of them",
+    )
+    parser.add_argument("--prompt-chars", type=int, default=200)
+    parser.add_argument("--ttft", type=float, default=0.3, help="fake provider time to first token, in seconds")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--response-tokens", type=int, default=100)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of provider requests failing with 503")
+    parser.add_argument(
+        "--provider-max-streams",
+        type=int,
+        help="open streams the fake provider allows per API before answering 429",
+    )
+    parser.add_argument("--database-url", help="defaults to a fresh SQLite database in a temporary directory")
+    parser.add_argument("--db-latency", type=float, default=0.0, help="seconds added to every database statement")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="server environment override")
+    parser.add_argument("--output", type=Path, help="where to write the JSON results")
+    parser.add_argument("--baseline", type=Path, help="JSON results of an earlier run to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.1)
+    parser.add_argument(
+        "--check",
+        action="append",
+        choices=[metric for metric, _ in REGRESSION_CHECKS] + [THROUGHPUT_CHECK],
+        help="metrics compared against the baseline, all of them by default",
+    )
+    parser.add_argument(
+        "--compare-logging",
+        action="store_true",
+        help="run twice, with and without logging, and report the throughput of both",
+    )
+    args = parser.parse_args()
+    if args.compare_logging and args.baseline:
+        parser.error("--compare-logging cannot be combined with --baseline")
+    return args
+
+
+def main() -> None:
+    args = parse_args()
+    overrides = dict(pair.split("=", 1) for pair in args.env)
+    if args.compare_logging:
+        _compare_logging(args, overrides)
+        return
+    results = _run(args, overrides)
+    _print_summary(results)
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(results, indent=2, default=str))
+    checks = set(args.check or [metric for metric, _ in REGRESSION_CHECKS] + [THROUGHPUT_CHECK])
+    if args.baseline and _regressions(json.loads(args.baseline.read_text()), results, args.max_regression, checks):
+        sys.exit(1)
+
+
+def _compare_logging(args: argparse.Namespace, overrides: dict[str, str]) -> None:
+    runs = {}
+    for name, logging_overrides in LOGGING_CONFIGURATIONS.items():
+        print(f"{name}: {logging_overrides}")
+        runs[name] = _run(args, {**overrides, **logging_overrides}, server_output=subprocess.DEVNULL)
+        _print_summary(runs[name])
+    for kind, result in runs["logging"]["results"].items():
+        with_logging = result["throughput_rps"]
+        without_logging = runs["no_logging"]["results"].get(kind, {}).get("throughput_rps")
+        if not without_logging:
+            continue
+        difference = without_logging - with_logging
+        print(
+            f"{kind}: {with_logging:.2f} requests/s with logging, {without_logging:.2f} without; "
+            f"logging costs {difference:.2f} requests/s ({difference / without_logging:.1%})",
+        )
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(runs, indent=2, default=str))
+
+
+def _run(args: argparse.Namespace, overrides: dict[str, str], server_output: int | None = None) -> dict:
+    """Run the load against a fresh provider and server, with ``overrides`` in the server's environment."""
+    with tempfile.TemporaryDirectory() as workdir:
+        database_url = args.database_url or f"sqlite+aiosqlite:///{workdir}/benchmark.db"
+        provider_port, server_port = _free_port(), _free_port()
+        server_env = {
+            **os.environ,
+            "PYTHONPATH": os.pathsep.join(filter(None, [str(SERVER_DIR / "src"), os.environ.get("PYTHONPATH")])),
+            "DATABASE_URL": database_url,
+            "REDIS_URL": "localhost",
+            "REDIS_PORT": "6379",
+            "REDIS_DB": "0",
+            "OPENAI_BASE_URL": f"http://{HOST}:{provider_port}/v1",
+            "ANTHROPIC_BASE_URL": f"http://{HOST}:{provider_port}",
+            "OPENAI_API_KEY": "benchmark",
+            "ANTHROPIC_API_KEY": "benchmark",
+            "LOG_LEVEL": "WARNING",
+            **overrides,
+        }
+        subprocess.run([sys.executable, "-m", "chat_server.migrate"], env=server_env, cwd=workdir, check=True)
+        provider = subprocess.Popen(
+            [
+                sys.executable,
+                str(BENCHMARKS_DIR / "fake_provider.py"),
+                f"--port={provider_port}",
+                f"--ttft={args.ttft}",
+                f"--tokens-per-second={args.tokens_per_second}",
+                f"--response-tokens={args.response_tokens}",
+                f"--error-rate={args.error_rate}",
+                *([f"--max-concurrent-streams={args.provider_max_streams}"] if args.provider_max_streams else []),
+            ],
+        )
+        server = subprocess.Popen(
+            [
+                sys.executable,
+                str(BENCHMARKS_DIR / "serve.py"),
+                f"--port={server_port}",
+                f"--db-latency={args.db_latency}",
+            ],
+            env=server_env,
+            cwd=workdir,
+            stdout=server_output,
+            stderr=server_output,
+        )
+        try:
+            results = asyncio.run(_benchmark(args, provider, provider_port, server, server_port))
+        finally:
+            for process in (server, provider):
+                process.terminate()
+                process.wait()
+
+    results["config"] = {**vars(args), "env": overrides, "output": None, "baseline": None}
+    return results
+
+
+async def _benchmark(
+    args: argparse.Namespace,
+    provider: subprocess.Popen,
+    provider_port: int,
+    server: subprocess.Popen,
+    server_port: int,
+) -> dict:
+    server_url = f"http://{HOST}:{server_port}"
+    limits = httpx.Limits(max_connections=args.concurrency * 2, max_keepalive_connections=args.concurrency * 2)
+    async with httpx.AsyncClient(base_url=server_url, limits=limits, timeout=REQUEST_TIMEOUT) as client:
+        await _wait_until_ready(client, provider, f"http://{HOST}:{provider_port}/openapi.json")
+        await _wait_until_ready(client, server, f"{server_url}/openapi.json")
+        rss_before = _memory_mb(server.pid)["rss_mb"]
+
+        budget = RequestBudget(args.requests)
+        samples: list[Sample] = []
+        started = time.perf_counter()
+        await asyncio.gather(*(_virtual_user(client, args, budget, samples, user) for user in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+        memory = _memory_mb(server.pid)
+        metrics = (await client.get("/metrics")).text
+        provider_stats = (await client.get(f"http://{HOST}:{provider_port}/stats")).json()
+
+    return {
+        "commit": _git_commit(),
+        "timestamp": datetime.now(tz=timezone.utc).isoformat(),
+        "elapsed_seconds": elapsed,
+        "results": _summarize(samples, elapsed),
+        "memory": {**memory, "rss_growth_mb": _difference(memory["rss_mb"], rss_before)},
+        "server": _server_metrics(metrics, elapsed),
+        "provider": {key: provider_stats[key] for key in ("total_streams", "rate_limited_requests")},
+    }
+
+
+async def _virtual_user(
+    client: httpx.AsyncClient,
+    args: argparse.Namespace,
+    budget: RequestBudget,
+    samples: list[Sample],
+    user: int,
+) -> None:
+    prompt = ("benchmark " * (args.prompt_chars // 10 + 1))[: args.prompt_chars]
+    request_number = user
+    while budget.remaining > 0:
+        thread_id = (await client.post("/thread")).json()["id"]
+        for _ in range(args.turns):
+            if not budget.take():
+                return
+            if args.scenario == "chat":
+                model = args.models[request_number % len(args.models)]
+                samples.append(await _chat(client, thread_id, prompt, model))
+            else:
+                samples.extend(await _compare(client, thread_id, prompt, args.models))
+            request_number += 1
+
+
+async def _chat(client: httpx.AsyncClient, thread_id: str, prompt: str, model: str) -> Sample:
+    sample = Sample(kind="chat", ok=False)
+    started = last_chunk_at = time.perf_counter()
+    try:
+        async with client.stream("POST", f"/thread/{thread_id}/chat", json={"content": prompt, "model": model}) as r:
+            sample.status = r.status_code
+            if r.status_code != httpx.codes.OK:
+                await r.aread()
+                return sample
+            async for chunk in r.aiter_text():
+                if not chunk:
+                    continue
+                now = time.perf_counter()
+                if sample.ttft is None:
+                    sample.ttft = now - started
+                else:
+                    sample.gaps.append(now - last_chunk_at)
+                last_chunk_at = now
+    except httpx.HTTPError:
+        # A generation that fails mid-stream ends the response abruptly
+        return sample
+    sample.duration = time.perf_counter() - started
+    sample.ok = sample.ttft is not None
+    return sample
+
+
+async def _compare(client: httpx.AsyncClient, thread_id: str, prompt: str, models: list[str]) -> list[Sample]:
+    sample = Sample(kind="compare", ok=False)
+    comparison_message_id = None
+    failed_models = set()
+    started = last_chunk_at = time.perf_counter()
+    try:
+        async with client.stream(
+            "POST",
+            f"/thread/{thread_id}/chat/compare",
+            json={"content": prompt, "models": models},
+        ) as r:
+            sample.status = r.status_code
+            if r.status_code != httpx.codes.OK:
+                await r.aread()
+                return [sample]
+            async for line in r.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                event = json.loads(line.removeprefix("data: "))
+                if "comparison_message_id" in event:
+                    comparison_message_id = event["comparison_message_id"]
+                elif event.get("status") == "error":
+                    failed_models.add(event.get("model"))
+                elif "content" in event:
+                    now = time.perf_counter()
+                    if sample.ttft is None:
+                        sample.ttft = now - started
+                    else:
+                        sample.gaps.append(now - last_chunk_at)
+                    last_chunk_at = now
+    except httpx.HTTPError:
+        return [sample]
+    sample.duration = time.perf_counter() - started
+    sample.ok = sample.ttft is not None and not failed_models
+    if not sample.ok or comparison_message_id is None:
+        return [sample]
+
+    select = Sample(kind="select", ok=False)
+    started = time.perf_counter()
+    r = await client.post(
+        f"/thread/{thread_id}/chat/compare/select",
+        json={"comparison_message_id": comparison_message_id, "selected_model": models[0]},
+    )
+    select.status = r.status_code
+    select.duration = time.perf_counter() - started
+    select.ok = r.status_code == httpx.codes.OK
+    return [sample, select]
+
+
+def _summarize(samples: list[Sample], elapsed: float) -> dict:
+    by_kind: defaultdict[str, list[Sample]] = defaultdict(list)
+    for sample in samples:
+        by_kind[sample.kind].append(sample)
+    summary = {}
+    for kind, kind_samples in by_kind.items():
+        ok = [s for s in kind_samples if s.ok]
+        statuses: defaultdict[str, int] = defaultdict(int)
+        for s in kind_samples:
+            statuses[str(s.status)] += 1
+        summary[kind] = {
+            "requests": len(kind_samples),
+            "errors": len(kind_samples) - len(ok),
+            "statuses": dict(statuses),
+            "throughput_rps": len(ok) / elapsed,
+            "ttft": _percentiles([s.ttft for s in ok if s.ttft is not None]),
+            "inter_chunk": _percentiles([gap for s in ok for gap in s.gaps]),
+            "duration": _percentiles([s.duration for s in ok if s.duration is not None]),
+        }
+    return summary
+
+
+def _percentiles(values: list[float]) -> dict[str, float | None]:
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "max": None}
+    ordered = sorted(values)
+
+    def at(percentile: float) -> float:
+        return ordered[min(len(ordered) - 1, int(percentile * len(ordered)))]
+
+    return {"p50": at(0.5), "p95": at(0.95), "p99": at(0.99), "max": ordered[-1]}
+
+
+def _server_metrics(exposition: str, elapsed: float) -> dict:
+    """Mean time per server-side stage, cache hit ratios and database commit rate, from the server's /metrics."""
+    sums: defaultdict[str, float] = defaultdict(float)
+    counts: defaultdict[str, float] = defaultdict(float)
+    cache: defaultdict[str, dict[str, float]] = defaultdict(dict)
+    commits = 0.0
+    for family in text_string_to_metric_families(exposition):
+        for sample in family.samples:
+            if family.name == "chat_stage_seconds" and sample.name.endswith(("_sum", "_count")):
+                key = f"{sample.labels['mode']}.{sample.labels['stage']}"
+                (sums if sample.name.endswith("_sum") else counts)[key] += sample.value
+            elif family.name == "chat_history_load_seconds" and sample.name.endswith(("_sum", "_count")):
+                key = f"{sample.labels['mode']}.history_load"
+                (sums if sample.name.endswith("_sum") else counts)[key] += sample.value
+            elif family.name == "chat_cache_requests" and sample.name.endswith("_total"):
+                cache[sample.labels["cache"]][sample.labels["result"]] = sample.value
+            elif family.name == "db_commits" and sample.name.endswith("_total"):
+                commits += sample.value
+    return {
+        "stage_mean_seconds": {key: sums[key] / counts[key] for key in sorted(counts) if counts[key]},
+        "cache_hit_ratio": {
+            name: results.get("hit", 0) / (results.get("hit", 0) + results.get("miss", 0))
+            for name, results in cache.items()
+            if results.get("hit", 0) + results.get("miss", 0)
+        },
+        # Includes the few commits made while the server started
+        "db_commits": commits,
+        "db_commits_per_second": commits / elapsed,
+    }
+
+
+def _regressions(baseline: dict, current: dict, max_regression: float, checks: set[str]) -> list[str]:
+    regressions = []
+    for kind, result in current["results"].items():
+        base = baseline.get("results", {}).get(kind)
+        if base is None:
+            continue
+        for metric, percentile in REGRESSION_CHECKS:
+            if metric not in checks:
+                continue
+            before, after = base[metric][percentile], result[metric][percentile]
+            if before and after and after > before * (1 + max_regression):
+                regressions.append(f"{kind} {metric} {percentile}: {before:.4f}s -> {after:.4f}s")
+        before, after = base["throughput_rps"], result["throughput_rps"]
+        if THROUGHPUT_CHECK in checks and before and after < before * (1 - max_regression):
+            regressions.append(f"{kind} throughput: {before:.2f} -> {after:.2f} requests/s")
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return regressions
+
+
+def _print_summary(results: dict) -> None:
+    for kind, result in results["results"].items():
+        print(
+            f"{kind}: {result['requests']} requests, {result['errors']} errors, "
+            f"{result['throughput_rps']:.2f} requests/s, ttft {_format(result['ttft'])}, "
+            f"inter-chunk {_format(result['inter_chunk'])}, duration {_format(result['duration'])} (p50/p95/p99)",
+        )
+    print(f"server memory: {results['memory']}")
+    print(f"server stages: {results['server']['stage_mean_seconds']}")
+    print(f"server database commits: {results['server']['db_commits_per_second']:.1f}/s")
+    print(f"provider: {results['provider']}")
+
+
+def _format(percentiles: dict[str, float | None]) -> str:
+    return "/".join("-" if percentiles[p] is None else f"{percentiles[p] * 1000:.0f}ms" for p in ("p50", "p95", "p99"))
+
+
+async def _wait_until_ready(client: httpx.AsyncClient, process: subprocess.Popen, url: str) -> None:
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while True:
+        if process.poll() is not None:
+            exited_error = f"{process.args[1]} exited with status {process.returncode}"
+            raise RuntimeError(exited_error)
+        try:
+            if (await client.get(url)).status_code == httpx.codes.OK:
+                return
+        except httpx.TransportError:
+            if time.monotonic() > deadline:
+                raise
+        await asyncio.sleep(0.1)
+
+
+def _memory_mb(pid: int) -> dict[str, float | None]:
+    """Read the current and peak resident memory of a process from /proc, where available."""
+    memory: dict[str, float | None] = {"rss_mb": None, "peak_rss_mb": None}
+    status = Path(f"/proc/{pid}/status")
+    if not status.exists():
+        return memory
+    for line in status.read_text().splitlines():
+        name, _, value = line.partition(":")
+        if name in {"VmRSS", "VmHWM"}:
+            memory["rss_mb" if name == "VmRSS" else "peak_rss_mb"] = int(value.split()[0]) / 1024
+    return memory
+
+
+def _difference(after: float | None, before: float | None) -> float | None:
+    return None if after is None or before is None else after - before
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=SERVER_DIR,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind((HOST, 0))
+        return s.getsockname()[1]
+
+
+if __name__ == "__main__":
+    main()
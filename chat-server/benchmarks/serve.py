@@ -0,0 +1,57 @@
+"""Run the chat server for benchmarking, with both Redis instances replaced by in-process fakeredis servers.
+
+Configuration comes from the environment exactly as in production (DATABASE_URL, provider base URLs, tuning knobs),
+so the parent benchmark process controls the server under test by setting environment variables. --db-latency delays
+every database statement, as a slow or distant database would, without blocking the event loop.
+"""
+
+import argparse
+import asyncio
+
+import uvicorn
+from fakeredis import FakeServer
+from fakeredis.aioredis import FakeConnection
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--db-latency", type=float, default=0.0, help="seconds added to every database statement")
+    args = parser.parse_args()
+
+    # Connections are created lazily, so swapping the pool's connection class before the app starts is enough
+    from chat_server.redis_pool import generation_reader_redis_pool, redis_pool, response_cache_redis_pool
+
+    # Separate servers, like the separate instances of a deployment; generation readers share the main instance
+    main_server, response_cache_server = FakeServer(), FakeServer()
+    for pool, server in (
+        (redis_pool, main_server),
+        (generation_reader_redis_pool, main_server),
+        (response_cache_redis_pool, response_cache_server),
+    ):
+        pool.connection_class = FakeConnection
+        pool.connection_kwargs["server"] = server
+
+    if args.db_latency:
+        _delay_statements(args.db_latency)
+
+    from chat_server.main import app
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning", log_config=None)
+
+
+def _delay_statements(seconds: float) -> None:
+    from sqlalchemy import event
+    from sqlalchemy.util import await_only
+
+    from chat_server.db import engine
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def before_cursor_execute(*_: object) -> None:
+        # Runs inside SQLAlchemy's greenlet on the event loop, so the delay is awaited like a slow round trip
+        await_only(asyncio.sleep(seconds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""Measure how the cost of a chat turn grows with the length of its thread, with and without the context cache.
+
+Threads of each --sizes length are seeded straight into the database, then each gets --turns chat turns in a row
+against the fake provider. Per turn, the server's history load time is read from its /metrics and the time to first
+token is measured by the client; it also covers sending the whole prompt, which grows with the thread either way. The
+first turn on a thread always loads it from the database; later turns read it from the context cache, unless the cache
+is disabled (CONTEXT_CACHE_MAX_THREADS=0), which is how every turn worked before it.
+
+The run fails when, with the cache, the median history load of later turns on the longest threads is more than
+--max-growth times that on the shortest.
+
+For example:
+    python benchmarks/thread_length.py --sizes 10 100 1000 --output results/thread_length.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import statistics
+import string
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import httpx
+from prometheus_client.parser import text_string_to_metric_families
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+SERVER_DIR = BENCHMARKS_DIR.parent
+HOST = "127.0.0.1"
+STARTUP_TIMEOUT = 30.0
+REQUEST_TIMEOUT = 60.0
+MESSAGE_CHARS = 400
+MODEL = "gpt-4o"
+CONFIGURATIONS = {
+    "cached": {},
+    "uncached": {"CONTEXT_CACHE_MAX_THREADS": "0"},
+}
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000], help="messages per seeded thread")
+    parser.add_argument("--threads", type=int, default=3, help="threads per size")
+    parser.add_argument("--turns", type=int, default=10, help="chat turns per thread")
+    parser.add_argument("--max-growth", type=float, default=3.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="where to write the JSON results")
+    parser.add_argument("--phase", choices=["seed"], help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    if args.phase == "seed":
+        asyncio.run(_seed(args))
+        return
+
+    results = {name: _run_configuration(args, overrides) for name, overrides in CONFIGURATIONS.items()}
+    for name, sizes in results.items():
+        for size, result in sizes.items():
+            print(
+                f"{name}: {size} messages: history load first turn {result['first_history_load'] * 1000:.1f}ms, "
+                f"later turns p50 {result['history_load']['p50'] * 1000:.1f}ms, "
+                f"ttft p50 {result['ttft']['p50'] * 1000:.1f}ms",
+            )
+    shortest, longest = (str(size) for size in (min(args.sizes), max(args.sizes)))
+    cached = results["cached"]
+    growth = cached[longest]["history_load"]["p50"] / cached[shortest]["history_load"]["p50"]
+    print(f"cached: history load grows {growth:.1f}x from {shortest} to {longest} messages")
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(results, indent=2))
+    if growth > args.max_growth:
+        print(f"FAIL history load grows {growth:.1f}x, more than {args.max_growth:.1f}x")
+        sys.exit(1)
+
+
+def _run_configuration(args: argparse.Namespace, overrides: dict[str, str]) -> dict:
+    with tempfile.TemporaryDirectory() as workdir:
+        provider_port, server_port = _free_port(), _free_port()
+        server_env = {
+            **os.environ,
+            "PYTHONPATH": os.pathsep.join(filter(None, [str(SERVER_DIR / "src"), os.environ.get("PYTHONPATH")])),
+            "DATABASE_URL": f"sqlite+aiosqlite:///{workdir}/thread_length.db",
+            "REDIS_URL": "localhost",
+            "REDIS_PORT": "6379",
+            "REDIS_DB": "0",
+            "OPENAI_BASE_URL": f"http://{HOST}:{provider_port}/v1",
+            "ANTHROPIC_BASE_URL": f"http://{HOST}:{provider_port}",
+            "OPENAI_API_KEY": "benchmark",
+            "ANTHROPIC_API_KEY": "benchmark",
+            "LOG_LEVEL": "WARNING",
+            **overrides,
+        }
+        subprocess.run([sys.executable, "-m", "chat_server.migrate"], env=server_env, cwd=workdir, check=True)
+        # Seeded in a fresh interpreter, which reads the database URL from the environment when importing the server
+        subprocess.run([sys.executable, __file__, *sys.argv[1:], "--phase", "seed"], env=server_env, check=True)
+        provider = subprocess.Popen(
+            [
+                sys.executable,
+                str(BENCHMARKS_DIR / "fake_provider.py"),
+                f"--port={provider_port}",
+                "--ttft=0",
+                "--tokens-per-second=10000",
+                "--response-tokens=20",
+            ],
+        )
+        server = subprocess.Popen(
+            [sys.executable, str(BENCHMARKS_DIR / "serve.py"), f"--port={server_port}"],
+            env=server_env,
+            cwd=workdir,
+        )
+        try:
+            return asyncio.run(_run_turns(args, provider, provider_port, server, server_port))
+        finally:
+            for process in (server, provider):
+                process.terminate()
+                process.wait()
+
+
+def _thread_ids(args: argparse.Namespace) -> dict[str, list[str]]:
+    # Derived from the seed, so the seeding process and the driver agree on them
+    rng = random.Random(args.seed)
+    return {str(size): [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(args.threads)] for size in args.sizes}
+
+
+async def _seed(args: argparse.Namespace) -> None:
+    from sqlalchemy import insert
+
+    from chat_server.db import engine
+    from chat_server.models.chat import ChatMessage as ChatMessageModel
+    from chat_server.models.thread import Thread as ThreadModel
+
+    rng = random.Random(args.seed)
+    # Naive UTC, like the models' own timestamps
+    started_at = datetime.utcnow() - timedelta(days=1)  # noqa: DTZ003
+    async with engine.begin() as conn:
+        for size, thread_ids in _thread_ids(args).items():
+            await conn.execute(
+                insert(ThreadModel),
+                [{"id": thread_id, "name": f"{size} messages", "created_at": started_at} for thread_id in thread_ids],
+            )
+            messages = []
+            for thread_id in thread_ids:
+                for position in range(int(size)):
+                    content = "".join(rng.choices(string.ascii_lowercase + " ", k=MESSAGE_CHARS))
+                    messages.append(
+                        {
+                            "id": str(uuid.uuid4()),
+                            "content": content,
+                            "created_at": started_at + timedelta(seconds=position),
+                            "thread_id": thread_id,
+                            "role": "user" if position % 2 == 0 else "ai",
+                            "model": None if position % 2 == 0 else MODEL,
+                            "token_count": len(content) // 4,
+                        },
+                    )
+            await conn.execute(insert(ChatMessageModel), messages)
+    await engine.dispose()
+
+
+async def _run_turns(
+    args: argparse.Namespace,
+    provider: subprocess.Popen,
+    provider_port: int,
+    server: subprocess.Popen,
+    server_port: int,
+) -> dict:
+    rng = random.Random(args.seed)
+    results = {}
+    async with httpx.AsyncClient(base_url=f"http://{HOST}:{server_port}", timeout=REQUEST_TIMEOUT) as client:
+        await _wait_until_ready(client, provider, f"http://{HOST}:{provider_port}/openapi.json")
+        await _wait_until_ready(client, server, "/health/live")
+        for size, thread_ids in _thread_ids(args).items():
+            first_loads, later_loads, ttfts = [], [], []
+            for thread_id in thread_ids:
+                for turn in range(args.turns):
+                    prompt = "".join(rng.choices(string.ascii_lowercase + " ", k=MESSAGE_CHARS))
+                    loaded_before = await _history_load_seconds(client)
+                    ttfts.append(await _chat(client, thread_id, prompt))
+                    history_load = await _history_load_seconds(client) - loaded_before
+                    (later_loads if turn else first_loads).append(history_load)
+            results[size] = {
+                "first_history_load": statistics.median(first_loads),
+                "history_load": _percentiles(later_loads),
+                "ttft": _percentiles(ttfts),
+            }
+    return results
+
+
+async def _chat(client: httpx.AsyncClient, thread_id: str, prompt: str) -> float:
+    started = time.perf_counter()
+    ttft = None
+    async with client.stream("POST", f"/thread/{thread_id}/chat", json={"content": prompt, "model": MODEL}) as r:
+        r.raise_for_status()
+        async for chunk in r.aiter_text():
+            if chunk and ttft is None:
+                ttft = time.perf_counter() - started
+    return ttft
+
+
+async def _history_load_seconds(client: httpx.AsyncClient) -> float:
+    exposition = (await client.get("/metrics")).text
+    for family in text_string_to_metric_families(exposition):
+        if family.name == "chat_history_load_seconds":
+            for sample in family.samples:
+                if sample.name.endswith("_sum") and sample.labels.get("mode") == "chat":
+                    return sample.value
+    return 0.0
+
+
+def _percentiles(values: list[float]) -> dict[str, float]:
+    ordered = sorted(values)
+    return {
+        "p50": statistics.median(ordered),
+        "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        "max": ordered[-1],
+    }
+
+
+async def _wait_until_ready(client: httpx.AsyncClient, process: subprocess.Popen, url: str) -> None:
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while True:
+        if process.poll() is not None:
+            exited_error = f"{process.args[1]} exited with status {process.returncode}"
+            raise RuntimeError(exited_error)
+        try:
+            if (await client.get(url)).status_code == httpx.codes.OK:
+                return
+        except httpx.TransportError:
+            if time.monotonic() > deadline:
+                raise
+        await asyncio.sleep(0.1)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind((HOST, 0))
+        return s.getsockname()[1]
+
+
+if __name__ == "__main__":
+    main()
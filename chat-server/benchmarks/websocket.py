@@ -0,0 +1,391 @@
+"""Compare the WebSocket transport with the HTTP streaming endpoints, by connections held and bytes sent per chunk.
+
+Each of --clients clients keeps --threads threads busy at once, running --turns turns in each, first over the HTTP
+endpoints and then over one WebSocket per client. A turn is a comparison of --models followed by selecting the first
+model's answer (server-sent events over HTTP), or with --mode chat a single chat message (plain text over HTTP).
+While the clients run, the client-side sockets connected to the server are counted every few milliseconds.
+
+Bytes per chunk are the application payload the client receives per chunk of content, less the content itself: the
+SSE event or the WebSocket frame's JSON. Framing below that (HTTP chunked encoding, WebSocket frame headers of 2 to 4
+bytes) is not counted. Socket counts are read from /proc/net/tcp, so they are only reported on Linux.
+
+The run fails when any turn fails, or when a WebSocket client ever holds more than one connection.
+
+For example:
+    python benchmarks/websocket.py --clients 10 --threads 4 --output results/websocket.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections.abc import AsyncGenerator
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+import httpx
+import websockets
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+SERVER_DIR = BENCHMARKS_DIR.parent
+HOST = "127.0.0.1"
+STARTUP_TIMEOUT = 30.0
+REQUEST_TIMEOUT = 120.0
+SAMPLE_INTERVAL = 0.01
+PROC_NET_TCP = Path("/proc/net/tcp")
+TCP_ESTABLISHED = "01"
+# Chunk frames granted to each stream at a time; matches the server's WEBSOCKET_STREAM_WINDOW
+STREAM_WINDOW = 64
+
+
+@dataclass
+class TransportStats:
+    turns: int = 0
+    failures: int = 0
+    chunks: int = 0
+    payload_bytes: int = 0
+    content_bytes: int = 0
+    first_chunk_seconds: list[float] = field(default_factory=list)
+    turn_seconds: list[float] = field(default_factory=list)
+
+    def add_chunk(self, payload: str | bytes, content: str) -> None:
+        self.chunks += 1
+        self.payload_bytes += len(payload if isinstance(payload, bytes) else payload.encode())
+        self.content_bytes += len(content.encode())
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["compare", "chat"], default="compare")
+    parser.add_argument("--models", nargs="+", default=["gpt-4o", "claude-3-5-sonnet-20241022"])
+    parser.add_argument("--clients", type=int, default=10)
+    parser.add_argument("--threads", type=int, default=4, help="threads each client streams at once")
+    parser.add_argument("--turns", type=int, default=2)
+    parser.add_argument("--database-url", help="default: a temporary SQLite database")
+    parser.add_argument("--output", type=Path, help="where to write the JSON results")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as workdir:
+        provider_port, server_port = _free_port(), _free_port()
+        server_env = {
+            **os.environ,
+            "PYTHONPATH": os.pathsep.join(filter(None, [str(SERVER_DIR / "src"), os.environ.get("PYTHONPATH")])),
+            "DATABASE_URL": args.database_url or f"sqlite+aiosqlite:///{workdir}/websocket.db",
+            "REDIS_URL": "localhost",
+            "REDIS_PORT": "6379",
+            "REDIS_DB": "0",
+            "OPENAI_BASE_URL": f"http://{HOST}:{provider_port}/v1",
+            "ANTHROPIC_BASE_URL": f"http://{HOST}:{provider_port}",
+            "OPENAI_API_KEY": "benchmark",
+            "ANTHROPIC_API_KEY": "benchmark",
+            "LOG_LEVEL": "WARNING",
+            "WEBSOCKET_STREAM_WINDOW": str(STREAM_WINDOW),
+            "WEBSOCKET_MAX_STREAMS": str(args.threads),
+        }
+        subprocess.run([sys.executable, "-m", "chat_server.migrate"], env=server_env, cwd=workdir, check=True)
+        provider = subprocess.Popen(
+            [
+                sys.executable,
+                str(BENCHMARKS_DIR / "fake_provider.py"),
+                f"--port={provider_port}",
+                "--ttft=0.2",
+                "--tokens-per-second=50",
+                "--response-tokens=100",
+            ],
+        )
+        server = subprocess.Popen(
+            [sys.executable, str(BENCHMARKS_DIR / "serve.py"), f"--port={server_port}"],
+            env=server_env,
+            cwd=workdir,
+        )
+        try:
+            results = asyncio.run(_run(args, provider, provider_port, server, server_port))
+        finally:
+            for process in (server, provider):
+                process.terminate()
+                process.wait()
+
+    failures = []
+    for transport, result in results.items():
+        peak = result["peak_connections"]
+        print(
+            f"{transport}: {result['turns']} turns in {result['seconds']:.1f}s, "
+            f"peak connections {'unknown' if peak is None else peak}, "
+            f"{result['overhead_bytes_per_chunk']:.1f} framing bytes per chunk, "
+            f"first chunk p50 {result['first_chunk_p50_seconds'] * 1000:.0f}ms, "
+            f"turn p50 {result['turn_p50_seconds']:.2f}s",
+        )
+        if result["failures"]:
+            failures.append(f"{transport}: {result['failures']} turns failed")
+    websocket_peak = results["websocket"]["peak_connections"]
+    if websocket_peak is not None and websocket_peak > args.clients:
+        failures.append(f"websocket: {websocket_peak} connections for {args.clients} clients")
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(results, indent=2))
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if failures:
+        sys.exit(1)
+
+
+async def _run(
+    args: argparse.Namespace,
+    provider: subprocess.Popen,
+    provider_port: int,
+    server: subprocess.Popen,
+    server_port: int,
+) -> dict:
+    base_url = f"http://{HOST}:{server_port}"
+    async with httpx.AsyncClient(base_url=base_url, timeout=REQUEST_TIMEOUT) as client:
+        await _wait_until_ready(client, provider, f"http://{HOST}:{provider_port}/openapi.json")
+        await _wait_until_ready(client, server, "/health/live")
+        thread_ids = [
+            [(await client.post("/thread")).json()["id"] for _ in range(args.threads)] for _ in range(args.clients)
+        ]
+    results = {}
+    for transport, run_client in (("http", _http_client), ("websocket", _websocket_client)):
+        stats = TransportStats()
+        sampler = asyncio.create_task(_sample_connections(server_port))
+        started = time.perf_counter()
+        await asyncio.gather(*(run_client(args, base_url, threads, stats) for threads in thread_ids))
+        seconds = time.perf_counter() - started
+        sampler.cancel()
+        peak_connections = await sampler
+        results[transport] = _summarize(stats, seconds, peak_connections)
+    return results
+
+
+async def _http_client(args: argparse.Namespace, base_url: str, thread_ids: list[str], stats: TransportStats) -> None:
+    # Like a browser, each client has its own connection pool
+    async with httpx.AsyncClient(base_url=base_url, timeout=REQUEST_TIMEOUT) as client:
+
+        async def run_thread(thread_id: str) -> None:
+            for _ in range(args.turns):
+                started = time.perf_counter()
+                try:
+                    if args.mode == "chat":
+                        await _http_chat(client, args, thread_id, stats, started)
+                    else:
+                        await _http_compare(client, args, thread_id, stats, started)
+                except (httpx.HTTPError, ValueError):
+                    stats.failures += 1
+                    continue
+                stats.turns += 1
+                stats.turn_seconds.append(time.perf_counter() - started)
+
+        await asyncio.gather(*(run_thread(thread_id) for thread_id in thread_ids))
+
+
+async def _http_chat(
+    client: httpx.AsyncClient,
+    args: argparse.Namespace,
+    thread_id: str,
+    stats: TransportStats,
+    started: float,
+) -> None:
+    request = {"content": "Tell me a story", "model": args.models[0]}
+    first_chunk = True
+    async with client.stream("POST", f"/thread/{thread_id}/chat", json=request) as response:
+        response.raise_for_status()
+        async for chunk in response.aiter_text():
+            if first_chunk:
+                stats.first_chunk_seconds.append(time.perf_counter() - started)
+                first_chunk = False
+            stats.add_chunk(chunk, chunk)
+
+
+async def _http_compare(
+    client: httpx.AsyncClient,
+    args: argparse.Namespace,
+    thread_id: str,
+    stats: TransportStats,
+    started: float,
+) -> None:
+    request = {"content": "Tell me a story", "models": args.models}
+    comparison_message_id = None
+    first_chunk = True
+    async with client.stream("POST", f"/thread/{thread_id}/chat/compare", json=request) as response:
+        response.raise_for_status()
+        event = ""
+        async for line in response.aiter_lines():
+            # Each event is its lines plus the blank line that ends it, as sent
+            event += line + "\n"
+            if line:
+                continue
+            data = json.loads(next(line for line in event.splitlines() if line.startswith("data: "))[6:])
+            if "comparison_message_id" in data:
+                comparison_message_id = data["comparison_message_id"]
+            elif "content" in data:
+                if first_chunk:
+                    stats.first_chunk_seconds.append(time.perf_counter() - started)
+                    first_chunk = False
+                stats.add_chunk(event, data["content"])
+            elif "message" in data and data.get("status") != "done":
+                raise ValueError(data["message"])
+            event = ""
+    select = {"comparison_message_id": comparison_message_id, "selected_model": args.models[0]}
+    (await client.post(f"/thread/{thread_id}/chat/compare/select", json=select)).raise_for_status()
+
+
+async def _websocket_client(
+    args: argparse.Namespace,
+    base_url: str,
+    thread_ids: list[str],
+    stats: TransportStats,
+) -> None:
+    async with websockets.connect(f"{base_url.replace('http', 'ws', 1)}/ws", max_queue=None) as websocket:
+        client = MultiplexedClient(websocket)
+        reader = asyncio.create_task(client.read_frames())
+
+        async def run_thread(thread_index: int, thread_id: str) -> None:
+            for turn in range(args.turns):
+                started = time.perf_counter()
+                try:
+                    await _websocket_turn(client, args, f"{thread_index}-{turn}", thread_id, stats)
+                except ValueError:
+                    stats.failures += 1
+                    continue
+                stats.turns += 1
+                stats.turn_seconds.append(time.perf_counter() - started)
+
+        await asyncio.gather(*(run_thread(index, thread_id) for index, thread_id in enumerate(thread_ids)))
+        reader.cancel()
+
+
+class MultiplexedClient:
+    """Hands each stream on a WebSocket the frames carrying its id, as raw message and parsed frame."""
+
+    def __init__(self, websocket: websockets.ClientConnection) -> None:
+        self.websocket = websocket
+        self._streams: dict[str, asyncio.Queue[tuple[str, dict]]] = {}
+
+    async def read_frames(self) -> None:
+        async for message in self.websocket:
+            frame = json.loads(message)
+            await self._streams[frame["id"]].put((message, frame))
+
+    async def request(self, stream_id: str, frame: dict) -> AsyncGenerator[tuple[str, dict], None]:
+        """Send a request as the stream ``stream_id`` and yield its frames, up to its done or error frame."""
+        frames = self._streams[stream_id] = asyncio.Queue()
+        try:
+            await self.send({"id": stream_id, **frame})
+            while True:
+                message, frame = await frames.get()
+                yield message, frame
+                if frame["type"] in {"done", "error"}:
+                    return
+        finally:
+            del self._streams[stream_id]
+
+    async def send(self, frame: dict) -> None:
+        await self.websocket.send(json.dumps(frame))
+
+
+async def _websocket_turn(
+    client: MultiplexedClient,
+    args: argparse.Namespace,
+    stream_id: str,
+    thread_id: str,
+    stats: TransportStats,
+) -> None:
+    started = time.perf_counter()
+    if args.mode == "chat":
+        body = {"content": "Tell me a story", "model": args.models[0]}
+    else:
+        body = {"content": "Tell me a story", "models": args.models}
+    generation_id = None
+    chunks = 0
+    async for message, frame in client.request(stream_id, {"type": args.mode, "thread_id": thread_id, "body": body}):
+        if frame["type"] == "started":
+            generation_id = frame["generation_id"]
+        elif frame["type"] == "chunk":
+            if not chunks:
+                stats.first_chunk_seconds.append(time.perf_counter() - started)
+            chunks += 1
+            stats.add_chunk(message, frame["content"])
+            # Keep the window open, granting half of it at a time
+            if chunks % (STREAM_WINDOW // 2) == 0:
+                await client.send({"id": stream_id, "type": "window", "increment": STREAM_WINDOW // 2})
+        elif frame["type"] == "error":
+            raise ValueError(frame["message"])
+    if args.mode == "compare":
+        select = {"comparison_message_id": generation_id, "selected_model": args.models[0]}
+        await _websocket_select(client, f"{stream_id}-select", thread_id, select)
+
+
+async def _websocket_select(client: MultiplexedClient, stream_id: str, thread_id: str, select: dict) -> None:
+    async for _, frame in client.request(stream_id, {"type": "select", "thread_id": thread_id, "body": select}):
+        if frame["type"] == "error":
+            raise ValueError(frame["message"])
+
+
+async def _sample_connections(server_port: int) -> int | None:
+    """Count the client sockets connected to the server until cancelled, and return the most seen at once."""
+    peak = 0
+    try:
+        while True:
+            count = _count_connections(server_port)
+            if count is None:
+                return None
+            peak = max(peak, count)
+            await asyncio.sleep(SAMPLE_INTERVAL)
+    except asyncio.CancelledError:
+        return peak
+
+
+def _count_connections(server_port: int) -> int | None:
+    if not PROC_NET_TCP.exists():
+        return None
+    # Columns: sl, local address, remote address, state, ...; addresses are hex ip:port
+    count = 0
+    for line in PROC_NET_TCP.read_text().splitlines()[1:]:
+        _, _, remote, state, *_ = line.split()
+        if state == TCP_ESTABLISHED and int(remote.split(":")[1], 16) == server_port:
+            count += 1
+    return count
+
+
+def _summarize(stats: TransportStats, seconds: float, peak_connections: int | None) -> dict:
+    return {
+        **asdict(stats),
+        "seconds": seconds,
+        "peak_connections": peak_connections,
+        "overhead_bytes_per_chunk": (stats.payload_bytes - stats.content_bytes) / max(1, stats.chunks),
+        "first_chunk_p50_seconds": statistics.median(stats.first_chunk_seconds or [0]),
+        "turn_p50_seconds": statistics.median(stats.turn_seconds or [0]),
+    }
+
+
+async def _wait_until_ready(client: httpx.AsyncClient, process: subprocess.Popen, url: str) -> None:
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while True:
+        if process.poll() is not None:
+            exited_error = f"{process.args[1]} exited with status {process.returncode}"
+            raise RuntimeError(exited_error)
+        try:
+            if (await client.get(url)).status_code == httpx.codes.OK:
+                return
+        except httpx.TransportError:
+            if time.monotonic() > deadline:
+                raise
+        await asyncio.sleep(0.1)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind((HOST, 0))
+        return s.getsockname()[1]
+
+
+if __name__ == "__main__":
+    main()
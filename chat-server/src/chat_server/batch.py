@@ -0,0 +1,329 @@
+import asyncio
+import os
+import time
+from collections.abc import AsyncGenerator
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, tuple_, update
+from sqlmodel import col, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from chat_server.db import async_session
+from chat_server.generated.models import ChatMessage, Model, Role
+from chat_server.llm.factory import llm_factory
+from chat_server.llm.llm import LLM, Usage
+from chat_server.llm.resilience import ResilientStream
+from chat_server.llm.response_cache import ResponseCache
+from chat_server.llm.scheduler import Priority, SchedulerRejectedError, llm_scheduler, release_when_done
+from chat_server.metrics import BATCH_MODE, instrument_stream
+from chat_server.models.batch import BatchItem, BatchItemStatus, BatchJob
+from chat_server.redis_pool import response_cache_redis_client
+from chat_server.usage import usage_recorder
+from chat_server.utils.logging import logger, sampled_logger
+
+# Items each worker process runs at once; they also queue behind interactive requests for provider slots
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "4"))
+BATCH_POLL_INTERVAL = float(os.environ.get("BATCH_POLL_INTERVAL", "1"))
+# How long a claimed item may run before another worker assumes its worker died and runs it again
+BATCH_CLAIM_SECONDS = float(os.environ.get("BATCH_CLAIM_SECONDS", "600"))
+BATCH_MAX_ATTEMPTS = int(os.environ.get("BATCH_MAX_ATTEMPTS", "3"))
+# How long shutdown waits for running items before handing them back to the queue for another worker
+BATCH_DRAIN_TIMEOUT = float(os.environ.get("BATCH_DRAIN_TIMEOUT", "30"))
+BATCH_MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", "50000"))
+BATCH_INSERT_SIZE = 1_000
+# How late an item may commit after its finished_at, under a slow commit or clock skew between workers, and still be
+# streamed by follow_results
+BATCH_FOLLOW_LOOKBACK = timedelta(seconds=float(os.environ.get("BATCH_FOLLOW_LOOKBACK", "30")))
+# Expired claims are looked for this many times per claim period, so a dead worker's items wait at most that fraction
+# longer than their claim
+CLAIM_EXPIRY_CHECKS = 4
+ABANDONED_MESSAGE = "Worker stopped while running the item"
+FINISHED_STATUSES = (BatchItemStatus.done.value, BatchItemStatus.error.value)
+
+
+class BatchTooLargeError(Exception):
+    pass
+
+
+class BatchRunner:
+    """Runs the items of batch jobs, at most ``concurrency`` at a time in each worker process.
+
+    Items are claimed from the database, so every worker shares the queue and a job survives the worker that started
+    it. A claim lasts ``claim_seconds``; an item still running after that is taken to belong to a worker that died and
+    is claimed again, up to ``max_attempts`` times. Each result is written as soon as its item finishes. An item the
+    scheduler has no provider slot for goes back to the queue, and the worker stops claiming for ``poll_interval``.
+    """
+
+    def __init__(
+        self,
+        *,
+        concurrency: int = BATCH_CONCURRENCY,
+        poll_interval: float = BATCH_POLL_INTERVAL,
+        claim_seconds: float = BATCH_CLAIM_SECONDS,
+        max_attempts: int = BATCH_MAX_ATTEMPTS,
+        drain_timeout: float = BATCH_DRAIN_TIMEOUT,
+    ) -> None:
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.claim_seconds = claim_seconds
+        self.max_attempts = max_attempts
+        self.drain_timeout = drain_timeout
+        # Nobody watches a batch item stream, so a replayed response is not paced
+        self.response_cache = ResponseCache(response_cache_redis_client, replay_max_gap=0)
+        self._running: set[asyncio.Task] = set()
+        self._expired_at = 0.0
+        # Set when the scheduler rejects an item: the provider slots are taken, and claiming again at once would only
+        # repeat the rejection with two writes per item
+        self._paused_until = 0.0
+        self._wake = asyncio.Event()
+        self._stopping = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if self._task is None and self.concurrency > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._stopping.set()
+        await self._task
+        self._task = None
+        if not self._running:
+            return
+        _, pending = await asyncio.wait(set(self._running), timeout=self.drain_timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    def wake(self) -> None:
+        """Claim items now rather than at the next poll, e.g. after a job was created."""
+        self._wake.set()
+
+    async def _run(self) -> None:
+        while not self._stopping.is_set():
+            claimed = []
+            free = self.concurrency - len(self._running) if time.monotonic() >= self._paused_until else 0
+            if free > 0:
+                try:
+                    if time.monotonic() - self._expired_at >= self.claim_seconds / CLAIM_EXPIRY_CHECKS:
+                        await self._expire_claims()
+                        self._expired_at = time.monotonic()
+                    claimed = await self._claim(free)
+                except Exception as e:  # noqa: BLE001
+                    logger.warning(f"Failed to claim batch items: {e}")
+                for item in claimed:
+                    task = asyncio.create_task(self._run_item(item))
+                    self._running.add(task)
+                    task.add_done_callback(self._running.discard)
+            if claimed and len(claimed) == free:
+                continue
+            # Nothing left to claim, or no free slot: wait for a slot, a new job or the next poll
+            self._wake.clear()
+            waiters = {asyncio.create_task(self._wake.wait()), asyncio.create_task(self._stopping.wait())}
+            await asyncio.wait(
+                waiters | self._running,
+                timeout=self.poll_interval,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            for waiter in waiters:
+                waiter.cancel()
+
+    async def _expire_claims(self) -> None:
+        # Naive UTC, like the models' own timestamps
+        now = datetime.utcnow()  # noqa: DTZ003
+        expired = (col(BatchItem.status) == BatchItemStatus.running.value) & (col(BatchItem.claimed_until) < now)
+        async with async_session() as session:
+            await session.exec(
+                update(BatchItem)
+                .where(expired & (col(BatchItem.attempts) >= self.max_attempts))
+                .values(status=BatchItemStatus.error.value, error=ABANDONED_MESSAGE, finished_at=now)
+            )
+            await session.exec(
+                update(BatchItem)
+                .where(expired & (col(BatchItem.attempts) < self.max_attempts))
+                .values(status=BatchItemStatus.pending.value, claimed_until=None)
+            )
+            await session.commit()
+
+    async def _claim(self, limit: int) -> list[BatchItem]:
+        now = datetime.utcnow()  # noqa: DTZ003
+        # SKIP LOCKED lets workers claim concurrently without waiting on each other; SQLite has one writer anyway
+        oldest_pending = (
+            select(BatchItem.job_id, BatchItem.position)
+            .where(BatchItem.status == BatchItemStatus.pending.value)
+            .order_by(BatchItem.queued_at, BatchItem.position)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        statement = (
+            update(BatchItem)
+            .where(tuple_(BatchItem.job_id, BatchItem.position).in_(oldest_pending))
+            .values(
+                status=BatchItemStatus.running.value,
+                attempts=BatchItem.attempts + 1,
+                claimed_until=now + timedelta(seconds=self.claim_seconds),
+            )
+            .returning(BatchItem)
+        )
+        async with async_session() as session:
+            claimed = list((await session.exec(statement)).scalars())
+            await session.commit()
+        return claimed
+
+    async def _run_item(self, item: BatchItem) -> None:
+        model = Model(item.model)
+        try:
+            lease = await llm_scheduler.acquire(model, Priority.batch)
+        except SchedulerRejectedError:
+            # Interactive traffic has the provider slots; the item waits for a later poll without losing an attempt
+            self._paused_until = time.monotonic() + self.poll_interval
+            await self._release(item, attempts=item.attempts - 1)
+            return
+
+        usage = Usage()
+
+        def open_stream(llm: LLM, model: Model) -> AsyncGenerator[str, None]:
+            return self.response_cache.get_stream_generator(
+                model,
+                llm,
+                [ChatMessage(content=item.prompt, role=Role.user)],
+                usage=usage,
+            )
+
+        resilient_stream = ResilientStream(model, llm_factory, open_stream)
+        stream = release_when_done(instrument_stream(resilient_stream, model, BATCH_MODE), lease)
+        started = time.perf_counter()
+        try:
+            response = "".join([chunk async for chunk in stream])
+        except asyncio.CancelledError:
+            # Shutdown gave up waiting; another worker runs the item again from the start
+            await self._release(item, attempts=item.attempts - 1)
+            raise
+        except Exception as e:  # noqa: BLE001
+            sampled_logger.error(f"Batch item {item.position} of job {item.job_id} failed: {e}")
+            await self._finish(item, status=BatchItemStatus.error, error=str(e))
+            return
+        latency_seconds = time.perf_counter() - started
+        usage_recorder.record(None, resilient_stream.model, usage, latency_seconds)
+        await self._finish(
+            item,
+            status=BatchItemStatus.done,
+            response=response,
+            input_tokens=usage.input_tokens,
+            output_tokens=usage.output_tokens,
+            latency_seconds=latency_seconds,
+        )
+
+    async def _finish(self, item: BatchItem, status: BatchItemStatus, **values: object) -> None:
+        await self._update(item, status=status.value, finished_at=datetime.utcnow(), **values)  # noqa: DTZ003
+
+    async def _release(self, item: BatchItem, attempts: int) -> None:
+        await self._update(item, status=BatchItemStatus.pending.value, claimed_until=None, attempts=attempts)
+
+    async def _update(self, item: BatchItem, **values: object) -> None:
+        # Only while the claim is still this worker's: an item whose claim expired may already be running elsewhere
+        statement = (
+            update(BatchItem)
+            .where(
+                BatchItem.job_id == item.job_id,
+                BatchItem.position == item.position,
+                BatchItem.status == BatchItemStatus.running.value,
+                BatchItem.attempts == item.attempts,
+            )
+            .values(**values)
+        )
+        try:
+            async with async_session() as session:
+                await session.exec(statement)
+                await session.commit()
+        except Exception as e:  # noqa: BLE001
+            # The item stays claimed, and runs again once the claim expires
+            logger.warning(f"Failed to update batch item {item.position} of job {item.job_id}: {e}")
+
+
+async def create_job(session: AsyncSession, prompts: list[str], models: list[Model]) -> BatchJob:
+    """Queue every prompt on every model, in one transaction."""
+    models = list(dict.fromkeys(models))
+    if len(prompts) * len(models) > BATCH_MAX_ITEMS:
+        batch_too_large_error = f"A batch job can run at most {BATCH_MAX_ITEMS} prompts across all models"
+        raise BatchTooLargeError(batch_too_large_error)
+    job = BatchJob(models=[model.value for model in models], prompt_count=len(prompts))
+    session.add(job)
+    await session.flush()
+    items = [
+        {
+            "job_id": job.id,
+            "position": prompt_index * len(models) + model_index,
+            "prompt_index": prompt_index,
+            "model": model.value,
+            "prompt": prompt,
+            "queued_at": job.created_at,
+            "status": BatchItemStatus.pending.value,
+            "attempts": 0,
+        }
+        for prompt_index, prompt in enumerate(prompts)
+        for model_index, model in enumerate(models)
+    ]
+    conn = await session.connection()
+    for start in range(0, len(items), BATCH_INSERT_SIZE):
+        await conn.execute(insert(BatchItem), items[start : start + BATCH_INSERT_SIZE])
+    await session.commit()
+    return job
+
+
+async def get_item_counts(session: AsyncSession, job_id: str) -> dict[str, int]:
+    """Return how many of the job's items are in each status."""
+    statement = select(BatchItem.status, func.count()).where(BatchItem.job_id == job_id).group_by(BatchItem.status)
+    counts = dict.fromkeys((status.value for status in BatchItemStatus), 0)
+    counts.update(dict((await session.exec(statement)).all()))
+    return counts
+
+
+async def get_results(session: AsyncSession, job_id: str, after: int, limit: int) -> list[BatchItem]:
+    """Return up to ``limit`` finished items from position ``after`` on, in position order."""
+    statement = (
+        select(BatchItem)
+        .where(
+            BatchItem.job_id == job_id,
+            BatchItem.position >= after,
+            col(BatchItem.status).in_(FINISHED_STATUSES),
+        )
+        .order_by(BatchItem.position)
+        .limit(limit)
+    )
+    return list((await session.exec(statement)).all())
+
+
+async def follow_results(
+    job_id: str,
+    item_count: int,
+    poll_interval: float = BATCH_POLL_INTERVAL,
+) -> AsyncGenerator[BatchItem, None]:
+    """Yield each of the job's items once it has finished, in roughly the order they finish, until all have.
+
+    Each poll fetches only items not yielded yet: those finished since the newest yielded item, less
+    BATCH_FOLLOW_LOOKBACK for items that committed late, other than the ones already yielded from that window.
+    """
+    remaining = item_count
+    newest: datetime | None = None
+    # Yielded items that finished within the lookback window of the newest one, by position
+    recent: dict[int, datetime] = {}
+    while remaining:
+        statement = select(BatchItem).where(BatchItem.job_id == job_id, col(BatchItem.status).in_(FINISHED_STATUSES))
+        if newest is not None:
+            since = newest - BATCH_FOLLOW_LOOKBACK
+            recent = {position: finished_at for position, finished_at in recent.items() if finished_at >= since}
+            statement = statement.where(BatchItem.finished_at >= since, col(BatchItem.position).not_in(list(recent)))
+        async with async_session() as session:
+            finished = (await session.exec(statement.order_by(BatchItem.finished_at, BatchItem.position))).all()
+        for item in finished:
+            recent[item.position] = item.finished_at
+            newest = item.finished_at if newest is None else max(newest, item.finished_at)
+            remaining -= 1
+            yield item
+        if remaining:
+            await asyncio.sleep(poll_interval)
+
+
+batch_runner = BatchRunner()
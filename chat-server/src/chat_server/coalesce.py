@@ -0,0 +1,76 @@
+import asyncio
+import contextlib
+import os
+from collections.abc import AsyncGenerator
+
+STREAM_FLUSH_INTERVAL = float(os.environ.get("STREAM_FLUSH_INTERVAL", "0.05"))
+STREAM_FLUSH_BYTES = int(os.environ.get("STREAM_FLUSH_BYTES", "1024"))
+# Chunks read ahead of the generation log append; once full, reading from the provider pauses
+STREAM_BUFFER_CHUNKS = int(os.environ.get("STREAM_BUFFER_CHUNKS", "256"))
+
+_END = object()
+
+
+class _StreamError:
+    def __init__(self, error: Exception) -> None:
+        self.error = error
+
+
+async def coalesce(
+    stream: AsyncGenerator[str, None],
+    flush_interval: float = STREAM_FLUSH_INTERVAL,
+    flush_bytes: int = STREAM_FLUSH_BYTES,
+) -> AsyncGenerator[str, None]:
+    """Re-chunk a token stream into at most one frame per ``flush_interval``, or sooner once ``flush_bytes`` build up.
+
+    A token arriving after a quiet period is flushed immediately, so coalescing never delays the first token. The
+    provider is read through a bounded buffer, so the provider stream only pauses when the consumer, which appends
+    frames to the generation log, falls behind. Clients read that log at their own pace, so a slow client does not
+    pause the provider; instead the log holds the whole answer in Redis until the generation expires. Errors from
+    ``stream`` are raised after the text received before them has been yielded.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=STREAM_BUFFER_CHUNKS)
+
+    async def pump() -> None:
+        try:
+            async for chunk in stream:
+                await queue.put(chunk)
+        except Exception as e:  # noqa: BLE001
+            await queue.put(_StreamError(e))
+            return
+        await queue.put(_END)
+
+    pump_task = asyncio.create_task(pump())
+    buffer: list[str] = []
+    buffered_bytes = 0
+    last_flush = -flush_interval
+    try:
+        while True:
+            timeout = None if not buffer else max(0.0, last_flush + flush_interval - loop.time())
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                item = None
+            if isinstance(item, str):
+                buffer.append(item)
+                buffered_bytes += len(item.encode("utf-8"))
+            if buffer and (
+                item is None
+                or item is _END
+                or isinstance(item, _StreamError)
+                or buffered_bytes >= flush_bytes
+                or loop.time() - last_flush >= flush_interval
+            ):
+                yield "".join(buffer)
+                buffer = []
+                buffered_bytes = 0
+                last_flush = loop.time()
+            if item is _END:
+                return
+            if isinstance(item, _StreamError):
+                raise item.error
+    finally:
+        pump_task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await pump_task
@@ -0,0 +1,156 @@
+import json
+from dataclasses import dataclass
+
+from redis.asyncio import Redis
+from redis.asyncio.client import Pipeline
+
+from chat_server.generated.models import Model
+
+COMPARISON_TTL_SECONDS = 60 * 60
+USER_MESSAGE_FIELD = "user_message"
+THREAD_ID_FIELD = "thread_id"
+MODELS_FIELD = "models"
+SELECTED_MODEL_FIELD = "selected_model"
+# Set by whichever of the selection and the selected model's completion comes second, which then persists the turn
+PERSISTED_FIELD = "persisted"
+ERROR_FIELD_SUFFIX = ":error"
+
+
+class ComparisonNotFoundError(Exception):
+    pass
+
+
+class ComparisonConflictError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class Selection:
+    user_message: str
+    # None while the selected model is still generating
+    answer: str | None
+    # Whether the caller is the one to add the turn to the thread
+    persist: bool
+    # Set when the selected model failed, in which case nothing is added to the thread
+    error: str | None = None
+
+
+class ComparisonStore:
+    """Compare-mode state, kept as one Redis hash per comparison with a single TTL.
+
+    Fields are ``user_message``, ``thread_id``, ``models``, one field per model value holding that model's answer once
+    it has finished, plus ``<model>:error`` if it failed, and ``selected_model`` and ``persisted`` once a model is
+    selected. A model can be selected before it finishes; selection and completion both update the hash in a WATCH
+    transaction, so exactly one of them sees the other and claims persisting the turn. A failed model's partial answer
+    is never persisted: it cannot be selected, and if it was selected before failing the selection records the failure.
+    """
+
+    def __init__(self, redis: Redis, ttl_seconds: int = COMPARISON_TTL_SECONDS) -> None:
+        self.redis = redis
+        self.ttl_seconds = ttl_seconds
+
+    @staticmethod
+    def key(comparison_message_id: str) -> str:
+        return f"comparison:{comparison_message_id}"
+
+    async def start(self, comparison_message_id: str, thread_id: str, content: str, models: list[Model]) -> None:
+        await self._save(
+            comparison_message_id,
+            {
+                USER_MESSAGE_FIELD: content,
+                THREAD_ID_FIELD: thread_id,
+                MODELS_FIELD: json.dumps([model.value for model in models]),
+            },
+        )
+
+    async def save_answers(self, comparison_message_id: str, answers: dict[Model, str]) -> None:
+        await self._save(comparison_message_id, {model.value: answer for model, answer in answers.items()})
+
+    async def finish_answer(
+        self,
+        comparison_message_id: str,
+        model: Model,
+        answer: str,
+        error: str | None = None,
+    ) -> Selection | None:
+        """Save ``model``'s final answer, or its partial answer and ``error`` if it failed.
+
+        Return the selection if the model was already selected: to persist, or carrying ``error``.
+        """
+        key = self.key(comparison_message_id)
+
+        async def attempt(pipe: Pipeline) -> Selection | None:
+            fields = _decode_fields(await pipe.hgetall(key))
+            # An expired comparison cannot be selected any more, and must not be recreated without its prompt
+            if not fields:
+                return None
+            selected = fields.get(SELECTED_MODEL_FIELD) == model.value
+            persist = selected and error is None and PERSISTED_FIELD not in fields
+            saved = {model.value: answer}
+            if error is not None:
+                saved[model.value + ERROR_FIELD_SUFFIX] = error
+            if persist:
+                saved[PERSISTED_FIELD] = "1"
+            pipe.multi()
+            self._queue_save(pipe, key, saved)
+            return Selection(fields[USER_MESSAGE_FIELD], answer, persist=persist, error=error) if selected else None
+
+        return await self.redis.transaction(attempt, key, value_from_callable=True)
+
+    async def select(self, comparison_message_id: str, thread_id: str, model: Model) -> Selection:
+        """Select ``model``'s answer, finished or not; selecting the same model again changes nothing.
+
+        Raise ComparisonNotFoundError if the comparison is unknown, expired, from another thread or did not include
+        ``model``, and ComparisonConflictError if another model has already been selected or ``model`` failed.
+        """
+        key = self.key(comparison_message_id)
+
+        async def attempt(pipe: Pipeline) -> Selection:
+            fields = _decode_fields(await pipe.hgetall(key))
+            if not fields or fields.get(THREAD_ID_FIELD) != thread_id:
+                not_found_error = f"Comparison not found: {comparison_message_id}"
+                raise ComparisonNotFoundError(not_found_error)
+            if model.value not in json.loads(fields[MODELS_FIELD]):
+                model_not_found_error = f"Comparison {comparison_message_id} did not include {model.value}"
+                raise ComparisonNotFoundError(model_not_found_error)
+            selected_model = fields.get(SELECTED_MODEL_FIELD)
+            if selected_model not in {None, model.value}:
+                conflict_error = f"Comparison {comparison_message_id} already has {selected_model} selected"
+                raise ComparisonConflictError(conflict_error)
+            model_error = fields.get(model.value + ERROR_FIELD_SUFFIX)
+            if model_error is not None:
+                failed_error = f"{model.value} failed in comparison {comparison_message_id}: {model_error}"
+                raise ComparisonConflictError(failed_error)
+            answer = fields.get(model.value)
+            persist = answer is not None and PERSISTED_FIELD not in fields
+            pipe.multi()
+            self._queue_save(
+                pipe,
+                key,
+                {SELECTED_MODEL_FIELD: model.value, **({PERSISTED_FIELD: "1"} if persist else {})},
+            )
+            return Selection(fields[USER_MESSAGE_FIELD], answer, persist=persist)
+
+        return await self.redis.transaction(attempt, key, value_from_callable=True)
+
+    async def selected_model(self, comparison_message_id: str) -> str | None:
+        return _decode(await self.redis.hget(self.key(comparison_message_id), SELECTED_MODEL_FIELD))
+
+    async def _save(self, comparison_message_id: str, fields: dict[str, str]) -> None:
+        key = self.key(comparison_message_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            self._queue_save(pipe, key, fields)
+            await pipe.execute()
+
+    def _queue_save(self, pipe: Pipeline, key: str, fields: dict[str, str]) -> None:
+        # HSET and EXPIRE go out in one round trip, and every write refreshes the TTL of the whole comparison
+        pipe.hset(key, mapping=fields)
+        pipe.expire(key, self.ttl_seconds)
+
+
+def _decode(value: bytes | None) -> str | None:
+    return value.decode("utf-8") if value is not None else None
+
+
+def _decode_fields(fields: dict[bytes, bytes]) -> dict[str, str]:
+    return {name.decode("utf-8"): value.decode("utf-8") for name, value in fields.items()}
@@ -0,0 +1,120 @@
+import os
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from sqlmodel import func, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from chat_server.context.window import count_tokens, window_start
+from chat_server.generated.models import ChatMessage
+from chat_server.llm.llm import LLM
+from chat_server.metrics import CACHE_REQUESTS
+from chat_server.models.chat import ChatMessage as ChatMessageModel
+
+CONTEXT_CACHE_MAX_THREADS = int(os.environ.get("CONTEXT_CACHE_MAX_THREADS", "1024"))
+
+
+def to_chat_message(message: ChatMessageModel) -> ChatMessage:
+    return ChatMessage(
+        content=message.content,
+        role=message.role,
+        model=message.model,
+    )
+
+
+def token_count_of(message: ChatMessageModel) -> int:
+    # Rows written before token counts were stored have no count; estimate them once when loaded into the cache
+    return message.token_count if message.token_count is not None else count_tokens(message.content)
+
+
+@dataclass
+class ThreadContext:
+    messages: list[ChatMessage]
+    token_counts: list[int]
+    last_created_at: datetime | None
+    # Provider-format history, keyed by LLM class since conversion does not depend on the concrete model
+    _converted: dict[type[LLM], list] = field(default_factory=dict)
+    _converters: dict[type[LLM], LLM] = field(default_factory=dict)
+
+    def converted_for(self, llm: LLM, token_budget: int | None = None) -> list:
+        """Return this thread's history in ``llm``'s provider format, trimmed to the newest ``token_budget`` tokens.
+
+        Without a budget the cached list itself is returned; it is shared and must not be mutated.
+        """
+        key = type(llm)
+        if key not in self._converted:
+            self._converted[key] = llm.convert_messages(self.messages)
+            self._converters[key] = llm
+        converted = self._converted[key]
+        if token_budget is None:
+            return converted
+        return converted[window_start(self.messages, self.token_counts, token_budget) :]
+
+    def token_count_for(self, token_budget: int) -> int:
+        """Return the estimated size of the history ``converted_for`` returns with the same ``token_budget``."""
+        return sum(self.token_counts[window_start(self.messages, self.token_counts, token_budget) :])
+
+    def extend(self, rows: list[ChatMessageModel]) -> None:
+        new_messages = [to_chat_message(row) for row in rows]
+        self.messages.extend(new_messages)
+        self.token_counts.extend(token_count_of(row) for row in rows)
+        for key, converted in self._converted.items():
+            converted.extend(self._converters[key].convert_messages(new_messages))
+        self.last_created_at = rows[-1].created_at
+
+
+class ThreadContextCache:
+    """In-process LRU of per-thread conversation history, kept warm by appending committed turns.
+
+    Every lookup checks the thread's row count (an index-only query) so rows committed by another worker invalidate
+    the entry instead of being silently missed.
+    """
+
+    def __init__(self, max_threads: int = CONTEXT_CACHE_MAX_THREADS) -> None:
+        self.max_threads = max_threads
+        self._entries: OrderedDict[str, ThreadContext] = OrderedDict()
+
+    async def get(self, session: AsyncSession, thread_id: str) -> ThreadContext:
+        count = (await session.exec(select(func.count()).where(ChatMessageModel.thread_id == thread_id))).one()
+        context = self._entries.get(thread_id)
+        if context is not None and len(context.messages) == count:
+            CACHE_REQUESTS.labels("context", "hit").inc()
+            self._entries.move_to_end(thread_id)
+            return context
+        CACHE_REQUESTS.labels("context", "miss").inc()
+
+        rows = (
+            await session.exec(
+                select(ChatMessageModel)
+                .where(ChatMessageModel.thread_id == thread_id)
+                .order_by(ChatMessageModel.created_at),
+            )
+        ).all()
+        context = ThreadContext(
+            messages=[to_chat_message(row) for row in rows],
+            token_counts=[token_count_of(row) for row in rows],
+            last_created_at=rows[-1].created_at if rows else None,
+        )
+        self._entries[thread_id] = context
+        self._entries.move_to_end(thread_id)
+        while len(self._entries) > self.max_threads:
+            self._entries.popitem(last=False)
+        return context
+
+    def append(self, thread_id: str, rows: list[ChatMessageModel]) -> None:
+        """Record rows that were just committed to ``thread_id``, in created_at order."""
+        context = self._entries.get(thread_id)
+        if context is None:
+            return
+        if context.last_created_at is not None and rows[0].created_at < context.last_created_at:
+            # A concurrent turn on the same thread committed first; its rows interleave with these by created_at
+            self.invalidate(thread_id)
+            return
+        context.extend(rows)
+
+    def invalidate(self, thread_id: str) -> None:
+        self._entries.pop(thread_id, None)
+
+
+context_cache = ThreadContextCache()
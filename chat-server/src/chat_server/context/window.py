@@ -0,0 +1,45 @@
+import math
+import os
+
+from chat_server.generated.models import ChatMessage, Role
+
+# Provider-agnostic estimate: ~3.5 characters per token plus per-message framing. It is deliberately conservative so a
+# window that fits by this estimate also fits by the provider's own tokenizer.
+CHARS_PER_TOKEN = 3.5
+MESSAGE_TOKEN_OVERHEAD = 4
+# Once a thread outgrows the budget, its window start moves forward by whole steps of this fraction of the budget
+# rather than by one turn at a time, so the turns in between send the same prefix and hit the providers' prompt caches.
+# 0 keeps as much history as fits, at the cost of a cache miss on every turn.
+CONTEXT_TRIM_STEP = float(os.environ.get("CONTEXT_TRIM_STEP", "0.25"))
+
+
+def count_tokens(content: str) -> int:
+    return math.ceil(len(content) / CHARS_PER_TOKEN) + MESSAGE_TOKEN_OVERHEAD
+
+
+def window_start(
+    messages: list[ChatMessage],
+    token_counts: list[int],
+    token_budget: int,
+    trim_step: float = CONTEXT_TRIM_STEP,
+) -> int:
+    """Return the index of the oldest message kept when fitting the newest messages into ``token_budget``.
+
+    Whole messages are dropped from the front, and the window never starts on an AI message so providers that require
+    the conversation to open with a user turn accept it. The tokens dropped are rounded up to whole steps of about
+    ``trim_step`` times the budget, counted from the start of the thread, so the start stays put while the thread
+    grows by less than a step.
+    """
+    excess = sum(token_counts) - token_budget
+    start = 0
+    if excess > 0:
+        # A power of two, so the step does not change with the size of the new prompt, which the budget excludes
+        step = 2 ** int(math.log2(token_budget * trim_step)) if token_budget * trim_step >= 1 else 0
+        to_drop = math.ceil(excess / step) * step if step > 0 else excess
+        dropped = 0
+        while start < len(messages) and dropped < to_drop:
+            dropped += token_counts[start]
+            start += 1
+    while start < len(messages) and messages[start].role == Role.ai:
+        start += 1
+    return start
@@ -0,0 +1,36 @@
+import os
+
+from dotenv import load_dotenv
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from chat_server.metrics import instrument_engine
+
+load_dotenv()
+
+DATABASE_URL = os.environ["DATABASE_URL"]
+
+# Pool sizing is per worker process. Every streaming request only holds a connection while it loads
+# history and while it commits the finished turn, so a small pool serves many concurrent streams.
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", "1800"))
+
+
+def create_engine() -> AsyncEngine:
+    # postgresql+psycopg:// resolves to the psycopg3 async dialect under create_async_engine
+    return create_async_engine(
+        DATABASE_URL,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+    )
+
+
+engine = create_engine()
+instrument_engine(engine)
+# expire_on_commit=False so committed rows can still be read without an implicit (sync) refresh
+async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
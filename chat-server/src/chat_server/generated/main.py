@@ -1,20 +1,30 @@
 # generated by fastapi-codegen:
 #   filename:  openapi.yaml
-#   timestamp: 2025-03-24T14:05:31+00:00
+#   timestamp: 2026-10-18T06:17:06+00:00
 
 from __future__ import annotations
 
-from typing import List, Optional, Union
+from datetime import date
+from typing import Optional, Union
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Header
+from pydantic import conint, constr
 
 from .models import (
+    BatchJob,
+    BatchResultPage,
     ChatMessage,
+    ChatMessagePage,
+    CreateBatchJobRequest,
     Error,
+    SearchMode,
+    SearchResultPage,
     SubmitChatMessageCompareRequest,
     SubmitChatMessageRequest,
     SubmitChatMessageSelectRequest,
     Thread,
+    ThreadPage,
+    UsageReport,
 )
 
 app = FastAPI(
@@ -31,6 +41,84 @@ app = FastAPI(
 )
 
 
+@app.post(
+    '/batch',
+    response_model=None,
+    responses={'202': {'model': BatchJob}, '400': {'model': Error}},
+    tags=['Chat'],
+)
+def create_batch_job(body: CreateBatchJobRequest) -> Optional[Union[BatchJob, Error]]:
+    """
+    Queue a batch job running every prompt on every model
+    """
+    pass
+
+
+@app.get(
+    '/batch/{job_id}',
+    response_model=BatchJob,
+    responses={'404': {'model': Error}},
+    tags=['Chat'],
+)
+def get_batch_job(job_id: str) -> Union[BatchJob, Error]:
+    """
+    Get the progress of a batch job
+    """
+    pass
+
+
+@app.get(
+    '/batch/{job_id}/results',
+    response_model=BatchResultPage,
+    responses={'400': {'model': Error}, '404': {'model': Error}},
+    tags=['Chat'],
+)
+def get_batch_results(
+    limit: Optional[conint(ge=1, le=1000)] = 100,
+    cursor: Optional[str] = None,
+    job_id: str = ...,
+) -> Union[BatchResultPage, Error]:
+    """
+    Get a page of the finished results of a batch job, in prompt order
+    """
+    pass
+
+
+@app.get(
+    '/generation/{generation_id}',
+    response_model=bytes,
+    responses={'404': {'model': Error}},
+    tags=['Chat'],
+)
+def get_generation(
+    after: Optional[str] = '0',
+    last__event__i_d: Optional[str] = Header(None, alias='Last-Event-ID'),
+    generation_id: str = ...,
+) -> Union[bytes, Error]:
+    """
+    Reattach to an in-flight or recently finished generation
+    """
+    pass
+
+
+@app.get(
+    '/search',
+    response_model=SearchResultPage,
+    responses={'400': {'model': Error}, '503': {'model': Error}},
+    tags=['Chat'],
+)
+def search_messages(
+    q: constr(min_length=1),
+    mode: Optional[SearchMode] = None,
+    limit: Optional[conint(ge=1, le=100)] = 20,
+    cursor: Optional[str] = None,
+) -> Union[SearchResultPage, Error]:
+    """
+    Search the messages of all threads
+    """
+    pass
+
+
 @app.post('/thread', response_model=Thread, tags=['Chat'])
 def create_thread() -> Thread:
     """
@@ -39,18 +127,34 @@ def create_thread() -> Thread:
     pass
 
 
-@app.get('/thread', response_model=List[Thread], tags=['Chat'])
-def get_threads() -> List[Thread]:
+@app.get(
+    '/thread',
+    response_model=ThreadPage,
+    responses={'400': {'model': Error}},
+    tags=['Chat'],
+)
+def get_threads(
+    limit: Optional[conint(ge=1, le=100)] = 50, cursor: Optional[str] = None
+) -> Union[ThreadPage, Error]:
     """
-    Get all threads
+    Get a page of threads, newest first
     """
     pass
 
 
-@app.get('/thread/{thread_id}/chat', response_model=List[ChatMessage], tags=['Chat'])
-def get_chat_messages(thread_id: str) -> List[ChatMessage]:
+@app.get(
+    '/thread/{thread_id}/chat',
+    response_model=ChatMessagePage,
+    responses={'400': {'model': Error}, '404': {'model': Error}},
+    tags=['Chat'],
+)
+def get_chat_messages(
+    limit: Optional[conint(ge=1, le=1000)] = 100,
+    cursor: Optional[str] = None,
+    thread_id: str = ...,
+) -> Union[ChatMessagePage, Error]:
     """
-    Get all chat messages
+    Get a page of chat messages, oldest first
     """
     pass
 
@@ -58,7 +162,7 @@ def get_chat_messages(thread_id: str) -> List[ChatMessage]:
 @app.post(
     '/thread/{thread_id}/chat',
     response_model=ChatMessage,
-    responses={'400': {'model': Error}},
+    responses={'400': {'model': Error}, '429': {'model': Error}},
     tags=['Chat'],
 )
 def submit_chat_message(
@@ -73,7 +177,7 @@ def submit_chat_message(
 @app.post(
     '/thread/{thread_id}/chat/compare',
     response_model=bytes,
-    responses={'400': {'model': Error}},
+    responses={'400': {'model': Error}, '429': {'model': Error}},
     tags=['Chat'],
 )
 def submit_chat_message_compare(
@@ -88,7 +192,11 @@ def submit_chat_message_compare(
 @app.post(
     '/thread/{thread_id}/chat/compare/select',
     response_model=None,
-    responses={'400': {'model': Error}},
+    responses={
+        '400': {'model': Error},
+        '404': {'model': Error},
+        '409': {'model': Error},
+    },
     tags=['Chat'],
 )
 def submit_chat_message_select(
@@ -98,3 +206,26 @@ def submit_chat_message_select(
     Submit a chat message selection
     """
     pass
+
+
+@app.get(
+    '/thread/{thread_id}/usage',
+    response_model=UsageReport,
+    responses={'404': {'model': Error}},
+    tags=['Chat'],
+)
+def get_thread_usage(thread_id: str) -> Union[UsageReport, Error]:
+    """
+    Get the token usage and cost of a thread
+    """
+    pass
+
+
+@app.get('/usage', response_model=UsageReport, tags=['Chat'])
+def get_usage(
+    since: Optional[date] = None, until: Optional[date] = None
+) -> UsageReport:
+    """
+    Get the token usage and cost of each model
+    """
+    pass
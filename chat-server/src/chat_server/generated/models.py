@@ -1,6 +1,6 @@
 # generated by fastapi-codegen:
-#   filename:  /Users/chrissreesangkom/ai-chat/api-spec/openapi.yaml
-#   timestamp: 2025-03-24T14:05:31+00:00
+#   filename:  api-spec/openapi.yaml
+#   timestamp: 2026-10-18T06:17:06+00:00
 
 from __future__ import annotations
 
@@ -17,6 +17,13 @@ class Thread(BaseModel):
     created_at: datetime
 
 
+class ThreadPage(BaseModel):
+    items: List[Thread]
+    next_cursor: Optional[str] = Field(
+        None, description='Cursor for the next page, absent on the last page'
+    )
+
+
 class Model(Enum):
     gpt_3_5_turbo = 'gpt-3.5-turbo'
     gpt_4_turbo = 'gpt-4-turbo'
@@ -46,6 +53,116 @@ class ChatMessage(BaseModel):
     )
 
 
+class ChatMessagePage(BaseModel):
+    items: List[ChatMessage]
+    next_cursor: Optional[str] = Field(
+        None, description='Cursor for the next page, absent on the last page'
+    )
+
+
+class SearchMode(Enum):
+    text = 'text'
+    semantic = 'semantic'
+
+
+class SearchResult(BaseModel):
+    message: ChatMessage
+    thread: Thread
+    created_at: datetime = Field(..., description='When the message was sent')
+    score: Optional[float] = Field(
+        None,
+        description='Similarity to the query between -1 and 1, in semantic mode only',
+    )
+
+
+class SearchResultPage(BaseModel):
+    items: List[SearchResult]
+    next_cursor: Optional[str] = Field(
+        None, description='Cursor for the next page, absent on the last page'
+    )
+
+
+class UsageRollup(BaseModel):
+    model: Optional[str] = Field(None, description='The model, absent on the total')
+    generations: int
+    input_tokens: int = Field(..., description='Prompt tokens, including cached ones')
+    cached_input_tokens: int = Field(
+        ..., description="Prompt tokens served from the provider's prompt cache"
+    )
+    output_tokens: int
+    cost_usd: float = Field(
+        ..., description='Estimated cost in US dollars at list prices'
+    )
+    average_latency_seconds: Optional[float] = Field(
+        None,
+        description='Average time to stream a whole response, absent when there are no generations',
+    )
+
+
+class UsageReport(BaseModel):
+    items: List[UsageRollup]
+    total: UsageRollup
+
+
+class CreateBatchJobRequest(BaseModel):
+    prompts: List[str] = Field(
+        ...,
+        description='The prompts to run, each as the only message of a new conversation',
+        min_items=1,
+    )
+    models: List[Model] = Field(
+        ..., description='The models to run every prompt on', min_items=1
+    )
+
+
+class BatchJobStatus(Enum):
+    running = 'running'
+    completed = 'completed'
+
+
+class BatchJob(BaseModel):
+    id: str
+    created_at: datetime
+    models: List[Model]
+    prompt_count: int
+    status: BatchJobStatus
+    pending: int = Field(..., description='Results waiting for a worker')
+    running: int = Field(..., description='Results being generated')
+    done: int = Field(..., description='Results generated')
+    failed: int = Field(
+        ..., description='Results that failed after every retry and fallback'
+    )
+
+
+class BatchResultStatus(Enum):
+    done = 'done'
+    error = 'error'
+
+
+class BatchResult(BaseModel):
+    prompt_index: int = Field(
+        ..., description="The position of the prompt in the job's prompts"
+    )
+    model: Model
+    status: BatchResultStatus
+    response: Optional[str] = Field(
+        None, description='The generated response, when done'
+    )
+    error: Optional[str] = Field(None, description='Why the result failed, on error')
+    input_tokens: Optional[int] = None
+    output_tokens: Optional[int] = None
+    latency_seconds: Optional[float] = Field(
+        None, description='Time to stream the whole response'
+    )
+
+
+class BatchResultPage(BaseModel):
+    items: List[BatchResult]
+    next_cursor: Optional[str] = Field(
+        None, description='Cursor for the next page, absent on the last page'
+    )
+
+
 class SubmitChatMessageRequest(BaseModel):
     content: str
     model: Model = Field(..., description='The model to use for the chat message')
@@ -0,0 +1,245 @@
+import asyncio
+import contextlib
+import os
+from collections.abc import AsyncGenerator, Coroutine
+from dataclasses import dataclass
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from chat_server.generated.models import Model
+from chat_server.utils.logging import logger
+
+GENERATION_TTL_SECONDS = 60 * 60
+# How long a finished generation stays readable, for clients that reattach just after it ends
+GENERATION_FINISHED_TTL_SECONDS = int(os.environ.get("GENERATION_FINISHED_TTL_SECONDS", str(5 * 60)))
+# How long a tailing reader blocks on XREAD before re-checking that the generation still exists
+GENERATION_BLOCK_MILLISECONDS = 15_000
+# How long shutdown waits for detached generations to finish and persist before cancelling them
+GENERATION_DRAIN_TIMEOUT = float(os.environ.get("GENERATION_DRAIN_TIMEOUT", "60"))
+# How long a generation keeps streaming from the provider with no client attached, leaving time to reattach
+GENERATION_ORPHAN_TIMEOUT = float(os.environ.get("GENERATION_ORPHAN_TIMEOUT", "5"))
+# Whether the partial output of a generation stopped for having no client is kept, as a shorter answer
+GENERATION_PERSIST_PARTIAL = os.environ.get("GENERATION_PERSIST_PARTIAL", "false").lower() == "true"
+# How often attached clients renew their attachment and generations check for it; keep it below the orphan timeout
+GENERATION_HEARTBEAT_INTERVAL = float(os.environ.get("GENERATION_HEARTBEAT_INTERVAL", "1"))
+
+EVENT_FIELD = b"event"
+START_EVENT = b"start"
+DONE_EVENT = b"done"
+ERROR_EVENT = b"error"
+MODEL_DONE_EVENT = b"model_done"
+MODEL_ERROR_EVENT = b"model_error"
+
+
+class GenerationNotFoundError(Exception):
+    pass
+
+
+class GenerationFailedError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class GenerationChunk:
+    entry_id: str
+    content: str
+    model: str | None
+    # Set on the entry that ends one model's output in a multi-model generation: "done" or "error"
+    status: str | None = None
+    error: str | None = None
+
+
+class GenerationLog:
+    """Append-only log of an in-flight generation's chunks, kept in a Redis Stream keyed by generation id.
+
+    The generation itself runs detached from any HTTP response and appends every chunk here; clients (the original one,
+    or one reattaching to any replica after a disconnect) read by tailing the stream from an entry id.
+
+    While tailing, a client keeps an attachment key alive that expires ``orphan_timeout`` seconds after its last
+    renewal. A generation whose key has expired has had no client for that long, and is stopped by ``run_attached``
+    rather than paying for output nobody reads, unless it has been pinned because its output is wanted regardless.
+
+    Blocking reads go through ``reader``, which defaults to ``redis`` and should have a pool of its own sized for one
+    connection per attached client.
+    """
+
+    def __init__(
+        self,
+        redis: Redis,
+        reader: Redis | None = None,
+        ttl_seconds: int = GENERATION_TTL_SECONDS,
+        orphan_timeout: float = GENERATION_ORPHAN_TIMEOUT,
+        heartbeat_interval: float = GENERATION_HEARTBEAT_INTERVAL,
+    ) -> None:
+        self.redis = redis
+        self.reader = reader or redis
+        self.ttl_seconds = ttl_seconds
+        self.orphan_timeout = orphan_timeout
+        self.heartbeat_interval = heartbeat_interval
+
+    @staticmethod
+    def key(generation_id: str) -> str:
+        return f"generation:{generation_id}"
+
+    @staticmethod
+    def attached_key(generation_id: str) -> str:
+        return f"generation:{generation_id}:attached"
+
+    @staticmethod
+    def pinned_key(generation_id: str) -> str:
+        return f"generation:{generation_id}:pinned"
+
+    async def start(self, generation_id: str) -> None:
+        # Creating the stream up front lets readers tell a slow first token apart from an unknown generation
+        await self._add(generation_id, {EVENT_FIELD: START_EVENT})
+        # The requesting client counts as attached from the start, before its response begins tailing
+        await self._renew_attachment(generation_id)
+
+    async def append(self, generation_id: str, content: str, model: Model | None = None) -> None:
+        fields = {b"content": content}
+        if model is not None:
+            fields[b"model"] = model.value
+        await self._add(generation_id, fields)
+
+    async def finish_model(self, generation_id: str, model: Model, error: str | None = None) -> None:
+        if error is None:
+            await self._add(generation_id, {EVENT_FIELD: MODEL_DONE_EVENT, b"model": model.value})
+        else:
+            await self._add(generation_id, {EVENT_FIELD: MODEL_ERROR_EVENT, b"model": model.value, b"message": error})
+
+    async def finish(self, generation_id: str, error: str | None = None) -> None:
+        fields = {EVENT_FIELD: DONE_EVENT} if error is None else {EVENT_FIELD: ERROR_EVENT, b"message": error}
+        key = self.key(generation_id)
+        # A finished generation only serves late reattachments, so it gives its memory back well before the full TTL
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.xadd(key, fields)
+            pipe.expire(key, GENERATION_FINISHED_TTL_SECONDS)
+            pipe.expire(self.pinned_key(generation_id), GENERATION_FINISHED_TTL_SECONDS)
+            await pipe.execute()
+
+    async def pin(self, generation_id: str) -> None:
+        """Keep the generation running to the end, whether or not any client is attached."""
+        await self.redis.set(self.pinned_key(generation_id), 1, ex=self.ttl_seconds)
+
+    async def exists(self, generation_id: str) -> bool:
+        return await self.redis.exists(self.key(generation_id)) > 0
+
+    async def tail(self, generation_id: str, after: str = "0") -> AsyncGenerator[GenerationChunk, None]:
+        """Yield chunks after entry id ``after`` until the generation finishes, waiting for live ones as needed.
+
+        The caller counts as attached to the generation until it stops iterating.
+        """
+        heartbeat = asyncio.create_task(self._keep_attached(generation_id))
+        try:
+            async for chunk in self._tail(generation_id, after):
+                yield chunk
+        finally:
+            # Not awaited: when the client disconnects, this runs in a cancelled scope where any await fails
+            heartbeat.cancel()
+
+    async def run_attached(self, generation_id: str, coroutine: Coroutine[None, None, None]) -> bool:
+        """Run ``coroutine`` until it finishes, or cancel it once no client has been attached for ``orphan_timeout``.
+
+        Return whether it finished. Cancelling it closes the provider streams it reads from.
+        """
+        task = asyncio.create_task(coroutine)
+        try:
+            while True:
+                done, _ = await asyncio.wait({task}, timeout=self.heartbeat_interval)
+                if done:
+                    task.result()
+                    return True
+                if not await self._is_attached(generation_id):
+                    logger.info(f"Cancelling generation {generation_id}: no client attached")
+                    return False
+        finally:
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+
+    async def _tail(self, generation_id: str, after: str) -> AsyncGenerator[GenerationChunk, None]:
+        key = self.key(generation_id)
+        last_id = after
+        while True:
+            response = await self.reader.xread({key: last_id}, block=GENERATION_BLOCK_MILLISECONDS)
+            if not response:
+                if not await self.redis.exists(key):
+                    generation_not_found_error = f"Generation not found: {generation_id}"
+                    raise GenerationNotFoundError(generation_not_found_error)
+                continue
+            for entry_id, fields in response[0][1]:
+                last_id = entry_id
+                event = fields.get(EVENT_FIELD)
+                if event == START_EVENT:
+                    continue
+                if event == DONE_EVENT:
+                    return
+                if event == ERROR_EVENT:
+                    raise GenerationFailedError(fields[b"message"].decode("utf-8"))
+                yield _to_chunk(entry_id, fields)
+
+    async def _keep_attached(self, generation_id: str) -> None:
+        while True:
+            try:
+                await self._renew_attachment(generation_id)
+            except RedisError as e:
+                # Missing a renewal only matters if the next ones fail too, and then the reads fail as well
+                logger.warning(f"Failed to renew attachment to generation {generation_id}: {e}")
+            await asyncio.sleep(self.heartbeat_interval)
+
+    async def _renew_attachment(self, generation_id: str) -> None:
+        await self.redis.set(self.attached_key(generation_id), 1, px=max(1, int(self.orphan_timeout * 1000)))
+
+    async def _is_attached(self, generation_id: str) -> bool:
+        try:
+            return await self.redis.exists(self.attached_key(generation_id), self.pinned_key(generation_id)) > 0
+        except RedisError as e:
+            # Never cancel a generation on an error that says nothing about its clients
+            logger.warning(f"Failed to check attachment to generation {generation_id}: {e}")
+            return True
+
+    async def _add(self, generation_id: str, fields: dict[bytes, bytes | str]) -> None:
+        key = self.key(generation_id)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.xadd(key, fields)
+            pipe.expire(key, self.ttl_seconds)
+            await pipe.execute()
+
+
+def _to_chunk(entry_id: bytes, fields: dict[bytes, bytes]) -> GenerationChunk:
+    model = fields.get(b"model")
+    event = fields.get(EVENT_FIELD)
+    error = fields.get(b"message")
+    return GenerationChunk(
+        entry_id=entry_id.decode("utf-8"),
+        content=fields.get(b"content", b"").decode("utf-8"),
+        model=model.decode("utf-8") if model is not None else None,
+        status={MODEL_DONE_EVENT: "done", MODEL_ERROR_EVENT: "error"}.get(event),
+        error=error.decode("utf-8") if error is not None else None,
+    )
+
+
+# Detached generations are referenced here so they are not garbage collected while no client is attached
+running_generations: set[asyncio.Task] = set()
+
+
+def run_detached(coroutine: Coroutine[None, None, None]) -> asyncio.Task:
+    task = asyncio.create_task(coroutine)
+    running_generations.add(task)
+    task.add_done_callback(running_generations.discard)
+    return task
+
+
+async def drain_generations(timeout: float = GENERATION_DRAIN_TIMEOUT) -> None:
+    """Wait for running generations to finish, then cancel the ones still running after ``timeout`` seconds."""
+    if not running_generations:
+        return
+    logger.info(f"Waiting for {len(running_generations)} running generations to finish")
+    _, pending = await asyncio.wait(set(running_generations), timeout=timeout)
+    if not pending:
+        return
+    logger.warning(f"Cancelling {len(pending)} generations still running after {timeout:.0f}s")
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
@@ -0,0 +1,42 @@
+import asyncio
+import os
+from collections.abc import Awaitable
+
+from sqlalchemy import text
+
+from chat_server.db import engine
+from chat_server.redis_pool import redis_client, response_cache_redis_client
+
+HEALTH_CHECK_TIMEOUT = float(os.environ.get("HEALTH_CHECK_TIMEOUT", "2"))
+
+HEALTHY = "ok"
+
+
+async def check_dependencies(timeout: float = HEALTH_CHECK_TIMEOUT) -> dict[str, str]:
+    """Check every backing service concurrently, mapping each to ``HEALTHY`` or the reason it is unavailable.
+
+    A check borrows a connection from the worker's pool like any request would, so an exhausted pool fails the check
+    by timing out even when the service itself is up.
+    """
+    checks = {
+        "database": _ping_database(),
+        "redis": redis_client.ping(),
+        "response_cache_redis": response_cache_redis_client.ping(),
+    }
+    results = await asyncio.gather(*(_run_check(check, timeout) for check in checks.values()))
+    return dict(zip(checks, results, strict=True))
+
+
+async def _run_check(check: Awaitable[object], timeout: float) -> str:
+    try:
+        await asyncio.wait_for(check, timeout)
+    except asyncio.TimeoutError:
+        return f"Timed out after {timeout:.1f}s"
+    except Exception as e:  # noqa: BLE001
+        return str(e) or type(e).__name__
+    return HEALTHY
+
+
+async def _ping_database() -> None:
+    async with engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
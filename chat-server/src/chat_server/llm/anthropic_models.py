@@ -1,44 +1,90 @@
 from collections.abc import AsyncGenerator
 
-from anthropic import AsyncAnthropic
+import anthropic
+from anthropic.types.cache_control_ephemeral_param import CacheControlEphemeralParam
 from anthropic.types.message_param import MessageParam
+from anthropic.types.text_block_param import TextBlockParam
 
 from chat_server.generated.models import ChatMessage, Model, Role
-from chat_server.llm.llm import LLM, InvalidMessageRoleError
+from chat_server.llm.clients import provider_clients
+from chat_server.llm.llm import LLM, InvalidMessageRoleError, Usage, is_retryable_status
 
 
 class AnthropicModels(LLM):
-    def __init__(self, model_name: Model) -> None:
+    def __init__(self, model_name: Model, max_tokens: int, *, prompt_caching: bool = False) -> None:
         self.model_name = model_name.value
+        self.max_tokens = max_tokens
+        self.prompt_caching = prompt_caching
 
-    def convert_messages(self, messages: list[ChatMessage]) -> list[MessageParam]:
-        formatted_messages = []
-        for m in messages:
-            if m.role == Role.user:
-                formatted_messages.append(
-                    MessageParam(
-                        content=m.content,
-                        role="user",
-                    )
-                )
-            elif m.role == Role.ai:
-                formatted_messages.append(
-                    MessageParam(
-                        content=m.content,
-                        role="assistant",
-                    )
-                )
-            else:
-                invalid_message_role_error = f"Invalid message role: {m.role}"
-                raise InvalidMessageRoleError(invalid_message_role_error)
-        return formatted_messages
+    def convert_message(self, message: ChatMessage) -> MessageParam:
+        if message.role == Role.user:
+            return MessageParam(
+                content=message.content,
+                role="user",
+            )
+        if message.role == Role.ai:
+            return MessageParam(
+                content=message.content,
+                role="assistant",
+            )
+        invalid_message_role_error = f"Invalid message role: {message.role}"
+        raise InvalidMessageRoleError(invalid_message_role_error)
+
+    def format_messages(
+        self,
+        messages: list[ChatMessage],
+        history: list[MessageParam] | None = None,
+    ) -> list[MessageParam]:
+        """Format the request, marking the thread's stable prefix with prompt cache breakpoints.
+
+        The breakpoint on the last message writes the whole prompt to the cache, to be read by the next turn, whose
+        prompt extends it. The one on the last earlier user message, where the previous turn's prompt ended, reads what
+        that turn wrote. Breakpoints are added here rather than when converting messages, because converted history is
+        cached and shared between turns whose breakpoints differ.
+        """
+        formatted = super().format_messages(messages, history)
+        if not self.prompt_caching or not formatted:
+            return formatted
+        breakpoints = {len(formatted) - 1}
+        earlier_user_messages = [i for i, message in enumerate(formatted[:-1]) if message["role"] == "user"]
+        if earlier_user_messages:
+            breakpoints.add(earlier_user_messages[-1])
+        return [_with_cache_breakpoint(m) if i in breakpoints else m for i, m in enumerate(formatted)]
 
-    async def response_generator(self, messages: list[MessageParam]) -> AsyncGenerator[str, None]:
-        client = AsyncAnthropic()
+    def is_retryable(self, error: Exception) -> bool:
+        if isinstance(error, anthropic.APIConnectionError):
+            return True
+        return isinstance(error, anthropic.APIStatusError) and is_retryable_status(error.status_code)
+
+    async def response_generator(
+        self,
+        messages: list[MessageParam],
+        usage: Usage | None = None,
+    ) -> AsyncGenerator[str, None]:
+        client = provider_clients.get_anthropic()
         async with client.messages.stream(
-            max_tokens=1024,
+            max_tokens=self.max_tokens,
             model=self.model_name,
             messages=messages,
         ) as stream:
             async for text in stream.text_stream:
                 yield text
+            if usage is not None:
+                final_usage = (await stream.get_final_message()).usage
+                # Anthropic counts cache reads and writes separately from the rest of the input
+                cache_read_tokens = final_usage.cache_read_input_tokens or 0
+                cache_write_tokens = final_usage.cache_creation_input_tokens or 0
+                usage.add(
+                    input_tokens=final_usage.input_tokens + cache_read_tokens + cache_write_tokens,
+                    output_tokens=final_usage.output_tokens,
+                    cached_input_tokens=cache_read_tokens,
+                    cache_write_input_tokens=cache_write_tokens,
+                )
+
+
+def _with_cache_breakpoint(message: MessageParam) -> MessageParam:
+    # A copy, since history messages are shared with the thread context cache
+    content = message["content"]
+    blocks = [TextBlockParam(type="text", text=content)] if isinstance(content, str) else list(content)
+    blocks[-1] = {**blocks[-1], "cache_control": CacheControlEphemeralParam(type="ephemeral")}
+    return MessageParam(content=blocks, role=message["role"])
@@ -0,0 +1,87 @@
+import os
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+import httpx
+
+if TYPE_CHECKING:
+    from anthropic import AsyncAnthropic
+    from openai import AsyncOpenAI
+
+LLM_CONNECT_TIMEOUT = float(os.environ.get("LLM_CONNECT_TIMEOUT", "5"))
+# Also bounds the gap between two streamed chunks, so a stalled stream fails instead of hanging
+LLM_READ_TIMEOUT = float(os.environ.get("LLM_READ_TIMEOUT", "60"))
+
+
+@dataclass(frozen=True)
+class ConnectionLimits:
+    max_connections: int
+    max_keepalive_connections: int
+    keepalive_expiry: float
+
+    @classmethod
+    def from_env(cls, prefix: str) -> "ConnectionLimits":
+        return cls(
+            max_connections=int(os.environ.get(f"{prefix}_MAX_CONNECTIONS", "100")),
+            max_keepalive_connections=int(os.environ.get(f"{prefix}_MAX_KEEPALIVE_CONNECTIONS", "20")),
+            keepalive_expiry=float(os.environ.get(f"{prefix}_KEEPALIVE_EXPIRY", "30")),
+        )
+
+    def to_httpx(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+
+class ProviderClients:
+    """Process-wide provider SDK clients, so every request reuses the same connection pools.
+
+    Clients are created on first use, so a deployment configured with a single provider's API key still starts, and
+    are closed by the application lifespan on shutdown. Each SDK is imported only when its client is first created,
+    since importing both is about half of the server's import time. SDK retries are disabled; retries are decided by
+    ``chat_server.llm.resilience`` so they never happen after output has been streamed.
+    """
+
+    def __init__(self) -> None:
+        self.timeout = httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT)
+        self._openai: AsyncOpenAI | None = None
+        self._anthropic: AsyncAnthropic | None = None
+
+    def get_openai(self) -> "AsyncOpenAI":
+        if self._openai is None:
+            from openai import AsyncOpenAI  # noqa: PLC0415
+            from openai import DefaultAsyncHttpxClient as OpenAIHttpxClient  # noqa: PLC0415
+
+            limits = ConnectionLimits.from_env("OPENAI")
+            self._openai = AsyncOpenAI(
+                http_client=OpenAIHttpxClient(limits=limits.to_httpx()),
+                timeout=self.timeout,
+                max_retries=0,
+            )
+        return self._openai
+
+    def get_anthropic(self) -> "AsyncAnthropic":
+        if self._anthropic is None:
+            from anthropic import AsyncAnthropic  # noqa: PLC0415
+            from anthropic import DefaultAsyncHttpxClient as AnthropicHttpxClient  # noqa: PLC0415
+
+            limits = ConnectionLimits.from_env("ANTHROPIC")
+            self._anthropic = AsyncAnthropic(
+                http_client=AnthropicHttpxClient(limits=limits.to_httpx()),
+                timeout=self.timeout,
+                max_retries=0,
+            )
+        return self._anthropic
+
+    async def aclose(self) -> None:
+        if self._openai is not None:
+            await self._openai.close()
+            self._openai = None
+        if self._anthropic is not None:
+            await self._anthropic.close()
+            self._anthropic = None
+
+
+provider_clients = ProviderClients()
@@ -1,7 +1,9 @@
+import os
+from dataclasses import dataclass
+from functools import cache
+
 from chat_server.generated.models import Model
-from chat_server.llm.anthropic_models import AnthropicModels
 from chat_server.llm.llm import LLM
-from chat_server.llm.openai_models import OpenAIModels
 
 OPENAI_MODELS = [
     Model.gpt_3_5_turbo,
@@ -20,16 +22,78 @@ ANTHROPIC_MODELS = [
     Model.claude_3_5_sonnet_20241022,
     Model.claude_3_7_sonnet_20250219,
 ]
+# Anthropic models that accept prompt cache breakpoints; OpenAI caches prompt prefixes automatically
+PROMPT_CACHING_MODELS = [
+    Model.claude_3_opus_20240229,
+    Model.claude_3_5_haiku_20241022,
+    Model.claude_3_5_sonnet_20241022,
+    Model.claude_3_7_sonnet_20250219,
+]
+PROMPT_CACHING_ENABLED = os.environ.get("PROMPT_CACHING_ENABLED", "true").lower() == "true"
+
+
+@dataclass(frozen=True)
+class ModelLimits:
+    context_window: int
+    # Tokens reserved for the response; the rest of the context window is the budget for history plus the new prompt
+    max_output_tokens: int
+
+    @property
+    def input_budget(self) -> int:
+        return self.context_window - self.max_output_tokens
+
+
+MODEL_LIMITS = {
+    Model.gpt_3_5_turbo: ModelLimits(context_window=16_385, max_output_tokens=4_096),
+    Model.gpt_4_turbo: ModelLimits(context_window=128_000, max_output_tokens=4_096),
+    Model.gpt_4o: ModelLimits(context_window=128_000, max_output_tokens=16_384),
+    Model.gpt_4o_mini: ModelLimits(context_window=128_000, max_output_tokens=16_384),
+    Model.gpt_4_5_preview: ModelLimits(context_window=128_000, max_output_tokens=16_384),
+    Model.o1: ModelLimits(context_window=200_000, max_output_tokens=100_000),
+    Model.o1_mini: ModelLimits(context_window=128_000, max_output_tokens=65_536),
+    Model.o3_mini: ModelLimits(context_window=200_000, max_output_tokens=100_000),
+    # Anthropic responses are capped at the max_tokens we request, so only that much needs reserving
+    Model.claude_2_1: ModelLimits(context_window=200_000, max_output_tokens=1_024),
+    Model.claude_3_opus_20240229: ModelLimits(context_window=200_000, max_output_tokens=1_024),
+    Model.claude_3_5_haiku_20241022: ModelLimits(context_window=200_000, max_output_tokens=1_024),
+    Model.claude_3_5_sonnet_20241022: ModelLimits(context_window=200_000, max_output_tokens=1_024),
+    Model.claude_3_7_sonnet_20250219: ModelLimits(context_window=200_000, max_output_tokens=1_024),
+}
 
 
 class InvalidModelError(Exception):
     pass
 
 
+def provider_for(model_name: Model) -> str:
+    if model_name in OPENAI_MODELS:
+        return "openai"
+    if model_name in ANTHROPIC_MODELS:
+        return "anthropic"
+    invalid_model_error = f"Invalid model name: {model_name}"
+    raise InvalidModelError(invalid_model_error)
+
+
+@cache
 def llm_factory(model_name: Model) -> LLM:
+    # Provider modules import their SDK, so each is only loaded once one of its models is first used
     if model_name in OPENAI_MODELS:
+        from chat_server.llm.openai_models import OpenAIModels  # noqa: PLC0415
+
         return OpenAIModels(model_name)
     if model_name in ANTHROPIC_MODELS:
-        return AnthropicModels(model_name)
+        from chat_server.llm.anthropic_models import AnthropicModels  # noqa: PLC0415
+
+        return AnthropicModels(
+            model_name,
+            max_tokens=MODEL_LIMITS[model_name].max_output_tokens,
+            prompt_caching=PROMPT_CACHING_ENABLED and model_name in PROMPT_CACHING_MODELS,
+        )
     invalid_model_error = f"Invalid model name: {model_name}"
     raise InvalidModelError(invalid_model_error)
+
+
+def import_provider_modules() -> None:
+    """Import every provider module, and with it its SDK, ahead of the first request that needs one."""
+    import chat_server.llm.anthropic_models  # noqa: PLC0415
+    import chat_server.llm.openai_models  # noqa: F401, PLC0415
@@ -1,25 +1,74 @@
 from abc import ABC, abstractmethod
 from collections.abc import AsyncGenerator
+from dataclasses import dataclass
 from typing import Generic, TypeVar
 
 from chat_server.generated.models import ChatMessage
 
 T = TypeVar("T")
 
+# Request timeout, conflict and rate limit; any 5xx is retryable too
+RETRYABLE_STATUS_CODES = frozenset({408, 409, 429})
+
 
 class InvalidMessageRoleError(Exception):
     pass
 
 
+@dataclass
+class Usage:
+    """Tokens that providers reported for a generation, added to as each of its provider streams ends."""
+
+    input_tokens: int = 0
+    # The part of input_tokens read from the provider's prompt cache, billed at a discount
+    cached_input_tokens: int = 0
+    # The part of input_tokens written to the prompt cache, which some providers bill at a premium
+    cache_write_input_tokens: int = 0
+    output_tokens: int = 0
+    # The prompt's size as estimated when its stream was opened, for a stream that stops before the provider reports
+    estimated_input_tokens: int = 0
+
+    def add(
+        self,
+        input_tokens: int,
+        output_tokens: int,
+        cached_input_tokens: int = 0,
+        cache_write_input_tokens: int = 0,
+    ) -> None:
+        self.input_tokens += input_tokens
+        self.cached_input_tokens += cached_input_tokens
+        self.cache_write_input_tokens += cache_write_input_tokens
+        self.output_tokens += output_tokens
+
+
 class LLM(ABC, Generic[T]):
     @abstractmethod
-    def convert_messages(self, messages: list[ChatMessage]) -> T:
+    def convert_message(self, message: ChatMessage) -> T:
         pass
 
     @abstractmethod
-    async def response_generator(self, messages: T) -> AsyncGenerator[str, None]:
-        pass
+    async def response_generator(self, messages: list[T], usage: Usage | None = None) -> AsyncGenerator[str, None]:
+        """Stream the response to ``messages``, adding the provider's token counts to ``usage`` once it ends."""
+
+    def is_retryable(self, error: Exception) -> bool:  # noqa: ARG002
+        """Whether a request that failed with ``error`` before streaming any output may be retried."""
+        return False
+
+    def convert_messages(self, messages: list[ChatMessage]) -> list[T]:
+        return [self.convert_message(m) for m in messages]
+
+    def format_messages(self, messages: list[ChatMessage], history: list[T] | None = None) -> list[T]:
+        # history is already in provider format (e.g. from the thread context cache) and is not converted again
+        return [*(history or []), *self.convert_messages(messages)]
+
+    def get_stream_generator(
+        self,
+        messages: list[ChatMessage],
+        history: list[T] | None = None,
+        usage: Usage | None = None,
+    ) -> AsyncGenerator[str, None]:
+        return self.response_generator(self.format_messages(messages, history), usage)
+
 
-    def get_stream_generator(self, messages: list[ChatMessage]) -> AsyncGenerator[str, None]:
-        formatted_messages = self.convert_messages(messages)
-        return self.response_generator(formatted_messages)
+def is_retryable_status(status_code: int) -> bool:
+    return status_code in RETRYABLE_STATUS_CODES or status_code >= 500  # noqa: PLR2004
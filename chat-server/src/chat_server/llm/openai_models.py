@@ -1,6 +1,6 @@
 from collections.abc import AsyncGenerator
 
-from openai import AsyncOpenAI
+import openai
 from openai.types.chat import (
     ChatCompletionAssistantMessageParam,
     ChatCompletionMessageParam,
@@ -8,43 +8,55 @@ from openai.types.chat import (
 )
 
 from chat_server.generated.models import ChatMessage, Model, Role
-from chat_server.llm.llm import LLM, InvalidMessageRoleError
+from chat_server.llm.clients import provider_clients
+from chat_server.llm.llm import LLM, InvalidMessageRoleError, Usage, is_retryable_status
+
 
 class OpenAIModels(LLM):
     def __init__(self, model_name: Model) -> None:
         self.model_name = model_name.value
 
-    def convert_messages(self, messages: list[ChatMessage]) -> list[ChatCompletionMessageParam]:
-        formatted_messages = []
-        for m in messages:
-            if m.role == Role.user:
-                formatted_messages.append(
-                    ChatCompletionUserMessageParam(
-                        content=m.content,
-                        role="user",
-                    )
-                )
-            elif m.role == Role.ai:
-                formatted_messages.append(
-                    ChatCompletionAssistantMessageParam(
-                        content=m.content,
-                        role="assistant",
-                    )
-                )
-            else:
-                invalid_message_role_error = f"Invalid message role: {m.role}"
-                raise InvalidMessageRoleError(invalid_message_role_error)
-        return formatted_messages
+    def convert_message(self, message: ChatMessage) -> ChatCompletionMessageParam:
+        if message.role == Role.user:
+            return ChatCompletionUserMessageParam(
+                content=message.content,
+                role="user",
+            )
+        if message.role == Role.ai:
+            return ChatCompletionAssistantMessageParam(
+                content=message.content,
+                role="assistant",
+            )
+        invalid_message_role_error = f"Invalid message role: {message.role}"
+        raise InvalidMessageRoleError(invalid_message_role_error)
 
-    async def response_generator(self, messages: list[ChatCompletionMessageParam]) -> AsyncGenerator[str, None]:
-        client = AsyncOpenAI()
+    def is_retryable(self, error: Exception) -> bool:
+        if isinstance(error, openai.APIConnectionError):
+            return True
+        return isinstance(error, openai.APIStatusError) and is_retryable_status(error.status_code)
+
+    async def response_generator(
+        self,
+        messages: list[ChatCompletionMessageParam],
+        usage: Usage | None = None,
+    ) -> AsyncGenerator[str, None]:
+        client = provider_clients.get_openai()
         stream = await client.chat.completions.create(
             model=self.model_name,
             messages=messages,
             stream=True,
+            # Usage arrives in one last chunk, without choices, after the one that finishes the response
+            stream_options={"include_usage": True},
         )
-        async for chunk in stream:
-            if chunk.choices[0].finish_reason == "stop":
-                break
-            if chunk.choices[0].delta.content:
-                yield chunk.choices[0].delta.content
+        # Closing the stream closes the connection, so a generation that stops early stops the provider too
+        async with stream:
+            async for chunk in stream:
+                if chunk.usage is not None and usage is not None:
+                    details = chunk.usage.prompt_tokens_details
+                    usage.add(
+                        input_tokens=chunk.usage.prompt_tokens,
+                        output_tokens=chunk.usage.completion_tokens,
+                        cached_input_tokens=(details.cached_tokens or 0) if details is not None else 0,
+                    )
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
@@ -0,0 +1,215 @@
+import asyncio
+import contextlib
+import os
+import random
+from collections import defaultdict, deque
+from collections.abc import AsyncGenerator, AsyncIterator, Callable
+from dataclasses import dataclass
+
+from chat_server.generated.models import Model
+from chat_server.llm.llm import LLM
+from chat_server.llm.scheduler import Lease, Priority, SchedulerRejectedError, llm_scheduler
+from chat_server.utils.logging import sampled_logger
+
+LLM_FIRST_TOKEN_TIMEOUT = float(os.environ.get("LLM_FIRST_TOKEN_TIMEOUT", "30"))
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_DELAY = float(os.environ.get("LLM_RETRY_BASE_DELAY", "0.5"))
+LLM_RETRY_MAX_DELAY = float(os.environ.get("LLM_RETRY_MAX_DELAY", "4"))
+# Percentile of recent time-to-first-token after which a second, hedged attempt is raced against the first; unset
+# disables hedging
+LLM_HEDGE_PERCENTILE = os.environ.get("LLM_HEDGE_PERCENTILE")
+LLM_HEDGE_MIN_SAMPLES = int(os.environ.get("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_TTFT_WINDOW = int(os.environ.get("LLM_TTFT_WINDOW", "200"))
+# Comma-separated model=fallback pairs, e.g. "o1=claude-3-5-sonnet-20241022"
+LLM_FALLBACK_MODELS = {
+    Model(model.strip()): Model(fallback.strip())
+    for model, _, fallback in (
+        pair.partition("=") for pair in os.environ.get("LLM_FALLBACK_MODELS", "").split(",") if pair.strip()
+    )
+}
+# How long a request that is falling back waits for a scheduler slot on the fallback model before giving up
+LLM_FALLBACK_QUEUE_TIMEOUT = float(os.environ.get("LLM_FALLBACK_QUEUE_TIMEOUT", "1"))
+
+
+class FirstTokenTimeoutError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class StreamPolicy:
+    first_token_timeout: float = LLM_FIRST_TOKEN_TIMEOUT
+    max_retries: int = LLM_MAX_RETRIES
+    retry_base_delay: float = LLM_RETRY_BASE_DELAY
+    retry_max_delay: float = LLM_RETRY_MAX_DELAY
+    hedge_percentile: float | None = float(LLM_HEDGE_PERCENTILE) if LLM_HEDGE_PERCENTILE else None
+    hedge_min_samples: int = LLM_HEDGE_MIN_SAMPLES
+
+    def backoff(self, retry: int) -> float:
+        # Full jitter, so retries after a shared outage do not arrive in lockstep
+        return random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * 2 ** (retry - 1)))  # noqa: S311
+
+
+class FirstTokenLatencies:
+    """Recent time-to-first-token per model, used to decide when an attempt is slow enough to hedge."""
+
+    def __init__(self, window: int = LLM_TTFT_WINDOW) -> None:
+        self._samples: defaultdict[Model, deque[float]] = defaultdict(lambda: deque(maxlen=window))
+
+    def record(self, model: Model, seconds: float) -> None:
+        self._samples[model].append(seconds)
+
+    def percentile(self, model: Model, percentile: float, min_samples: int) -> float | None:
+        samples = self._samples[model]
+        if len(samples) < min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(percentile * len(ordered)))]
+
+
+first_token_latencies = FirstTokenLatencies()
+
+
+class ResilientStream:
+    """A provider stream that retries, hedges and falls back until it has produced its first chunk.
+
+    Each attempt must produce its first chunk within ``first_token_timeout``. Failures before that point are retried
+    with jittered backoff when the model's ``LLM.is_retryable`` allows it. Once retries are used up, the ``fallback``
+    model, if any, gets the same treatment, under a scheduler slot of its own that is held until the stream ends; if
+    no slot frees up within ``LLM_FALLBACK_QUEUE_TIMEOUT`` the stream fails as the requested model did. With hedging
+    enabled, an attempt slower than the configured percentile of recent time-to-first-token is raced against a second
+    one, and the slower of the two is cancelled. Once a chunk has been yielded nothing is retried, so the client never
+    sees output repeated; ``model`` is the model that answered.
+    """
+
+    def __init__(
+        self,
+        model: Model,
+        llm_for: Callable[[Model], LLM],
+        open_stream: Callable[[LLM, Model], AsyncIterator[str]],
+        *,
+        fallback: Model | None = None,
+        policy: StreamPolicy | None = None,
+    ) -> None:
+        self.requested = model
+        self.model = model
+        self.fallback = fallback
+        self.llm_for = llm_for
+        self.open_stream = open_stream
+        self.policy = policy or StreamPolicy()
+        self.latencies = first_token_latencies
+        self.scheduler = llm_scheduler
+
+    def __aiter__(self) -> AsyncIterator[str]:
+        """Each iteration is a new request to the provider."""
+        return self._generate()
+
+    async def _generate(self) -> AsyncGenerator[str, None]:
+        models = [self.requested] if self.fallback is None else [self.requested, self.fallback]
+        error: Exception | None = None
+        fallback_lease: Lease | None = None
+        try:
+            for model in models:
+                if model is not self.requested:
+                    sampled_logger.warning(f"{self.requested.value} is unavailable, falling back to {model.value}")
+                    fallback_lease = await self._acquire_fallback(model, error)
+                llm = self.llm_for(model)
+                for attempt in range(self.policy.max_retries + 1):
+                    if attempt:
+                        await asyncio.sleep(self.policy.backoff(attempt))
+                    try:
+                        iterator, first_chunk = await self._first_chunk(llm, model)
+                    except Exception as e:
+                        if not isinstance(e, FirstTokenTimeoutError) and not llm.is_retryable(e):
+                            raise
+                        sampled_logger.warning(
+                            f"Attempt {attempt + 1} for {model.value} failed before first token: {e}",
+                        )
+                        error = e
+                        continue
+
+                    self.model = model
+                    try:
+                        if first_chunk is None:
+                            return
+                        yield first_chunk
+                        async for chunk in iterator:
+                            yield chunk
+                    finally:
+                        await _close(iterator)
+                    return
+            raise error
+        finally:
+            if fallback_lease is not None:
+                fallback_lease.release()
+
+    async def _acquire_fallback(self, model: Model, error: Exception) -> Lease:
+        """Take a scheduler slot on the fallback model, or fail with the requested model's ``error`` if none is free."""
+        try:
+            # Only single chats fall back
+            return await self.scheduler.acquire(model, Priority.interactive, timeout=LLM_FALLBACK_QUEUE_TIMEOUT)
+        except SchedulerRejectedError as e:
+            sampled_logger.warning(f"No slot for fallback {model.value}: {e}")
+            raise error from e
+
+    async def _first_chunk(self, llm: LLM, model: Model) -> tuple[AsyncIterator[str], str | None]:
+        """Start an attempt, hedging it if it is slow, and return the first attempt to produce a chunk.
+
+        The chunk is None for a stream that ended without output.
+        """
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        deadline = started + self.policy.first_token_timeout
+        hedge_at = None
+        if self.policy.hedge_percentile is not None:
+            delay = self.latencies.percentile(model, self.policy.hedge_percentile, self.policy.hedge_min_samples)
+            hedge_at = None if delay is None else started + delay
+
+        attempts: dict[asyncio.Future, AsyncIterator[str]] = {}
+
+        def launch() -> None:
+            iterator = aiter(self.open_stream(llm, model))
+            attempts[asyncio.ensure_future(anext(iterator, None))] = iterator
+
+        launch()
+        error: Exception | None = None
+        try:
+            while attempts:
+                wake_at = deadline if hedge_at is None else min(deadline, hedge_at)
+                done, _ = await asyncio.wait(
+                    attempts,
+                    timeout=max(0.0, wake_at - loop.time()),
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    if hedge_at is not None and loop.time() < deadline:
+                        waited = loop.time() - started
+                        sampled_logger.info(f"Hedging {model.value} after {waited:.2f}s without a first token")
+                        hedge_at = None
+                        launch()
+                        continue
+                    first_token_timeout_error = (
+                        f"No first token from {model.value} within {self.policy.first_token_timeout}s"
+                    )
+                    raise FirstTokenTimeoutError(first_token_timeout_error)
+                for attempt in done:
+                    iterator = attempts.pop(attempt)
+                    if attempt.exception() is None:
+                        self.latencies.record(model, loop.time() - started)
+                        return iterator, attempt.result()
+                    error = attempt.exception()
+                    await _close(iterator)
+            # Every attempt failed; a hedge that has not started yet is not worth starting
+            raise error
+        finally:
+            for attempt, iterator in attempts.items():
+                attempt.cancel()
+                with contextlib.suppress(BaseException):
+                    await attempt
+                await _close(iterator)
+
+
+async def _close(iterator: AsyncIterator[str]) -> None:
+    aclose = getattr(iterator, "aclose", None)
+    if aclose is not None:
+        with contextlib.suppress(Exception):
+            await aclose()
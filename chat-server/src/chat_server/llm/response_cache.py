@@ -0,0 +1,97 @@
+import asyncio
+import contextlib
+import hashlib
+import json
+import os
+import time
+from collections.abc import AsyncGenerator
+
+from redis.asyncio import Redis
+
+from chat_server.generated.models import ChatMessage, Model
+from chat_server.llm.llm import LLM, Usage
+from chat_server.metrics import CACHE_REQUESTS
+from chat_server.utils.logging import logger
+
+RESPONSE_CACHE_TTL_SECONDS = int(os.environ.get("RESPONSE_CACHE_TTL_SECONDS", str(24 * 60 * 60)))
+# Longest pause a replay keeps between two chunks, so a hit is paced like a live stream yet never as slow as a provider
+RESPONSE_CACHE_REPLAY_MAX_GAP = float(os.environ.get("RESPONSE_CACHE_REPLAY_MAX_GAP", "0.05"))
+# Comma-separated model values whose responses may be replayed; sampling models only belong here if a repeated answer
+# to an identical conversation is acceptable
+RESPONSE_CACHE_MODELS = frozenset(
+    Model(value) for value in os.environ.get("RESPONSE_CACHE_MODELS", "").split(",") if value.strip()
+)
+
+
+class ResponseCache:
+    """Content-addressed cache of streamed responses, keyed by model and the exact provider-format conversation.
+
+    Entries live with a TTL on a Redis instance of their own, and are evicted LRU under its maxmemory policy. A hit
+    replays the chunks the provider originally streamed, so clients see the same chunking without a provider call, with
+    the provider's pause before each chunk after the first, up to ``replay_max_gap`` seconds.
+    """
+
+    def __init__(
+        self,
+        redis: Redis,
+        models: frozenset[Model] = RESPONSE_CACHE_MODELS,
+        ttl_seconds: int = RESPONSE_CACHE_TTL_SECONDS,
+        replay_max_gap: float = RESPONSE_CACHE_REPLAY_MAX_GAP,
+    ) -> None:
+        self.redis = redis
+        self.models = models
+        self.ttl_seconds = ttl_seconds
+        self.replay_max_gap = replay_max_gap
+
+    def get_stream_generator(
+        self,
+        model: Model,
+        llm: LLM,
+        messages: list[ChatMessage],
+        history: list | None = None,
+        usage: Usage | None = None,
+    ) -> AsyncGenerator[str, None]:
+        """Stream the response, from the cache when possible; a replayed response adds nothing to ``usage``."""
+        formatted_messages = llm.format_messages(messages, history)
+        if model not in self.models:
+            return llm.response_generator(formatted_messages, usage)
+        return self._cached_response_generator(model, llm, formatted_messages, usage)
+
+    @staticmethod
+    def key(model: Model, formatted_messages: list) -> str:
+        payload = json.dumps([model.value, formatted_messages], sort_keys=True, separators=(",", ":"))
+        return f"response:{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+    async def _cached_response_generator(
+        self,
+        model: Model,
+        llm: LLM,
+        formatted_messages: list,
+        usage: Usage | None,
+    ) -> AsyncGenerator[str, None]:
+        key = self.key(model, formatted_messages)
+        cached = await self.redis.get(key)
+        if cached is not None:
+            CACHE_REQUESTS.labels("response", "hit").inc()
+            logger.debug(f"Response cache hit for {model.value}")
+            for entry in json.loads(cached):
+                # Entries stored before pauses were recorded are bare chunks
+                chunk, gap = entry if isinstance(entry, list) else (entry, 0)
+                # Sleeping, even for no time, yields to the event loop between chunks like a live stream would
+                await asyncio.sleep(min(gap, self.replay_max_gap))
+                yield chunk
+            return
+
+        CACHE_REQUESTS.labels("response", "miss").inc()
+        # Each chunk with how long the provider took to send it after the previous one
+        chunks = []
+        # Closed explicitly, so abandoning this stream closes the provider's at once rather than when collected
+        async with contextlib.aclosing(llm.response_generator(formatted_messages, usage)) as response:
+            waiting_since = None
+            async for chunk in response:
+                # The consumer's time between chunks is left out, and so is the first chunk's wait
+                chunks.append([chunk, 0 if waiting_since is None else time.perf_counter() - waiting_since])
+                yield chunk
+                waiting_since = time.perf_counter()
+        # Only complete responses are stored; an error or an abandoned stream never reaches this point
+        await self.redis.set(key, json.dumps(chunks), ex=self.ttl_seconds)
@@ -0,0 +1,170 @@
+import asyncio
+import heapq
+import itertools
+import os
+from collections.abc import AsyncGenerator, AsyncIterator
+from dataclasses import dataclass, field
+from enum import IntEnum
+
+from chat_server.generated.models import Model
+from chat_server.llm.factory import provider_for
+from chat_server.metrics import SCHEDULER_QUEUE_DEPTH, SCHEDULER_SLOTS_IN_USE
+
+# Worker processes sharing the caps below; set by the chat-server entry point, and 1 when run any other way
+SERVER_WORKERS = int(os.environ.get("SERVER_WORKERS", "1"))
+# Caps on concurrent streams for the whole server, split evenly between its worker processes
+PROVIDER_MAX_CONCURRENT_STREAMS = {
+    "openai": int(os.environ.get("OPENAI_MAX_CONCURRENT_STREAMS", "64")),
+    "anthropic": int(os.environ.get("ANTHROPIC_MAX_CONCURRENT_STREAMS", "32")),
+}
+MODEL_MAX_CONCURRENT_STREAMS = int(os.environ.get("MODEL_MAX_CONCURRENT_STREAMS", "16"))
+LLM_QUEUE_MAX_WAITERS = int(os.environ.get("LLM_QUEUE_MAX_WAITERS", "256"))
+LLM_QUEUE_TIMEOUT = float(os.environ.get("LLM_QUEUE_TIMEOUT", "10"))
+
+
+class Priority(IntEnum):
+    # Lower values are served first
+    interactive = 0
+    compare = 1
+    batch = 2
+
+
+class SchedulerRejectedError(Exception):
+    pass
+
+
+class SchedulerQueueFullError(SchedulerRejectedError):
+    pass
+
+
+class SchedulerTimeoutError(SchedulerRejectedError):
+    pass
+
+
+class SlotPool:
+    """A counting semaphore whose waiters are served by priority, then arrival order, with a bounded wait queue."""
+
+    def __init__(self, name: str, capacity: int, max_waiters: int = LLM_QUEUE_MAX_WAITERS) -> None:
+        self.name = name
+        self.capacity = capacity
+        self.max_waiters = max_waiters
+        self.in_use = 0
+        self.waiting = 0
+        self._waiters: list[tuple[int, int, asyncio.Future[None]]] = []
+        self._arrival = itertools.count()
+        self._report()
+
+    async def acquire(self, priority: Priority, timeout: float) -> None:
+        if self.in_use < self.capacity and self.waiting == 0:
+            self.in_use += 1
+            self._report()
+            return
+        if self.waiting >= self.max_waiters:
+            queue_full_error = f"Too many requests waiting for {self.name}"
+            raise SchedulerQueueFullError(queue_full_error)
+
+        granted = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._arrival), granted))
+        self.waiting += 1
+        self._report()
+        try:
+            await asyncio.wait_for(asyncio.shield(granted), timeout)
+        except asyncio.TimeoutError:
+            if self._withdraw(granted):
+                timeout_error = f"Timed out after {timeout:.1f}s waiting for {self.name}"
+                raise SchedulerTimeoutError(timeout_error) from None
+        except BaseException:
+            # Cancelled while waiting; a slot handed over in the meantime must not leak
+            if not self._withdraw(granted):
+                self.release()
+            raise
+
+    def release(self) -> None:
+        while self._waiters:
+            _, _, granted = heapq.heappop(self._waiters)
+            if not granted.done():
+                # The slot passes straight to the waiter, so in_use is unchanged
+                self.waiting -= 1
+                granted.set_result(None)
+                self._report()
+                return
+        self.in_use -= 1
+        self._report()
+
+    def _withdraw(self, granted: asyncio.Future[None]) -> bool:
+        """Stop waiting for a slot. Returns False if the slot was already granted."""
+        if granted.done():
+            return False
+        granted.cancel()
+        self.waiting -= 1
+        self._report()
+        return True
+
+    def _report(self) -> None:
+        # Set on every change rather than through Gauge.set_function, which multiprocess metrics do not support
+        SCHEDULER_QUEUE_DEPTH.labels(self.name).set(self.waiting)
+        SCHEDULER_SLOTS_IN_USE.labels(self.name).set(self.in_use)
+
+
+@dataclass
+class Lease:
+    pools: list[SlotPool]
+    released: bool = field(default=False)
+
+    def release(self) -> None:
+        if self.released:
+            return
+        self.released = True
+        for pool in reversed(self.pools):
+            pool.release()
+
+
+class LLMScheduler:
+    """Bounds concurrent provider streams per provider and per Model.
+
+    Requests wait in a bounded priority queue (single chat ahead of compare fan-out, and both ahead of batch jobs) and
+    are rejected rather than queued once the queue is full or the wait would exceed ``timeout``, so a burst degrades
+    into fast errors for some requests instead of provider 429s for everyone.
+
+    Each of the server's ``workers`` processes schedules on its own, within an equal share of every cap (at least one
+    stream), so together they stay within the caps.
+    """
+
+    def __init__(self, timeout: float = LLM_QUEUE_TIMEOUT, workers: int = SERVER_WORKERS) -> None:
+        self.timeout = timeout
+        self.provider_pools = {
+            provider: SlotPool(provider, _share(capacity, workers))
+            for provider, capacity in PROVIDER_MAX_CONCURRENT_STREAMS.items()
+        }
+        self.model_pools = {
+            model: SlotPool(model.value, _share(MODEL_MAX_CONCURRENT_STREAMS, workers)) for model in Model
+        }
+
+    async def acquire(self, model: Model, priority: Priority, timeout: float | None = None) -> Lease:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (self.timeout if timeout is None else timeout)
+        lease = Lease(pools=[])
+        # Always model then provider, so two requests can never hold each other's next slot
+        try:
+            for pool in (self.model_pools[model], self.provider_pools[provider_for(model)]):
+                await pool.acquire(priority, max(0.0, deadline - loop.time()))
+                lease.pools.append(pool)
+        except BaseException:
+            lease.release()
+            raise
+        return lease
+
+
+def _share(capacity: int, workers: int) -> int:
+    return max(1, capacity // workers)
+
+
+async def release_when_done(stream: AsyncIterator[str], lease: Lease) -> AsyncGenerator[str, None]:
+    try:
+        async for chunk in stream:
+            yield chunk
+    finally:
+        lease.release()
+
+
+llm_scheduler = LLMScheduler()
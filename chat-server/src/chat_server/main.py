@@ -1,41 +1,151 @@
 import asyncio
 import json
-import os
 import random
 import uuid
-from collections.abc import AsyncGenerator
+from collections.abc import AsyncGenerator, AsyncIterator, Awaitable, Callable, Sequence
+from contextlib import asynccontextmanager, suppress
+from datetime import date, datetime
+from typing import Annotated
 
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, Header, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, StreamingResponse
-from redis import Redis
-from sqlmodel import Session, SQLModel, create_engine, select
-
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST
+from pydantic import ValidationError
+from redis.exceptions import RedisError
+from sqlalchemy import tuple_
+from sqlalchemy.exc import StatementError
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlmodel.sql.expression import SelectOfScalar
+
+from chat_server.batch import (
+    BatchTooLargeError,
+    batch_runner,
+    create_job,
+    follow_results,
+    get_item_counts,
+    get_results,
+)
+from chat_server.coalesce import coalesce
+from chat_server.comparison import ComparisonConflictError, ComparisonNotFoundError, ComparisonStore, Selection
+from chat_server.context.cache import ThreadContext, context_cache, to_chat_message
+from chat_server.context.window import count_tokens
+from chat_server.db import async_session, engine
 from chat_server.generated.models import (
+    BatchJob,
+    BatchJobStatus,
+    BatchResult,
+    BatchResultPage,
+    BatchResultStatus,
     ChatMessage,
+    ChatMessagePage,
+    CreateBatchJobRequest,
     Error,
     Model,
     Role,
+    SearchMode,
+    SearchResult,
+    SearchResultPage,
     SubmitChatMessageCompareRequest,
     SubmitChatMessageRequest,
     SubmitChatMessageSelectRequest,
     Thread,
+    ThreadPage,
+    UsageReport,
+    UsageRollup,
+)
+from chat_server.generation import (
+    GENERATION_HEARTBEAT_INTERVAL,
+    GENERATION_PERSIST_PARTIAL,
+    GenerationFailedError,
+    GenerationLog,
+    GenerationNotFoundError,
+    drain_generations,
+    run_detached,
 )
-from chat_server.llm.factory import llm_factory
+from chat_server.health import HEALTHY, check_dependencies
+from chat_server.llm.clients import provider_clients
+from chat_server.llm.factory import MODEL_LIMITS, import_provider_modules, llm_factory
+from chat_server.llm.llm import LLM, Usage
+from chat_server.llm.resilience import LLM_FALLBACK_MODELS, ResilientStream
+from chat_server.llm.response_cache import ResponseCache
+from chat_server.llm.scheduler import Lease, Priority, SchedulerRejectedError, llm_scheduler, release_when_done
+from chat_server.metrics import (
+    CHAT_MODE,
+    COMPARE_MODE,
+    HISTORY_LOAD_SECONDS,
+    STAGE_SECONDS,
+    WEBSOCKET_CONNECTIONS,
+    instrument_stream,
+    mark_worker_stopped,
+    render_metrics,
+    timed,
+    tracer,
+)
+from chat_server.models.batch import BatchItem, BatchItemStatus
+from chat_server.models.batch import BatchJob as BatchJobModel
 from chat_server.models.chat import ChatMessage as ChatMessageModel
 from chat_server.models.thread import Thread as ThreadModel
-from chat_server.utils.logging import logger
+from chat_server.models.types import InvalidIdentifierError
+from chat_server.models.usage import UsageCounters
+from chat_server.multiplex import CHUNK_FRAME, ClientFrame, Multiplexer, MultiplexError
+from chat_server.persistence import TurnPersistError, turn_persister
+from chat_server.redis_pool import generation_reader_redis_client, redis_client, response_cache_redis_client
+from chat_server.search.semantic import SemanticSearchDisabledError, semantic_search
+from chat_server.search.text import SEARCH_TIMEOUT, SearchTimeoutError, search_text
+from chat_server.usage import COUNTERS, get_model_usage, get_thread_usage, usage_recorder
+from chat_server.utils.logging import logger, sampled_logger
+from chat_server.utils.pagination import (
+    InvalidCursorError,
+    decode_cursor,
+    decode_offset_cursor,
+    encode_cursor,
+    encode_offset_cursor,
+)
 
 load_dotenv()
 
-DATABASE_URL = os.environ["DATABASE_URL"]
-engine = create_engine(DATABASE_URL)
-SQLModel.metadata.create_all(engine)
-redis_url = os.environ["REDIS_URL"]
-redis_port = os.environ["REDIS_PORT"]
-redis_db = os.environ["REDIS_DB"]
-redis_client = Redis(host=redis_url, port=redis_port, db=redis_db)
+comparison_store = ComparisonStore(redis_client)
+generation_log = GenerationLog(redis_client, generation_reader_redis_client)
+response_cache = ResponseCache(response_cache_redis_client)
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+NDJSON_BATCH_SIZE = 500
+GENERATION_ID_HEADER = "X-Generation-Id"
+GENERATION_INTERRUPTED_MESSAGE = "Generation interrupted by server shutdown"
+GENERATION_ORPHANED_MESSAGE = "Generation cancelled with no client attached"
+COMPARISON_UNSELECTED_MESSAGE = "Generation cancelled for another model's selection"
+COMPARISON_EMPTY_ANSWER_MESSAGE = "Model returned an empty answer"
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI) -> AsyncIterator[None]:
+    # Pools and clients are created lazily and open no connections at import, so everything that touches a backing
+    # service happens here, once per worker process. The schema is managed separately by chat_server.migrate.
+    turn_persister.start()
+    usage_recorder.start()
+    batch_runner.start()
+    await semantic_search.start()
+    # Provider SDKs are slow to import, so they load in a thread once the worker is already serving rather than
+    # delaying startup or blocking the event loop on the first request for each provider
+    sdk_imports = asyncio.create_task(asyncio.to_thread(import_provider_modules))
+    yield
+    await sdk_imports
+    # The server has stopped accepting connections; generations run detached from any response, so wait for them to
+    # finish and be persisted before the write-behind buffer is flushed and the pools are closed
+    await drain_generations()
+    await batch_runner.stop()
+    await usage_recorder.stop()
+    await semantic_search.stop()
+    await turn_persister.stop()
+    await provider_clients.aclose()
+    await redis_client.aclose()
+    await generation_reader_redis_client.aclose()
+    await response_cache_redis_client.aclose()
+    await engine.dispose()
+    mark_worker_stopped()
 
 
 app = FastAPI(
@@ -49,6 +159,7 @@ app = FastAPI(
         },
         {"url": "http://localhost:8000", "description": "Development server"},
     ],
+    lifespan=lifespan,
 )
 
 # Add CORS middleware to the application
@@ -58,227 +169,836 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Allows all methods
     allow_headers=["*"],  # Allows all headers
+    expose_headers=[GENERATION_ID_HEADER],
 )
 
 
 @app.post("/thread", tags=["Chat"])
-def create_thread() -> Thread:
+async def create_thread() -> Thread:
     thread_name = f"New Thread Name {random.randint(0, 100)}"  # noqa: S311
     thread = ThreadModel(name=thread_name)
-    with Session(engine) as session:
+    async with async_session() as session:
         session.add(thread)
-        session.commit()
-        session.refresh(thread)
+        await session.commit()
+        await session.refresh(thread)
     return Thread(id=thread.id, name=thread.name, created_at=thread.created_at)
 
 
-@app.get("/thread", tags=["Chat"])
-def get_threads() -> list[Thread]:
-    with Session(engine) as session:
-        threads = session.exec(select(ThreadModel)).all()
-        return [Thread(id=thread.id, name=thread.name, created_at=thread.created_at) for thread in threads]
+@app.get("/thread", responses={"400": {"model": Error}}, tags=["Chat"])
+async def get_threads(
+    limit: Annotated[int, Query(ge=1, le=100)] = 50,
+    cursor: str | None = None,
+) -> ThreadPage:
+    statement = select(ThreadModel).order_by(ThreadModel.created_at.desc(), ThreadModel.id.desc())
+    if cursor is not None:
+        statement = statement.where(tuple_(ThreadModel.created_at, ThreadModel.id) < tuple_(*_decode_cursor(cursor)))
+    async with async_session() as session:
+        threads = (await session.exec(statement.limit(limit + 1))).all()
+    return ThreadPage(
+        items=[Thread(id=thread.id, name=thread.name, created_at=thread.created_at) for thread in threads[:limit]],
+        next_cursor=_next_cursor(threads, limit),
+    )
+
+
+@app.get(
+    "/thread/{thread_id}/chat",
+    response_model=ChatMessagePage,
+    responses={"400": {"model": Error}, "404": {"model": Error}, "503": {"model": Error}},
+    tags=["Chat"],
+)
+async def get_chat_messages(
+    request: Request,
+    thread_id: str,
+    limit: Annotated[int, Query(ge=1, le=1000)] = 100,
+    cursor: str | None = None,
+) -> ChatMessagePage | StreamingResponse:
+    statement = (
+        select(ChatMessageModel)
+        .where(ChatMessageModel.thread_id == thread_id)
+        .order_by(ChatMessageModel.created_at, ChatMessageModel.id)
+    )
+    if cursor is not None:
+        statement = statement.where(
+            tuple_(ChatMessageModel.created_at, ChatMessageModel.id) > tuple_(*_decode_cursor(cursor)),
+        )
+    try:
+        await turn_persister.wait_for_thread(thread_id)
+    except TurnPersistError as e:
+        raise HTTPException(status_code=503, detail=str(e)) from e
+    async with async_session() as session:
+        if not await _check_thread_exists(session, thread_id):
+            raise HTTPException(status_code=404, detail="Thread not found")
+        if NDJSON_MEDIA_TYPE in request.headers.get("accept", ""):
+            return StreamingResponse(_stream_chat_messages(statement), media_type=NDJSON_MEDIA_TYPE)
+        messages = (await session.exec(statement.limit(limit + 1))).all()
+    return ChatMessagePage(
+        items=[to_chat_message(message) for message in messages[:limit]],
+        next_cursor=_next_cursor(messages, limit),
+    )
+
+
+async def _stream_chat_messages(statement: SelectOfScalar[ChatMessageModel]) -> AsyncGenerator[str, None]:
+    # A server-side cursor keeps memory flat however long the thread is
+    async with async_session() as session:
+        messages = await session.stream_scalars(statement.execution_options(yield_per=NDJSON_BATCH_SIZE))
+        async for message in messages:
+            yield to_chat_message(message).model_dump_json() + "\n"
+
+
+def _next_cursor(rows: Sequence[ThreadModel | ChatMessageModel], limit: int) -> str | None:
+    # Pages are fetched with limit + 1 rows, so an extra row means there is another page after the last one returned
+    if len(rows) <= limit:
+        return None
+    return encode_cursor(rows[limit - 1].created_at, rows[limit - 1].id)
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime, str]:
+    try:
+        return decode_cursor(cursor)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+
+
+def _decode_offset_cursor(cursor: str) -> int:
+    try:
+        return decode_offset_cursor(cursor)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+
+
+async def _check_thread_exists(session: AsyncSession, thread_id: str) -> bool:
+    return (await session.exec(select(ThreadModel).where(ThreadModel.id == thread_id))).first() is not None
+
+
+@app.get("/search", responses={"400": {"model": Error}, "503": {"model": Error}}, tags=["Chat"])
+async def search_messages(
+    q: Annotated[str, Query(min_length=1)],
+    mode: SearchMode = SearchMode.text,
+    limit: Annotated[int, Query(ge=1, le=100)] = 20,
+    cursor: str | None = None,
+) -> SearchResultPage:
+    try:
+        if mode == SearchMode.semantic:
+            return await asyncio.wait_for(_search_semantic(q, limit, cursor), SEARCH_TIMEOUT)
+        return await _search_text(q, limit, cursor)
+    except SemanticSearchDisabledError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    except SearchTimeoutError as e:
+        raise HTTPException(status_code=503, detail=str(e)) from e
+    except asyncio.TimeoutError as e:
+        raise HTTPException(status_code=503, detail=f"Search timed out after {SEARCH_TIMEOUT:.1f}s") from e
+
+
+async def _search_text(query: str, limit: int, cursor: str | None) -> SearchResultPage:
+    after = _decode_cursor(cursor) if cursor is not None else None
+    async with async_session() as session:
+        rows = await search_text(session, query, limit + 1, after)
+    return SearchResultPage(
+        items=[_search_result(message, thread) for message, thread in rows[:limit]],
+        next_cursor=_next_cursor([message for message, _ in rows], limit),
+    )
+
+
+async def _search_semantic(query: str, limit: int, cursor: str | None) -> SearchResultPage:
+    offset = _decode_offset_cursor(cursor) if cursor is not None else 0
+    ranked = await semantic_search.search(query, limit + 1, offset)
+    scores = dict(ranked[:limit])
+    statement = (
+        select(ChatMessageModel, ThreadModel)
+        .join(ThreadModel, ThreadModel.id == ChatMessageModel.thread_id)
+        .where(ChatMessageModel.id.in_(scores))
+    )
+    async with async_session() as session:
+        rows = (await session.exec(statement)).all()
+    return SearchResultPage(
+        items=[
+            _search_result(message, thread, scores[message.id])
+            for message, thread in sorted(rows, key=lambda row: scores[row[0].id], reverse=True)
+        ],
+        next_cursor=encode_offset_cursor(offset + limit) if len(ranked) > limit else None,
+    )
 
 
-@app.get("/thread/{thread_id}/chat", tags=["Chat"])
-def get_chat_messages(thread_id: str) -> list[ChatMessage]:
-    with Session(engine) as session:
-        if not _check_thread_exists(session, thread_id):
+def _search_result(message: ChatMessageModel, thread: ThreadModel, score: float | None = None) -> SearchResult:
+    return SearchResult(
+        message=to_chat_message(message),
+        thread=Thread(id=thread.id, name=thread.name, created_at=thread.created_at),
+        created_at=message.created_at,
+        score=score,
+    )
+
+
+@app.get("/thread/{thread_id}/usage", responses={"404": {"model": Error}}, tags=["Chat"])
+async def get_thread_usage_report(thread_id: str) -> UsageReport:
+    # Usage is flushed in batches; flushing this worker's pending usage first makes its own generations visible
+    await usage_recorder.flush()
+    async with async_session() as session:
+        if not await _check_thread_exists(session, thread_id):
             raise HTTPException(status_code=404, detail="Thread not found")
-        messages = _get_entire_chat_history(session, thread_id)
-        return [ChatMessage(content=message.content, role=message.role, model=message.model) for message in messages]
+        return _usage_report(await get_thread_usage(session, thread_id))
+
+
+@app.get("/usage", tags=["Chat"])
+async def get_usage_report(since: date | None = None, until: date | None = None) -> UsageReport:
+    await usage_recorder.flush()
+    async with async_session() as session:
+        return _usage_report(await get_model_usage(session, since, until))
+
+
+def _usage_report(rollups: dict[str, UsageCounters]) -> UsageReport:
+    total = UsageCounters(
+        **{counter: sum(getattr(counters, counter) for counters in rollups.values()) for counter in COUNTERS},
+    )
+    return UsageReport(
+        items=[_usage_rollup(counters, model) for model, counters in rollups.items()],
+        total=_usage_rollup(total),
+    )
+
+
+def _usage_rollup(counters: UsageCounters, model: str | None = None) -> UsageRollup:
+    return UsageRollup(
+        model=model,
+        generations=counters.generations,
+        input_tokens=counters.input_tokens,
+        cached_input_tokens=counters.cached_input_tokens,
+        output_tokens=counters.output_tokens,
+        cost_usd=counters.cost_usd,
+        average_latency_seconds=counters.latency_seconds / counters.generations if counters.generations else None,
+    )
+
+
+@app.post("/batch", status_code=202, responses={"400": {"model": Error}}, tags=["Chat"])
+async def create_batch_job(body: CreateBatchJobRequest) -> BatchJob:
+    async with async_session() as session:
+        try:
+            job = await create_job(session, body.prompts, body.models)
+        except BatchTooLargeError as e:
+            raise HTTPException(status_code=400, detail=str(e)) from e
+        counts = dict.fromkeys((status.value for status in BatchItemStatus), 0)
+        counts[BatchItemStatus.pending.value] = job.prompt_count * len(job.models)
+    batch_runner.wake()
+    return _batch_job(job, counts)
+
+
+@app.get("/batch/{job_id}", responses={"404": {"model": Error}}, tags=["Chat"])
+async def get_batch_job(job_id: str) -> BatchJob:
+    async with async_session() as session:
+        job = await _get_batch_job(session, job_id)
+        return _batch_job(job, await get_item_counts(session, job_id))
+
+
+@app.get(
+    "/batch/{job_id}/results",
+    response_model=BatchResultPage,
+    responses={"400": {"model": Error}, "404": {"model": Error}},
+    tags=["Chat"],
+)
+async def get_batch_results(
+    request: Request,
+    job_id: str,
+    limit: Annotated[int, Query(ge=1, le=1000)] = 100,
+    cursor: str | None = None,
+) -> BatchResultPage | StreamingResponse:
+    after = _decode_offset_cursor(cursor) if cursor is not None else 0
+    async with async_session() as session:
+        job = await _get_batch_job(session, job_id)
+        if NDJSON_MEDIA_TYPE in request.headers.get("accept", ""):
+            return StreamingResponse(
+                _stream_batch_results(job_id, job.prompt_count * len(job.models)),
+                media_type=NDJSON_MEDIA_TYPE,
+            )
+        items = await get_results(session, job_id, after, limit + 1)
+    return BatchResultPage(
+        items=[_batch_result(item) for item in items[:limit]],
+        next_cursor=encode_offset_cursor(items[limit - 1].position + 1) if len(items) > limit else None,
+    )
+
 
+async def _stream_batch_results(job_id: str, item_count: int) -> AsyncGenerator[str, None]:
+    async for item in follow_results(job_id, item_count):
+        yield _batch_result(item).model_dump_json() + "\n"
 
-def _check_thread_exists(session: Session, thread_id: str) -> bool:
-    return session.exec(select(ThreadModel).where(ThreadModel.id == thread_id)).first() is not None
+
+async def _get_batch_job(session: AsyncSession, job_id: str) -> BatchJobModel:
+    job = (await session.exec(select(BatchJobModel).where(BatchJobModel.id == job_id))).first()
+    if job is None:
+        raise HTTPException(status_code=404, detail="Batch job not found")
+    return job
+
+
+def _batch_job(job: BatchJobModel, counts: dict[str, int]) -> BatchJob:
+    unfinished = counts[BatchItemStatus.pending.value] + counts[BatchItemStatus.running.value]
+    return BatchJob(
+        id=job.id,
+        created_at=job.created_at,
+        models=[Model(model) for model in job.models],
+        prompt_count=job.prompt_count,
+        status=BatchJobStatus.running if unfinished else BatchJobStatus.completed,
+        pending=counts[BatchItemStatus.pending.value],
+        running=counts[BatchItemStatus.running.value],
+        done=counts[BatchItemStatus.done.value],
+        failed=counts[BatchItemStatus.error.value],
+    )
+
+
+def _batch_result(item: BatchItem) -> BatchResult:
+    return BatchResult(
+        prompt_index=item.prompt_index,
+        model=Model(item.model),
+        status=BatchResultStatus(item.status),
+        response=item.response,
+        error=item.error,
+        input_tokens=item.input_tokens,
+        output_tokens=item.output_tokens,
+        latency_seconds=item.latency_seconds,
+    )
 
 
 @app.post(
     "/thread/{thread_id}/chat",
-    responses={"400": {"model": Error}},
+    responses={"400": {"model": Error}, "429": {"model": Error}, "503": {"model": Error}},
     response_model=None,
     tags=["Chat"],
 )
 async def submit_chat_message(thread_id: str, body: SubmitChatMessageRequest) -> StreamingResponse | Error:
-    # Create the user message but don't commit it yet
-    llm = llm_factory(body.model)
-    user_message = ChatMessageModel(content=body.content, thread_id=thread_id, role=Role.user)
-
-    # Get existing messages for context
-    with Session(engine) as session:
-        messages = _get_entire_chat_history(session, thread_id)
-
-    # Add the new user message to the context for the AI
-    messages.append(ChatMessage(content=body.content, role=Role.user))
+    try:
+        generation_id = await _start_chat(thread_id, body)
+    except SchedulerRejectedError as e:
+        return _overloaded_response(e)
+    except TurnPersistError as e:
+        raise HTTPException(status_code=503, detail=str(e)) from e
 
-    # Create a generator function for the streaming response
     async def response_generator() -> AsyncGenerator[str, None]:
-        entire_response = ""
-        try:
-            stream = llm.get_stream_generator(messages)
-            async for chunk in stream:
-                entire_response += chunk
-                yield chunk
-
-            # After streaming is complete, save both messages in a new transaction
-            with Session(engine) as session:
-                session.connection(execution_options={"isolation_level": "SERIALIZABLE"})
-                # Add the user message
-                session.add(user_message)
-                # Add the AI response
-                ai_message = ChatMessageModel(
-                    content=entire_response,
-                    thread_id=thread_id,
-                    role=Role.ai,
-                    model=body.model.value,
-                )
-                session.add(ai_message)
-                session.commit()
-        except Exception as e:
-            logger.error(f"Error during streaming: {e}")
-            raise
+        async for chunk in generation_log.tail(generation_id):
+            yield chunk.content
 
     return StreamingResponse(
         response_generator(),
         media_type="text/plain",
+        headers={GENERATION_ID_HEADER: generation_id},
     )
 
 
-def _get_entire_chat_history(session: Session, thread_id: str) -> list[ChatMessage]:
-    messages = session.exec(
-        select(ChatMessageModel)
-        .where(
-            ChatMessageModel.thread_id == thread_id,
-        )
-        .order_by(ChatMessageModel.created_at),
-    ).all()
-    return [
-        ChatMessage(
-            content=message.content,
-            role=message.role,
-            model=message.model,
-        )
-        for message in messages
-    ]
+async def _start_chat(thread_id: str, body: SubmitChatMessageRequest) -> str:
+    """Start generating the answer to a chat message, and return the id of the generation to tail."""
+    # Create the user message but don't commit it yet
+    user_message = ChatMessageModel(
+        content=body.content,
+        thread_id=thread_id,
+        role=Role.user.value,
+        token_count=count_tokens(body.content),
+    )
+
+    # Get existing messages for context, already converted to the provider's format
+    with timed(HISTORY_LOAD_SECONDS, "chat.history_load", mode=CHAT_MODE):
+        context = await _get_thread_context(thread_id)
+
+    leases = await _acquire_leases([body.model], Priority.interactive, CHAT_MODE)
+
+    # Every provider call made for this generation, including retries, reports its token counts here
+    usage = Usage()
+
+    # Add the new user message to the newest history that fits the model's context window
+    def open_stream(llm: LLM, model: Model) -> AsyncGenerator[str, None]:
+        token_budget = _history_token_budget(model, user_message.token_count)
+        usage.estimated_input_tokens = user_message.token_count + context.token_count_for(token_budget)
+        with timed(STAGE_SECONDS, "chat.conversion", stage="conversion", model=model.value, mode=CHAT_MODE):
+            return response_cache.get_stream_generator(
+                model,
+                llm,
+                [ChatMessage(content=body.content, role=Role.user)],
+                history=context.converted_for(llm, token_budget),
+                usage=usage,
+            )
+
+    resilient_stream = ResilientStream(
+        body.model, llm_factory, open_stream, fallback=LLM_FALLBACK_MODELS.get(body.model)
+    )
+    stream = release_when_done(
+        instrument_stream(usage_recorder.track(resilient_stream, thread_id, usage), body.model, CHAT_MODE),
+        leases[body.model],
+    )
+
+    # The generation runs detached from this response and logs its chunks, so a client that disconnects can reattach
+    # through GET /generation/{generation_id} without the provider call being repeated
+    generation_id = str(uuid.uuid4())
+    await _start_generation(generation_id, leases)
+    run_detached(_run_chat_generation(generation_id, stream, thread_id, user_message, resilient_stream))
+    return generation_id
+
+
+async def _run_chat_generation(
+    generation_id: str,
+    stream: AsyncGenerator[str, None],
+    thread_id: str,
+    user_message: ChatMessageModel,
+    resilient_stream: ResilientStream,
+) -> None:
+    entire_response = ""
+
+    async def stream_response() -> None:
+        nonlocal entire_response
+        async for chunk in coalesce(stream):
+            entire_response += chunk
+            await generation_log.append(generation_id, chunk)
+
+    with tracer.start_as_current_span("chat.generation", attributes={"generation_id": generation_id}):
+        try:
+            # Stops reading from the provider once every client has been gone for the orphan timeout
+            completed = await generation_log.run_attached(generation_id, stream_response())
+            if not completed and not (GENERATION_PERSIST_PARTIAL and entire_response):
+                await generation_log.finish(generation_id, error=GENERATION_ORPHANED_MESSAGE)
+                return
+
+            # After streaming is complete, save both messages
+            ai_message = ChatMessageModel(
+                content=entire_response,
+                thread_id=thread_id,
+                role=Role.ai.value,
+                # The model that answered, which differs from the requested one after a fallback
+                model=resilient_stream.model.value,
+                token_count=count_tokens(entire_response),
+            )
+            with timed(STAGE_SECONDS, "chat.persist", stage="persist", model=ai_message.model, mode=CHAT_MODE):
+                await turn_persister.persist(thread_id, [user_message, ai_message])
+            context_cache.append(thread_id, [user_message, ai_message])
+            semantic_search.enqueue([user_message, ai_message])
+        except asyncio.CancelledError:
+            # Shutdown gave up draining; tell readers instead of leaving them to wait for the log to expire
+            await generation_log.finish(generation_id, error=GENERATION_INTERRUPTED_MESSAGE)
+            raise
+        except Exception as e:  # noqa: BLE001
+            sampled_logger.error(f"Error during streaming: {e}")
+            await generation_log.finish(generation_id, error=str(e))
+            return
+        await generation_log.finish(generation_id, error=None if completed else GENERATION_ORPHANED_MESSAGE)
+
+
+async def _get_thread_context(thread_id: str) -> ThreadContext:
+    await turn_persister.wait_for_thread(thread_id)
+    async with async_session() as session:
+        return await context_cache.get(session, thread_id)
+
+
+async def _acquire_leases(models: list[Model], priority: Priority, mode: str) -> dict[Model, Lease]:
+    """Acquire a scheduler slot for every model, or for none of them."""
+
+    async def acquire(model: Model) -> Lease:
+        with timed(STAGE_SECONDS, "llm.queue", stage="queue", model=model.value, mode=mode):
+            return await llm_scheduler.acquire(model, priority)
+
+    models = list(dict.fromkeys(models))
+    acquired = await asyncio.gather(*(acquire(model) for model in models), return_exceptions=True)
+    failures = [result for result in acquired if isinstance(result, BaseException)]
+    if failures:
+        for result in acquired:
+            if isinstance(result, Lease):
+                result.release()
+        raise failures[0]
+    return dict(zip(models, acquired, strict=True))
+
+
+async def _start_generation(generation_id: str, leases: dict[Model, Lease]) -> None:
+    # Leases are normally released when their streams finish, which never happens if the generation cannot start
+    try:
+        await generation_log.start(generation_id)
+    except BaseException:
+        for lease in leases.values():
+            lease.release()
+        raise
+
+
+def _overloaded_response(e: SchedulerRejectedError) -> JSONResponse:
+    return JSONResponse(
+        status_code=429,
+        content=Error(code="overloaded", message=str(e)).model_dump(),
+        headers={"Retry-After": "1"},
+    )
+
+
+def _history_token_budget(model: Model, prompt_token_count: int) -> int:
+    return MODEL_LIMITS[model].input_budget - prompt_token_count
 
 
 @app.post(
     "/thread/{thread_id}/chat/compare",
     response_model=None,
-    responses={"400": {"model": Error}},
+    responses={"400": {"model": Error}, "429": {"model": Error}, "503": {"model": Error}},
     tags=["Chat"],
 )
 async def submit_chat_message_compare(
     thread_id: str, body: SubmitChatMessageCompareRequest
 ) -> StreamingResponse | Error:
-    comparison_message_id = str(uuid.uuid4())
-    user_message_key = f"{comparison_message_id}:user_message"
-    redis_client.set(user_message_key, body.content, ex=60*60)
-    with Session(engine) as session:
-        messages = _get_entire_chat_history(session, thread_id)
-    messages.append(ChatMessage(content=body.content, role=Role.user))
+    try:
+        comparison_message_id = await _start_comparison(thread_id, body)
+    except SchedulerRejectedError as e:
+        return _overloaded_response(e)
+    except TurnPersistError as e:
+        raise HTTPException(status_code=503, detail=str(e)) from e
     return StreamingResponse(
-        _merge_streams(body.models, messages, comparison_message_id),
+        _merge_streams(comparison_message_id),
         media_type="text/event-stream"
     )
 
-async def _merge_streams(
-    models: list[Model],
-    messages: list[ChatMessage],
+
+async def _start_comparison(thread_id: str, body: SubmitChatMessageCompareRequest) -> str:
+    """Start generating every model's answer to a chat message, and return the comparison id."""
+    comparison_message_id = str(uuid.uuid4())
+    await comparison_store.start(comparison_message_id, thread_id, body.content, body.models)
+    with timed(HISTORY_LOAD_SECONDS, "chat.history_load", mode=COMPARE_MODE):
+        context = await _get_thread_context(thread_id)
+
+    # Compare fan-out queues behind single chats
+    leases = await _acquire_leases(body.models, Priority.compare, COMPARE_MODE)
+
+    user_chat_message = ChatMessage(content=body.content, role=Role.user)
+    prompt_token_count = count_tokens(body.content)
+    # Every branch is billed, whichever answer is selected
+    usages = {model: Usage() for model in body.models}
+
+    def open_stream(llm: LLM, model: Model) -> AsyncGenerator[str, None]:
+        token_budget = _history_token_budget(model, prompt_token_count)
+        usages[model].estimated_input_tokens = prompt_token_count + context.token_count_for(token_budget)
+        with timed(STAGE_SECONDS, "chat.conversion", stage="conversion", model=model.value, mode=COMPARE_MODE):
+            return response_cache.get_stream_generator(
+                model,
+                llm,
+                [user_chat_message],
+                history=context.converted_for(llm, token_budget),
+                usage=usages[model],
+            )
+
+    # Compared models never fall back, since the answer would be attributed to the wrong model
+    streams = {
+        model: release_when_done(
+            instrument_stream(
+                usage_recorder.track(ResilientStream(model, llm_factory, open_stream), thread_id, usages[model]),
+                model,
+                COMPARE_MODE,
+            ),
+            leases[model],
+        )
+        for model in body.models
+    }
+    # The comparison id doubles as the generation id, so compare streams can be reattached the same way
+    await _start_generation(comparison_message_id, leases)
+    run_detached(_run_comparison(streams, comparison_message_id, thread_id))
+    return comparison_message_id
+
+
+async def _run_comparison(
+    streams: dict[Model, AsyncGenerator[str, None]],
     comparison_message_id: str,
-) -> AsyncGenerator[str, None]:
-    try:
-        tasks = []
-        queue = asyncio.Queue()
-        final_messages = {}
-        for model in models:
-            final_messages[model.value] = ""
+    thread_id: str,
+) -> None:
+    final_messages = dict.fromkeys(streams, "")
 
-        # Send initial comparison_message_id
-        yield f"data: {json.dumps({'comparison_message_id': comparison_message_id})}\n\n"
+    async def run(model: Model) -> None:
+        error = None
+        # Each model's tokens are coalesced into frames on its own, so a chatty model cannot crowd out the others
+        try:
+            async for frame in coalesce(streams[model]):
+                final_messages[model] += frame
+                await generation_log.append(comparison_message_id, frame, model)
+        except Exception as e:  # noqa: BLE001
+            # A failing model keeps its partial answer for display; the others keep streaming
+            sampled_logger.error(f"Error in run task for {model.value}: {e}")
+            error = str(e)
+        await _finish_compared_model(comparison_message_id, thread_id, model, final_messages[model], error)
+
+    async def run_all() -> None:
+        await _run_until_selected(comparison_message_id, {model: asyncio.create_task(run(model)) for model in streams})
+
+    with tracer.start_as_current_span("chat.comparison", attributes={"generation_id": comparison_message_id}):
+        try:
+            # Every model's provider stream is cancelled once every client has been gone for the orphan timeout
+            completed = await generation_log.run_attached(comparison_message_id, run_all())
+            if not completed and not GENERATION_PERSIST_PARTIAL:
+                await generation_log.finish(comparison_message_id, error=GENERATION_ORPHANED_MESSAGE)
+                return
+            if not completed:
+                # Finished models have saved their answers already; the others' partial answers can still be selected
+                await comparison_store.save_answers(comparison_message_id, final_messages)
+        except asyncio.CancelledError:
+            await generation_log.finish(comparison_message_id, error=GENERATION_INTERRUPTED_MESSAGE)
+            raise
+        except Exception as e:  # noqa: BLE001
+            sampled_logger.error(f"Error during streaming: {e}")
+            await generation_log.finish(comparison_message_id, error=str(e))
+            return
+        await generation_log.finish(comparison_message_id, error=None if completed else GENERATION_ORPHANED_MESSAGE)
 
-        async def run(model: str) -> None:
-            try:
-                stream = llm_factory(model).get_stream_generator(messages)
-                async for item in stream:
-                    final_messages[model.value] += item
-                    message = json.dumps({"model": model.value, "content": item})
-                    try:
-                        # Add timeout for queue put operations
-                        await queue.put(message)
-                    except Exception as e:
-                        logger.error(f"Error queuing message for {model}: {e}")
-                        raise
-            except Exception as e:
-                logger.error(f"Error in run task for {model}: {e}")
-                raise
-            finally:
-                # Signal this task is done
-                await queue.put(f"DONE_{model.value}")
-
-        # Start all model tasks
-        tasks = [asyncio.create_task(run(model)) for model in models]
-        active_models = {model.value for model in models}
-
-        # Stream results as they come in
-        while active_models:
-            try:
-                # Add timeout for queue get operations
-                message = await asyncio.wait_for(queue.get(), timeout=5)
-                if isinstance(message, str) and message.startswith("DONE_"):
-                    done_model = message.strip("DONE_")
-                    active_models.remove(done_model)
-                    continue
-                yield f"data: {message}\n\n"
-            except asyncio.TimeoutError:
-                logger.error("Timeout while waiting for model responses")
-                break
-            except Exception as e:
-                logger.error(f"Error processing queue item: {e}")
-                break
-
-        # Wait for all tasks to complete with timeout
+
+async def _finish_compared_model(
+    comparison_message_id: str,
+    thread_id: str,
+    model: Model,
+    answer: str,
+    error: str | None,
+) -> None:
+    if error is None and not answer:
+        # Persisted, an empty answer would be rejected by providers in every later turn of the thread
+        error = COMPARISON_EMPTY_ANSWER_MESSAGE
+    # Saved before the model is reported finished, so a client selecting it on seeing that finds its answer
+    selection = await comparison_store.finish_answer(comparison_message_id, model, answer, error)
+    if selection is not None and selection.persist:
+        await _persist_selection(thread_id, model, selection)
+    elif selection is not None and selection.error is not None:
+        logger.warning(f"Selected {model.value} failed in comparison {comparison_message_id}: {selection.error}")
+    await generation_log.finish_model(comparison_message_id, model, error=error)
+
+
+async def _run_until_selected(comparison_message_id: str, tasks: dict[Model, asyncio.Task]) -> None:
+    """Wait for the tasks running each model of a comparison, cancelling all but the selected model's once one is."""
+    watcher = asyncio.create_task(_cancel_unselected(comparison_message_id, tasks))
+    try:
+        await asyncio.wait(tasks.values())
+    finally:
+        watcher.cancel()
+        for task in tasks.values():
+            task.cancel()
+        await asyncio.gather(watcher, *tasks.values(), return_exceptions=True)
+    for task in tasks.values():
+        if not task.cancelled():
+            task.result()
+
+
+async def _cancel_unselected(comparison_message_id: str, tasks: dict[Model, asyncio.Task]) -> None:
+    # A selection can be made through any replica, so it is polled for like the attachment of clients
+    selected_model = None
+    while selected_model is None:
+        await asyncio.sleep(GENERATION_HEARTBEAT_INTERVAL)
         try:
-            await asyncio.wait_for(asyncio.gather(*tasks, return_exceptions=True), timeout=60.0)
-        except asyncio.TimeoutError:
-            logger.error("Timeout while waiting for tasks to complete")
-
-        # Store final messages in Redis
-        for model in models:
-            redis_client.set(f"{comparison_message_id}:{model}", final_messages[model.value])
-
-    except Exception as e:
-        logger.error(f"Error during streaming: {e}")
-        if tasks:
-            for task in tasks:
-                if not task.done():
-                    task.cancel()
-        raise
+            selected_model = await comparison_store.selected_model(comparison_message_id)
+        except RedisError as e:
+            logger.warning(f"Failed to check selection of comparison {comparison_message_id}: {e}")
+    for model, task in tasks.items():
+        if model.value != selected_model and not task.done():
+            # Cancelling the task closes the model's provider stream and releases its scheduler slot
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+            await generation_log.finish_model(comparison_message_id, model, error=COMPARISON_UNSELECTED_MESSAGE)
+
+
+async def _merge_streams(comparison_message_id: str) -> AsyncGenerator[str, None]:
+    # Send initial comparison_message_id
+    yield f"data: {json.dumps({'comparison_message_id': comparison_message_id})}\n\n"
+    async for event in _generation_events(comparison_message_id):
+        yield event
+
+
+@app.get(
+    "/generation/{generation_id}",
+    response_model=None,
+    responses={"404": {"model": Error}},
+    tags=["Chat"],
+)
+async def get_generation(
+    generation_id: str,
+    after: str = "0",
+    last_event_id: Annotated[str | None, Header()] = None,
+) -> StreamingResponse:
+    if not await generation_log.exists(generation_id):
+        raise HTTPException(status_code=404, detail="Generation not found")
+    return StreamingResponse(
+        _generation_events(generation_id, last_event_id or after),
+        media_type="text/event-stream",
+    )
 
 
+async def _generation_events(generation_id: str, after: str = "0") -> AsyncGenerator[str, None]:
+    try:
+        async for chunk in generation_log.tail(generation_id, after):
+            if chunk.status is None:
+                message = {"model": chunk.model, "content": chunk.content}
+            else:
+                # Per-model completion: {"model", "status": "done"} or {"model", "status": "error", "message"}
+                message = {"model": chunk.model, "status": chunk.status}
+                if chunk.error is not None:
+                    message["message"] = chunk.error
+            yield f"id: {chunk.entry_id}\ndata: {json.dumps(message)}\n\n"
+    except (GenerationFailedError, GenerationNotFoundError) as e:
+        yield f"event: error\ndata: {json.dumps({'message': str(e)})}\n\n"
+
 
 @app.post(
     "/thread/{thread_id}/chat/compare/select",
     response_model=None,
-    responses={"400": {"model": Error}},
+    responses={"400": {"model": Error}, "404": {"model": Error}, "409": {"model": Error}},
     tags=["Chat"],
 )
-def submit_chat_message_select(
+async def submit_chat_message_select(
     thread_id: str, body: SubmitChatMessageSelectRequest,
 ) -> JSONResponse | Error:
-    user_message_key = f"{body.comparison_message_id}:user_message"
-    ai_message_key = f"{body.comparison_message_id}:{body.selected_model}"
-    user_message = redis_client.get(user_message_key).decode("utf-8")
-    ai_message = redis_client.get(ai_message_key).decode("utf-8")
-    with Session(engine) as session:
-        session.add(ChatMessageModel(content=user_message, role=Role.user, thread_id=thread_id))
-        session.add(ChatMessageModel(
-            content=ai_message,
-            role=Role.ai,
-            thread_id=thread_id,
-            model=body.selected_model.value,
-        ))
-        session.commit()
+    try:
+        await _select_comparison(thread_id, body)
+    except ComparisonNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e)) from e
+    except ComparisonConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e)) from e
+
+
+async def _select_comparison(thread_id: str, body: SubmitChatMessageSelectRequest) -> None:
+    """Select a comparison's answer, which is added to the thread with its prompt now, or when the model finishes."""
+    selection = await comparison_store.select(body.comparison_message_id, thread_id, body.selected_model)
+    if selection.answer is None:
+        # The other models are cancelled at the comparison's next check, and the selected one runs on with no client
+        await generation_log.pin(body.comparison_message_id)
+    elif selection.persist:
+        await _persist_selection(thread_id, body.selected_model, selection)
+
+
+async def _persist_selection(thread_id: str, model: Model, selection: Selection) -> None:
+    user_message_row = ChatMessageModel(
+        content=selection.user_message,
+        role=Role.user.value,
+        thread_id=thread_id,
+        token_count=count_tokens(selection.user_message),
+    )
+    ai_message_row = ChatMessageModel(
+        content=selection.answer,
+        role=Role.ai.value,
+        thread_id=thread_id,
+        model=model.value,
+        token_count=count_tokens(selection.answer),
+    )
+    with timed(STAGE_SECONDS, "chat.persist", stage="persist", model=model.value, mode=COMPARE_MODE):
+        await turn_persister.persist(thread_id, [user_message_row, ai_message_row])
+    context_cache.append(thread_id, [user_message_row, ai_message_row])
+    semantic_search.enqueue([user_message_row, ai_message_row])
+
+
+@app.websocket("/ws")
+async def chat_websocket(websocket: WebSocket) -> None:
+    """Multiplex the chat, compare and select requests of one client, and their streams, over one connection.
+
+    Client frames are JSON objects with an ``id`` chosen by the client and a ``type``:
+
+    - chat, compare, select: ``thread_id``, and as ``body`` the request body of the matching HTTP endpoint
+    - window: ``increment`` more chunk frames that the stream ``id`` may send; each starts with WEBSOCKET_STREAM_WINDOW
+    - cancel: stop streaming ``id``; as after an HTTP disconnect, its generation stops after the orphan timeout
+
+    Every server frame carries the ``id`` of the request it belongs to and a ``type``:
+
+    - started: ``generation_id``, which also reattaches through GET /generation/{generation_id}
+    - chunk: ``content``, and in a comparison the ``model`` it comes from
+    - model_done: ``model`` and ``status``, and ``message`` on error, as each model of a comparison finishes
+    - done, or error: ``code`` and ``message``; a select fails with not_found or conflict, as HTTP with 404 or 409,
+      and a chat or compare with unavailable, as HTTP with 503, when the thread's previous turn could not be saved
+    """
+    await websocket.accept()
+    WEBSOCKET_CONNECTIONS.inc()
+    multiplexer = Multiplexer(websocket)
+    try:
+        while True:
+            message = await websocket.receive_text()
+            try:
+                frame = ClientFrame.model_validate_json(message)
+            except ValidationError as e:
+                await multiplexer.send({"id": None, "type": "error", "code": "invalid_request", "message": str(e)})
+                continue
+            try:
+                _dispatch_frame(multiplexer, frame)
+            except (ValidationError, MultiplexError) as e:
+                await multiplexer.send({"id": frame.id, "type": "error", "code": "invalid_request", "message": str(e)})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await multiplexer.aclose()
+        WEBSOCKET_CONNECTIONS.dec()
+
+
+def _dispatch_frame(multiplexer: Multiplexer, frame: ClientFrame) -> None:
+    if frame.type == "window":
+        multiplexer.grant(frame.id, frame.increment)
+        return
+    if frame.type == "cancel":
+        multiplexer.cancel(frame.id)
+        return
+    if frame.thread_id is None:
+        missing_thread_error = f"A {frame.type} request needs a thread_id"
+        raise MultiplexError(missing_thread_error)
+    thread_id = frame.thread_id
+    if frame.type == "chat":
+        chat_body = SubmitChatMessageRequest.model_validate(frame.body)
+        multiplexer.open(frame.id, _generation_frames(lambda: _start_chat(thread_id, chat_body)))
+    elif frame.type == "compare":
+        compare_body = SubmitChatMessageCompareRequest.model_validate(frame.body)
+        multiplexer.open(frame.id, _generation_frames(lambda: _start_comparison(thread_id, compare_body)))
+    else:
+        select_body = SubmitChatMessageSelectRequest.model_validate(frame.body)
+        multiplexer.open(frame.id, _select_frames(thread_id, select_body))
+
+
+async def _generation_frames(start: Callable[[], Awaitable[str]]) -> AsyncGenerator[dict, None]:
+    # Started from the stream's own task, so waiting for a scheduler slot never blocks the connection's other streams
+    try:
+        generation_id = await start()
+    except SchedulerRejectedError as e:
+        yield {"type": "error", "code": "overloaded", "message": str(e)}
+        return
+    except TurnPersistError as e:
+        yield {"type": "error", "code": "unavailable", "message": str(e)}
+        return
+    yield {"type": "started", "generation_id": generation_id}
+    try:
+        async for chunk in generation_log.tail(generation_id):
+            if chunk.status is None:
+                frame = {"type": CHUNK_FRAME, "content": chunk.content}
+                if chunk.model is not None:
+                    frame["model"] = chunk.model
+            else:
+                frame = {"type": "model_done", "model": chunk.model, "status": chunk.status}
+                if chunk.error is not None:
+                    frame["message"] = chunk.error
+            yield frame
+    except (GenerationFailedError, GenerationNotFoundError) as e:
+        yield {"type": "error", "code": "generation_failed", "message": str(e)}
+        return
+    yield {"type": "done"}
+
+
+async def _select_frames(thread_id: str, body: SubmitChatMessageSelectRequest) -> AsyncGenerator[dict, None]:
+    try:
+        await _select_comparison(thread_id, body)
+    except ComparisonNotFoundError as e:
+        yield {"type": "error", "code": "not_found", "message": str(e)}
+        return
+    except ComparisonConflictError as e:
+        yield {"type": "error", "code": "conflict", "message": str(e)}
+        return
+    yield {"type": "done"}
+
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics() -> Response:
+    return Response(render_metrics(), media_type=CONTENT_TYPE_LATEST)
+
+
+@app.get("/health/live", include_in_schema=False)
+async def get_liveness() -> JSONResponse:
+    # Answering at all shows the worker's event loop is not blocked
+    return JSONResponse(content={"status": HEALTHY})
+
+
+@app.get("/health/ready", include_in_schema=False)
+async def get_readiness() -> JSONResponse:
+    # A draining worker has already closed its listening socket, so it drops out of rotation without a check here
+    checks = await check_dependencies()
+    ready = all(result == HEALTHY for result in checks.values())
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": HEALTHY if ready else "unavailable", "checks": checks},
+    )
+
 
+@app.exception_handler(StatementError)
+def statement_exception_handler(request: Request, exc: StatementError) -> JSONResponse:
+    # With compact storage an id that is not a UUID is rejected before the query runs; no row could have it
+    if isinstance(exc.orig, InvalidIdentifierError):
+        return JSONResponse(status_code=404, content={"detail": str(exc.orig)})
+    return global_exception_handler(request, exc)
 
 
 @app.exception_handler(Exception)
@@ -0,0 +1,184 @@
+import os
+import time
+from collections.abc import AsyncGenerator, AsyncIterator, Iterator
+from contextlib import contextmanager
+
+from opentelemetry import trace
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+from sqlalchemy import Connection, event
+from sqlalchemy.engine import ExceptionContext
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from chat_server.context.window import CHARS_PER_TOKEN
+from chat_server.generated.models import Model
+
+# Set by the production entry point when it runs several workers: every worker then writes its samples to files in
+# this directory and /metrics, whichever worker serves it, reports the aggregate. prometheus_client reads it at import.
+PROMETHEUS_MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+
+# Spans are no-ops unless an OpenTelemetry SDK is configured for the process (e.g. with opentelemetry-instrument)
+tracer = trace.get_tracer("chat_server")
+
+CHAT_MODE = "chat"
+COMPARE_MODE = "compare"
+BATCH_MODE = "batch"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+GAP_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+STAGE_SECONDS = Histogram(
+    "chat_stage_seconds",
+    "Time spent in each model-specific stage of a chat or compare request",
+    ["stage", "model", "mode"],
+    buckets=LATENCY_BUCKETS,
+)
+HISTORY_LOAD_SECONDS = Histogram(
+    "chat_history_load_seconds",
+    "Time spent loading a thread's history",
+    ["mode"],
+    buckets=LATENCY_BUCKETS,
+)
+INTER_TOKEN_SECONDS = Histogram(
+    "chat_inter_token_seconds",
+    "Gap between consecutive chunks of a provider stream",
+    ["model"],
+    buckets=GAP_BUCKETS,
+)
+TOKENS_PER_SECOND = Histogram(
+    "chat_tokens_per_second",
+    "Estimated output tokens per second of a provider stream, after its first token",
+    ["model"],
+    buckets=(5, 10, 20, 40, 80, 160, 320, 640),
+)
+ACTIVE_STREAMS = Gauge(
+    "chat_active_streams",
+    "Provider streams currently open",
+    ["model", "mode"],
+    multiprocess_mode="livesum",
+)
+WEBSOCKET_CONNECTIONS = Gauge(
+    "chat_websocket_connections",
+    "WebSocket connections currently open",
+    multiprocess_mode="livesum",
+)
+WEBSOCKET_STREAMS = Gauge(
+    "chat_websocket_streams",
+    "Requests currently multiplexed over WebSocket connections",
+    multiprocess_mode="livesum",
+)
+LLM_TOKENS = Counter("llm_tokens_total", "Tokens reported by providers, by model and kind", ["model", "kind"])
+LLM_COST_USD = Counter("llm_cost_usd_total", "Estimated provider cost in US dollars, at list prices", ["model"])
+CACHE_REQUESTS = Counter("chat_cache_requests_total", "Cache lookups by cache and result", ["cache", "result"])
+REDIS_COMMAND_SECONDS = Histogram(
+    "redis_command_seconds",
+    "Redis round trip time by command; pipelines are recorded as PIPELINE",
+    ["command"],
+    buckets=LATENCY_BUCKETS,
+)
+DB_STATEMENT_SECONDS = Histogram(
+    "db_statement_seconds",
+    "Database statement execution time by statement type",
+    ["statement"],
+    buckets=LATENCY_BUCKETS,
+)
+DB_COMMITS = Counter("db_commits_total", "Database transactions committed")
+WRITE_BEHIND_DROPPED_MESSAGES = Counter(
+    "write_behind_dropped_messages_total",
+    "Chat messages dropped after every write-behind flush attempt failed",
+)
+# Scheduler pools are per worker, so the multiprocess value is the sum over live workers
+SCHEDULER_QUEUE_DEPTH = Gauge(
+    "llm_scheduler_queue_depth",
+    "Requests waiting for a provider stream slot",
+    ["pool"],
+    multiprocess_mode="livesum",
+)
+SCHEDULER_SLOTS_IN_USE = Gauge(
+    "llm_scheduler_slots_in_use",
+    "Provider stream slots in use",
+    ["pool"],
+    multiprocess_mode="livesum",
+)
+
+
+def render_metrics() -> bytes:
+    if PROMETHEUS_MULTIPROC_DIR is None:
+        return generate_latest()
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry)
+
+
+def mark_worker_stopped() -> None:
+    """Drop this worker's live gauges from the multiprocess aggregate once it exits."""
+    if PROMETHEUS_MULTIPROC_DIR is not None:
+        multiprocess.mark_process_dead(os.getpid())
+
+
+@contextmanager
+def timed(histogram: Histogram, span_name: str, **labels: str) -> Iterator[None]:
+    """Record the duration of the block in ``histogram`` and as a span nested under the current one."""
+    with tracer.start_as_current_span(span_name, attributes=labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            histogram.labels(**labels).observe(time.perf_counter() - started)
+
+
+async def instrument_stream(stream: AsyncIterator[str], model: Model, mode: str) -> AsyncGenerator[str, None]:
+    """Pass ``stream`` through, recording time to first token, inter-token gaps, throughput and total duration."""
+    # The span is not made current: the generator may be resumed from a different task than the one that started it
+    span = tracer.start_span("llm.stream", attributes={"model": model.value, "mode": mode})
+    ACTIVE_STREAMS.labels(model.value, mode).inc()
+    started = last_chunk_at = time.perf_counter()
+    first_chunk_at = None
+    characters = 0
+    try:
+        async for chunk in stream:
+            now = time.perf_counter()
+            if first_chunk_at is None:
+                first_chunk_at = now
+                STAGE_SECONDS.labels("first_token", model.value, mode).observe(now - started)
+                span.add_event("first_token")
+            else:
+                INTER_TOKEN_SECONDS.labels(model.value).observe(now - last_chunk_at)
+            last_chunk_at = now
+            characters += len(chunk)
+            yield chunk
+    except Exception as e:
+        span.record_exception(e)
+        span.set_status(trace.StatusCode.ERROR)
+        raise
+    finally:
+        ended = time.perf_counter()
+        STAGE_SECONDS.labels("generation", model.value, mode).observe(ended - started)
+        if first_chunk_at is not None and ended > first_chunk_at:
+            TOKENS_PER_SECOND.labels(model.value).observe(characters / CHARS_PER_TOKEN / (ended - first_chunk_at))
+        ACTIVE_STREAMS.labels(model.value, mode).dec()
+        span.end()
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """Record every statement the engine executes in ``DB_STATEMENT_SECONDS``, labelled by its leading keyword.
+
+    Committed transactions are counted in ``DB_COMMITS``.
+    """
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn: Connection, *_: object) -> None:
+        conn.info.setdefault("statement_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn: Connection, _cursor: object, statement: str, *_: object) -> None:
+        started = conn.info["statement_started"].pop()
+        DB_STATEMENT_SECONDS.labels(statement.split(None, 1)[0].upper()).observe(time.perf_counter() - started)
+
+    @event.listens_for(engine.sync_engine, "commit")
+    def commit(_: Connection) -> None:
+        DB_COMMITS.inc()
+
+    @event.listens_for(engine.sync_engine, "handle_error")
+    def handle_error(context: ExceptionContext) -> None:
+        if context.connection is not None and context.connection.info.get("statement_started"):
+            context.connection.info["statement_started"].pop()
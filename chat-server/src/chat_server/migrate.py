@@ -0,0 +1,171 @@
+import asyncio
+import os
+
+from sqlalchemy import Column, Connection, Inspector, LargeBinary, Table, inspect, text
+from sqlalchemy.dialects import postgresql
+from sqlmodel import SQLModel
+
+# Imported for their side effect of registering the tables on SQLModel.metadata
+import chat_server.models.batch
+import chat_server.models.embedding
+import chat_server.models.thread
+import chat_server.models.usage  # noqa: F401
+from chat_server.db import engine
+from chat_server.models.chat import ChatMessage as ChatMessageModel
+from chat_server.models.types import COMPACT_STORAGE, UUIDString
+from chat_server.utils.logging import logger
+
+# Postgres compresses values that would make a row wider than about 2 kB, and decompresses them only when the column
+# is read. lz4 decompresses several times faster than the default pglz, for a similar ratio on chat text.
+CONTENT_COMPRESSION = os.environ.get("CONTENT_COMPRESSION", "lz4")
+COMPRESSION_METHODS = ("pglz", "lz4")
+
+
+class MigrationError(Exception):
+    pass
+
+
+def upgrade_schema(conn: Connection) -> list[str]:
+    """Bring the database up to date with the SQLModel tables, returning a description of each change made.
+
+    Changes are additive only: missing tables, nullable columns and indexes are created, so running it again is a
+    no-op and a schema that is ahead of the code is left alone. Anything else needs a hand-written migration.
+    """
+    changes = [f"create table {table.name}" for table in _missing_tables(conn)]
+    SQLModel.metadata.create_all(conn)
+
+    inspector = inspect(conn)
+    quote = conn.dialect.identifier_preparer.quote
+    for table in SQLModel.metadata.sorted_tables:
+        existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing_columns:
+                continue
+            if not column.nullable:
+                not_nullable_error = f"Cannot add non-nullable column {table.name}.{column.name} automatically"
+                raise MigrationError(not_nullable_error)
+            column_type = column.type.compile(dialect=conn.dialect)
+            conn.execute(text(f"ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} {column_type}"))
+            changes.append(f"add column {table.name}.{column.name}")
+
+        existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        missing_indexes = [index for index in table.indexes if index.name not in existing_indexes]
+        for index in missing_indexes:
+            # A no-op for indexes limited to another dialect
+            index.create(conn)
+        created_indexes = {index["name"] for index in inspect(conn).get_indexes(table.name)}
+        changes.extend(f"create index {index.name}" for index in missing_indexes if index.name in created_indexes)
+    return changes
+
+
+def upgrade_to_compact_storage(conn: Connection) -> list[str]:
+    """Convert an existing database to compact storage, returning a description of each change made.
+
+    On Postgres, UUID columns stored as strings are converted to native ``uuid`` and message bodies are recompressed
+    with ``CONTENT_COMPRESSION``. Both rewrite the affected rows under an exclusive lock, so run it in a maintenance
+    window. Other databases only support compact storage for tables created with it.
+    """
+    inspector = inspect(conn)
+    string_columns = {
+        table: [column for column in table.columns if _is_string_uuid(column, inspector)]
+        for table in SQLModel.metadata.sorted_tables
+    }
+    string_columns = {table: columns for table, columns in string_columns.items() if columns}
+    if string_columns and conn.dialect.name != "postgresql":
+        compact_storage_error = f"Cannot convert existing {conn.dialect.name} tables to compact storage"
+        raise MigrationError(compact_storage_error)
+    changes = _convert_uuid_columns(conn, string_columns) if string_columns else []
+    if conn.dialect.name == "postgresql":
+        changes.extend(_recompress(conn, ChatMessageModel.__table__.c.content))
+    return changes
+
+
+def _is_string_uuid(column: Column, inspector: Inspector) -> bool:
+    if not isinstance(column.type, UUIDString):
+        return False
+    existing_types = {existing["name"]: existing["type"] for existing in inspector.get_columns(column.table.name)}
+    return not isinstance(existing_types[column.name], (postgresql.UUID, LargeBinary))
+
+
+def _convert_uuid_columns(conn: Connection, string_columns: dict[Table, list[Column]]) -> list[str]:
+    quote = conn.dialect.identifier_preparer.quote
+    converted = {(table.name, column.name) for table, columns in string_columns.items() for column in columns}
+    # A foreign key cannot hold while the columns it joins have different types, so it is recreated afterwards
+    foreign_keys = [
+        (table_name, foreign_key)
+        for table_name in inspect(conn).get_table_names()
+        for foreign_key in inspect(conn).get_foreign_keys(table_name)
+        if any((table_name, column) in converted for column in foreign_key["constrained_columns"])
+        or any((foreign_key["referred_table"], column) in converted for column in foreign_key["referred_columns"])
+    ]
+    for table_name, foreign_key in foreign_keys:
+        conn.execute(text(f"ALTER TABLE {quote(table_name)} DROP CONSTRAINT {quote(foreign_key['name'])}"))
+
+    changes = []
+    for table, columns in string_columns.items():
+        alterations = ", ".join(
+            f"ALTER COLUMN {quote(column.name)} TYPE uuid USING {quote(column.name)}::uuid" for column in columns
+        )
+        conn.execute(text(f"ALTER TABLE {quote(table.name)} {alterations}"))
+        changes.extend(f"convert {table.name}.{column.name} to uuid" for column in columns)
+
+    for table_name, foreign_key in foreign_keys:
+        constrained = ", ".join(quote(column) for column in foreign_key["constrained_columns"])
+        referred = ", ".join(quote(column) for column in foreign_key["referred_columns"])
+        conn.execute(
+            text(
+                f"ALTER TABLE {quote(table_name)} ADD CONSTRAINT {quote(foreign_key['name'])} "
+                f"FOREIGN KEY ({constrained}) REFERENCES {quote(foreign_key['referred_table'])} ({referred})",
+            ),
+        )
+    return changes
+
+
+def _recompress(conn: Connection, column: Column) -> list[str]:
+    quote = conn.dialect.identifier_preparer.quote
+    table_name, column_name = quote(column.table.name), quote(column.name)
+    compression = conn.execute(
+        text("SELECT attcompression FROM pg_attribute WHERE attrelid = CAST(:table AS regclass) AND attname = :column"),
+        {"table": column.table.name, "column": column.name},
+    ).scalar_one()
+    if CONTENT_COMPRESSION not in COMPRESSION_METHODS:
+        compression_error = f"Unknown compression method {CONTENT_COMPRESSION}, expected one of {COMPRESSION_METHODS}"
+        raise MigrationError(compression_error)
+    # pg_attribute records the method by its first letter, or not at all for the server default
+    if compression == CONTENT_COMPRESSION[0]:
+        return []
+    conn.execute(text(f"ALTER TABLE {table_name} ALTER COLUMN {column_name} SET COMPRESSION {CONTENT_COMPRESSION}"))
+    # Setting the method only applies to new values; concatenating forces the compressed ones to be stored again
+    recompressed = conn.execute(
+        text(
+            f"UPDATE {table_name} SET {column_name} = {column_name} || '' "  # noqa: S608
+            f"WHERE pg_column_compression({column_name}) <> :compression",
+        ),
+        {"compression": CONTENT_COMPRESSION},
+    ).rowcount
+    return [f"compress {column.table.name}.{column.name} with {CONTENT_COMPRESSION} ({recompressed} rows rewritten)"]
+
+
+def _missing_tables(conn: Connection) -> list[Table]:
+    existing_tables = set(inspect(conn).get_table_names())
+    return [table for table in SQLModel.metadata.sorted_tables if table.name not in existing_tables]
+
+
+async def migrate() -> None:
+    async with engine.begin() as conn:
+        changes = await conn.run_sync(upgrade_schema)
+        if COMPACT_STORAGE:
+            changes.extend(await conn.run_sync(upgrade_to_compact_storage))
+    await engine.dispose()
+    for change in changes:
+        logger.info(f"Migration: {change}")
+    logger.info(f"Schema is up to date ({len(changes)} changes applied)")
+
+
+def main() -> None:
+    """Create or upgrade the database schema; run once per deployment, before the server starts."""
+    asyncio.run(migrate())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+import uuid
+from datetime import datetime
+from enum import Enum
+
+from sqlalchemy import JSON
+from sqlmodel import Field, Index, SQLModel
+
+from chat_server.models.types import UUIDString
+
+
+class BatchItemStatus(str, Enum):
+    pending = "pending"
+    running = "running"
+    done = "done"
+    error = "error"
+
+
+class BatchJob(SQLModel, table=True):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()), primary_key=True, sa_type=UUIDString)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    models: list[str] = Field(sa_type=JSON)
+    prompt_count: int
+
+
+class BatchItem(SQLModel, table=True):
+    """One prompt of a batch job run on one model; its position orders the job's items prompt by prompt."""
+
+    job_id: str = Field(foreign_key="batchjob.id", primary_key=True, sa_type=UUIDString)
+    position: int = Field(primary_key=True)
+    prompt_index: int
+    model: str
+    prompt: str
+    # Items are claimed oldest job first
+    queued_at: datetime
+    status: str = Field(default=BatchItemStatus.pending.value)
+    attempts: int = 0
+    # A running item whose claim has expired belonged to a worker that died, and is claimed again
+    claimed_until: datetime | None = None
+    response: str | None = None
+    error: str | None = None
+    input_tokens: int | None = None
+    output_tokens: int | None = None
+    latency_seconds: float | None = None
+    finished_at: datetime | None = None
+
+    __table_args__ = (
+        Index("batchitem_status_queued_at_index", "status", "queued_at"),
+        Index("batchitem_status_claimed_until_index", "status", "claimed_until"),
+        # Streaming a job's results fetches only the items finished since the previous poll
+        Index("batchitem_job_id_finished_at_index", "job_id", "finished_at"),
+    )
@@ -1,15 +1,30 @@
 import uuid
 from datetime import datetime
 
+from sqlalchemy import text
 from sqlmodel import Field, Index, SQLModel
 
+from chat_server.models.types import UUIDString
+
+# Text search configuration of the content search index; queries must use the same one for the index to apply
+CONTENT_SEARCH_CONFIG = "english"
+
 
 class ChatMessage(SQLModel, table=True):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()), primary_key=True)
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()), primary_key=True, sa_type=UUIDString)
     content: str
     created_at: datetime = Field(default_factory=datetime.utcnow)
-    thread_id: str = Field(foreign_key="thread.id", index=True)
+    thread_id: str = Field(foreign_key="thread.id", index=True, sa_type=UUIDString)
     role: str
     model: str | None = Field(default=None)
+    token_count: int | None = Field(default=None)
 
-    __table_args__ = (Index("thread_id_created_at_index", "thread_id", "created_at"),)
+    __table_args__ = (
+        Index("thread_id_created_at_index", "thread_id", "created_at"),
+        # Postgres keeps a GIN index up to date as rows are committed; other databases search without an index
+        Index(
+            "chatmessage_content_search_index",
+            text(f"to_tsvector('{CONTENT_SEARCH_CONFIG}'::regconfig, content)"),
+            postgresql_using="gin",
+        ).ddl_if(dialect="postgresql"),
+    )
@@ -0,0 +1,18 @@
+from datetime import datetime
+
+from sqlmodel import Field, Index, SQLModel
+
+from chat_server.models.types import UUIDString
+
+
+class MessageEmbedding(SQLModel, table=True):
+    # No foreign key: with write-behind persistence a message can be embedded before its row is flushed
+    message_id: str = Field(primary_key=True, sa_type=UUIDString)
+    model: str
+    dimensions: int
+    # float32 values in native byte order
+    vector: bytes
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+    # Workers load embeddings written by other workers in created_at order
+    __table_args__ = (Index("messageembedding_created_at_index", "created_at"),)
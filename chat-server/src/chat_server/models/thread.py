@@ -1,10 +1,15 @@
 import uuid
 from datetime import datetime
 
-from sqlmodel import Field, SQLModel
+from sqlmodel import Field, Index, SQLModel
+
+from chat_server.models.types import UUIDString
 
 
 class Thread(SQLModel, table=True):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()), primary_key=True)
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()), primary_key=True, sa_type=UUIDString)
     name: str
     created_at: datetime = Field(default_factory=datetime.utcnow)
+
+    # Keyset pagination orders threads by (created_at, id)
+    __table_args__ = (Index("created_at_id_index", "created_at", "id"),)
@@ -0,0 +1,49 @@
+import os
+import uuid
+
+from sqlalchemy import Dialect, LargeBinary, TypeDecorator
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.types import TypeEngine
+from sqlmodel import AutoString
+
+# Opt-in compact storage: UUID columns become native 16-byte values and message bodies use faster compression.
+# The server and the migration step must agree on it, so set it for both.
+COMPACT_STORAGE = os.environ.get("COMPACT_STORAGE", "false").lower() == "true"
+
+
+class InvalidIdentifierError(Exception):
+    pass
+
+
+class UUIDString(TypeDecorator):
+    """A UUID that is a canonical string in Python.
+
+    It is stored as a string unless compact storage is enabled, in which case it is stored as a native ``uuid`` on
+    Postgres and as 16 bytes elsewhere. A string that is not a UUID then cannot match any row, and binding it raises
+    ``InvalidIdentifierError``.
+    """
+
+    impl = AutoString
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect: Dialect) -> TypeEngine:
+        if not COMPACT_STORAGE:
+            return dialect.type_descriptor(AutoString())
+        if dialect.name == "postgresql":
+            return dialect.type_descriptor(postgresql.UUID(as_uuid=False))
+        return dialect.type_descriptor(LargeBinary(16))
+
+    def process_bind_param(self, value: str | None, dialect: Dialect) -> str | bytes | None:
+        if value is None or not COMPACT_STORAGE:
+            return value
+        try:
+            parsed = uuid.UUID(value)
+        except (ValueError, TypeError, AttributeError) as e:
+            invalid_identifier_error = f"Invalid identifier: {value}"
+            raise InvalidIdentifierError(invalid_identifier_error) from e
+        return str(parsed) if dialect.name == "postgresql" else parsed.bytes
+
+    def process_result_value(self, value: str | bytes | None, dialect: Dialect) -> str | None:
+        if value is None or not COMPACT_STORAGE or dialect.name == "postgresql":
+            return value
+        return str(uuid.UUID(bytes=value))
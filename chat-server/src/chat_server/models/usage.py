@@ -0,0 +1,30 @@
+from datetime import date, datetime
+
+from sqlmodel import Field, SQLModel
+
+from chat_server.models.types import UUIDString
+
+
+class UsageCounters(SQLModel):
+    """Running totals over the generations of one rollup; rows are only ever incremented."""
+
+    generations: int = 0
+    input_tokens: int = 0
+    cached_input_tokens: int = 0
+    output_tokens: int = 0
+    # Summed over generations, so the average is latency_seconds / generations
+    latency_seconds: float = 0
+    cost_usd: float = 0
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class ThreadUsage(UsageCounters, table=True):
+    # No foreign key: one row for a thread that no longer exists must not fail the whole batch
+    thread_id: str = Field(primary_key=True, sa_type=UUIDString)
+    model: str = Field(primary_key=True)
+
+
+class DailyUsage(UsageCounters, table=True):
+    # UTC day the generations finished on
+    day: date = Field(primary_key=True)
+    model: str = Field(primary_key=True)
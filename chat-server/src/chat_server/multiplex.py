@@ -0,0 +1,124 @@
+import asyncio
+import contextlib
+import json
+import os
+from collections.abc import AsyncGenerator
+from typing import Literal
+
+from fastapi import WebSocket
+from pydantic import BaseModel, Field
+
+from chat_server.metrics import WEBSOCKET_STREAMS
+from chat_server.utils.logging import sampled_logger
+
+# Chunk frames each stream may send before the client grants more, like an HTTP/2 stream's initial window
+WEBSOCKET_STREAM_WINDOW = int(os.environ.get("WEBSOCKET_STREAM_WINDOW", "64"))
+WEBSOCKET_MAX_STREAMS = int(os.environ.get("WEBSOCKET_MAX_STREAMS", "32"))
+CHUNK_FRAME = "chunk"
+
+
+class MultiplexError(Exception):
+    pass
+
+
+class ClientFrame(BaseModel):
+    # Chosen by the client; every frame the server sends about the request carries it
+    id: str
+    type: Literal["chat", "compare", "select", "window", "cancel"]
+    # chat, compare and select: the thread and the body of the matching HTTP request
+    thread_id: str | None = None
+    body: dict | None = None
+    # window: how many more chunk frames the stream may send
+    increment: int = Field(default=0, ge=0)
+
+
+class StreamWindow:
+    """Chunk frames a stream may still send; a stream that has used them up waits for the client to grant more."""
+
+    def __init__(self, size: int) -> None:
+        self.credits = size
+        self._granted = asyncio.Event()
+
+    async def acquire(self) -> None:
+        while self.credits <= 0:
+            self._granted.clear()
+            await self._granted.wait()
+        self.credits -= 1
+
+    def grant(self, increment: int) -> None:
+        self.credits += increment
+        self._granted.set()
+
+
+class Multiplexer:
+    """Sends the frames of many concurrent streams over one WebSocket, each frame tagged with its stream's id.
+
+    Every stream runs as its own task, so a slow one never holds up the others. Chunk frames are flow controlled per
+    stream: once a stream has used up its window it stops reading its source until the client grants more, while
+    control frames (started, done, error) are always sent. A stream's source is closed when the stream is cancelled or
+    the connection goes away.
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        *,
+        window: int = WEBSOCKET_STREAM_WINDOW,
+        max_streams: int = WEBSOCKET_MAX_STREAMS,
+    ) -> None:
+        self.websocket = websocket
+        self.window = window
+        self.max_streams = max_streams
+        self._streams: dict[str, tuple[asyncio.Task, StreamWindow]] = {}
+        # Frames from concurrent streams must not interleave on the socket
+        self._send_lock = asyncio.Lock()
+
+    async def send(self, frame: dict) -> None:
+        async with self._send_lock:
+            await self.websocket.send_text(json.dumps(frame))
+
+    def open(self, stream_id: str, frames: AsyncGenerator[dict, None]) -> None:
+        """Start sending ``frames`` as the stream ``stream_id``."""
+        if stream_id in self._streams:
+            duplicate_error = f"Stream {stream_id} is already open"
+            raise MultiplexError(duplicate_error)
+        if len(self._streams) >= self.max_streams:
+            too_many_error = f"At most {self.max_streams} streams can be open on one connection"
+            raise MultiplexError(too_many_error)
+        window = StreamWindow(self.window)
+        task = asyncio.create_task(self._forward(stream_id, frames, window))
+        self._streams[stream_id] = (task, window)
+        WEBSOCKET_STREAMS.inc()
+        task.add_done_callback(lambda _: self._close(stream_id))
+
+    def grant(self, stream_id: str, increment: int) -> None:
+        # A grant can cross a stream's last frame on the wire, so one for a stream that has ended is ignored
+        if stream_id in self._streams:
+            self._streams[stream_id][1].grant(increment)
+
+    def cancel(self, stream_id: str) -> None:
+        if stream_id in self._streams:
+            self._streams[stream_id][0].cancel()
+
+    async def aclose(self) -> None:
+        tasks = [task for task, _ in self._streams.values()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _forward(self, stream_id: str, frames: AsyncGenerator[dict, None], window: StreamWindow) -> None:
+        try:
+            async with contextlib.aclosing(frames):
+                async for frame in frames:
+                    if frame["type"] == CHUNK_FRAME:
+                        await window.acquire()
+                    await self.send({"id": stream_id, **frame})
+        except Exception as e:  # noqa: BLE001
+            sampled_logger.error(f"Error in WebSocket stream {stream_id}: {e}")
+            # The connection may be the thing that failed
+            with contextlib.suppress(Exception):
+                await self.send({"id": stream_id, "type": "error", "code": "internal", "message": str(e)})
+
+    def _close(self, stream_id: str) -> None:
+        del self._streams[stream_id]
+        WEBSOCKET_STREAMS.dec()
@@ -0,0 +1,146 @@
+import asyncio
+import contextlib
+import os
+
+from chat_server.db import async_session
+from chat_server.metrics import WRITE_BEHIND_DROPPED_MESSAGES
+from chat_server.models.chat import ChatMessage as ChatMessageModel
+from chat_server.utils.logging import logger
+
+WRITE_BEHIND_ENABLED = os.environ.get("WRITE_BEHIND_ENABLED", "false").lower() == "true"
+WRITE_BEHIND_BATCH_SIZE = int(os.environ.get("WRITE_BEHIND_BATCH_SIZE", "200"))
+WRITE_BEHIND_FLUSH_INTERVAL = float(os.environ.get("WRITE_BEHIND_FLUSH_INTERVAL", "0.25"))
+WRITE_BEHIND_MAX_ATTEMPTS = int(os.environ.get("WRITE_BEHIND_MAX_ATTEMPTS", "3"))
+
+
+class TurnPersistError(Exception):
+    pass
+
+
+class TurnPersister:
+    """Persists completed chat turns, either immediately or through a write-behind buffer.
+
+    In write-behind mode turns are buffered and written by a background task in one multi-row insert per flush, once
+    ``batch_size`` rows are pending or every ``flush_interval`` seconds. Reads of a thread must call
+    ``wait_for_thread`` first: it forces a flush of that thread's pending rows so the reader sees its own writes.
+    The guarantee is per worker process; rows buffered by another worker become visible after its next flush.
+
+    A batch that still fails after ``max_attempts`` flushes is dropped and counted in ``WRITE_BEHIND_DROPPED_MESSAGES``,
+    and ``wait_for_thread`` raises TurnPersistError for its threads instead of returning as if the rows were written.
+    """
+
+    def __init__(
+        self,
+        *,
+        write_behind: bool = WRITE_BEHIND_ENABLED,
+        batch_size: int = WRITE_BEHIND_BATCH_SIZE,
+        flush_interval: float = WRITE_BEHIND_FLUSH_INTERVAL,
+        max_attempts: int = WRITE_BEHIND_MAX_ATTEMPTS,
+    ) -> None:
+        self.write_behind = write_behind
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self._buffer: list[ChatMessageModel] = []
+        self._attempts = 0
+        self._batch_done: asyncio.Future[None] | None = None
+        # thread_id -> completion future of the batch holding that thread's newest pending rows
+        self._pending_threads: dict[str, asyncio.Future[None]] = {}
+        self._wake = asyncio.Event()
+        self._stopping = False
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if self.write_behind and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        # Let the loop finish its current flush rather than cancelling it mid-commit
+        self._stopping = True
+        self._wake.set()
+        await self._task
+        self._task = None
+        # Drain whatever is still buffered, including batches that were waiting on a retry
+        while self._buffer:
+            await self._flush()
+
+    async def persist(self, thread_id: str, rows: list[ChatMessageModel]) -> None:
+        if not self.write_behind:
+            async with async_session() as session:
+                await session.connection(execution_options={"isolation_level": "SERIALIZABLE"})
+                session.add_all(rows)
+                await session.commit()
+            return
+
+        if self._batch_done is None:
+            self._batch_done = asyncio.get_running_loop().create_future()
+        self._buffer.extend(rows)
+        self._pending_threads[thread_id] = self._batch_done
+        if len(self._buffer) >= self.batch_size:
+            self._wake.set()
+
+    async def wait_for_thread(self, thread_id: str) -> None:
+        batch_done = self._pending_threads.get(thread_id)
+        if batch_done is None:
+            return
+        self._wake.set()
+        await asyncio.shield(batch_done)
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            self._wake.clear()
+            if self._buffer:
+                await self._flush()
+
+    async def _flush(self) -> None:
+        rows, self._buffer = self._buffer, []
+        batch_done, self._batch_done = self._batch_done, None
+        try:
+            async with async_session() as session:
+                # The ORM flush sends all rows as a single multi-row INSERT
+                session.add_all(rows)
+                await session.commit()
+        except Exception as e:  # noqa: BLE001
+            self._attempts += 1
+            if self._attempts < self.max_attempts:
+                logger.warning(f"Write-behind flush of {len(rows)} rows failed, retrying: {e}")
+                self._requeue(rows, batch_done)
+                return
+            logger.error(f"Dropping {len(rows)} chat messages after {self._attempts} failed flushes: {e}")
+            WRITE_BEHIND_DROPPED_MESSAGES.inc(len(rows))
+            error = TurnPersistError(f"Chat messages could not be saved after {self._attempts} attempts: {e}")
+        else:
+            error = None
+        self._attempts = 0
+        for thread_id in [t for t, done in self._pending_threads.items() if done is batch_done]:
+            del self._pending_threads[thread_id]
+        if batch_done is not None:
+            _resolve(batch_done, error)
+
+    def _requeue(self, rows: list[ChatMessageModel], batch_done: asyncio.Future[None] | None) -> None:
+        self._buffer = rows + self._buffer
+        if self._batch_done is None:
+            self._batch_done = batch_done
+            return
+        # Rows arrived while flushing; waiters on the failed batch now wait for the combined retry
+        for thread_id, done in self._pending_threads.items():
+            if done is batch_done:
+                self._pending_threads[thread_id] = self._batch_done
+        if batch_done is not None:
+            self._batch_done.add_done_callback(lambda combined: _resolve(batch_done, combined.exception()))
+
+
+def _resolve(batch_done: asyncio.Future[None], error: BaseException | None) -> None:
+    if error is None:
+        batch_done.set_result(None)
+        return
+    batch_done.set_exception(error)
+    # Marked as retrieved, since a batch nobody is waiting for has already been logged and counted
+    batch_done.exception()
+
+
+turn_persister = TurnPersister()
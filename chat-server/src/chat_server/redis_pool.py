@@ -0,0 +1,65 @@
+import os
+import time
+from typing import Any
+
+from dotenv import load_dotenv
+from redis.asyncio import ConnectionPool, Redis
+from redis.asyncio.client import Pipeline
+
+from chat_server.metrics import REDIS_COMMAND_SECONDS
+
+load_dotenv()
+
+redis_url = os.environ["REDIS_URL"]
+redis_port = int(os.environ["REDIS_PORT"])
+redis_db = int(os.environ["REDIS_DB"])
+REDIS_MAX_CONNECTIONS = int(os.environ.get("REDIS_MAX_CONNECTIONS", "50"))
+# Readers tailing a generation hold a connection for the whole of each blocking XREAD, one per attached stream, so
+# they have their own pool and cannot starve the commands every stream needs of connections
+GENERATION_READER_MAX_CONNECTIONS = int(os.environ.get("GENERATION_READER_MAX_CONNECTIONS", "1000"))
+# The response cache belongs on its own Redis instance that evicts under memory pressure, so that generation, comparison
+# and scheduling state on the main instance is never evicted; it shares the main instance when these are unset
+response_cache_redis_url = os.environ.get("RESPONSE_CACHE_REDIS_URL", redis_url)
+response_cache_redis_port = int(os.environ.get("RESPONSE_CACHE_REDIS_PORT", str(redis_port)))
+response_cache_redis_db = int(os.environ.get("RESPONSE_CACHE_REDIS_DB", str(redis_db)))
+
+
+class InstrumentedPipeline(Pipeline):
+    async def execute(self, raise_on_error: bool = True) -> list[Any]:  # noqa: FBT001, FBT002
+        started = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        finally:
+            REDIS_COMMAND_SECONDS.labels("PIPELINE").observe(time.perf_counter() - started)
+
+
+class InstrumentedRedis(Redis):
+    """Redis client that records the round trip time of every command and pipeline."""
+
+    async def execute_command(self, *args: Any, **options: Any) -> Any:  # noqa: ANN401
+        started = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            REDIS_COMMAND_SECONDS.labels(str(args[0]).upper()).observe(time.perf_counter() - started)
+
+    def pipeline(self, transaction: bool = True, shard_hint: str | None = None) -> Pipeline:  # noqa: FBT001, FBT002
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+redis_pool = ConnectionPool(host=redis_url, port=redis_port, db=redis_db, max_connections=REDIS_MAX_CONNECTIONS)
+redis_client = InstrumentedRedis(connection_pool=redis_pool)
+generation_reader_redis_pool = ConnectionPool(
+    host=redis_url,
+    port=redis_port,
+    db=redis_db,
+    max_connections=GENERATION_READER_MAX_CONNECTIONS,
+)
+generation_reader_redis_client = InstrumentedRedis(connection_pool=generation_reader_redis_pool)
+response_cache_redis_pool = ConnectionPool(
+    host=response_cache_redis_url,
+    port=response_cache_redis_port,
+    db=response_cache_redis_db,
+    max_connections=REDIS_MAX_CONNECTIONS,
+)
+response_cache_redis_client = InstrumentedRedis(connection_pool=response_cache_redis_pool)
@@ -0,0 +1,217 @@
+import asyncio
+import contextlib
+import os
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING
+
+from sqlmodel import select
+
+from chat_server.context.window import CHARS_PER_TOKEN
+from chat_server.db import async_session
+from chat_server.llm.clients import provider_clients
+from chat_server.models.chat import ChatMessage as ChatMessageModel
+from chat_server.models.embedding import MessageEmbedding
+from chat_server.utils.logging import logger, sampled_logger
+
+if TYPE_CHECKING:
+    import numpy as np
+
+    from chat_server.search.vectors import VectorIndex
+
+SEMANTIC_SEARCH_ENABLED = os.environ.get("SEMANTIC_SEARCH_ENABLED", "false").lower() == "true"
+EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "text-embedding-3-small")
+# 256 dimensions keep a million messages at 1 GB of float32 per worker
+EMBEDDING_DIMENSIONS = int(os.environ.get("EMBEDDING_DIMENSIONS", "256"))
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", "100"))
+EMBEDDING_FLUSH_INTERVAL = float(os.environ.get("EMBEDDING_FLUSH_INTERVAL", "1"))
+EMBEDDING_MAX_INPUT_CHARS = int(8000 * CHARS_PER_TOKEN)
+# How often each worker loads the embeddings written by the other workers
+SEMANTIC_SEARCH_REFRESH_INTERVAL = float(os.environ.get("SEMANTIC_SEARCH_REFRESH_INTERVAL", "5"))
+# Rows that another worker commits with an earlier created_at than the last one loaded are still picked up within this
+SEMANTIC_SEARCH_REFRESH_LOOKBACK = float(os.environ.get("SEMANTIC_SEARCH_REFRESH_LOOKBACK", "60"))
+# Ranked results can be paged through up to this depth
+SEMANTIC_SEARCH_MAX_RESULTS = int(os.environ.get("SEMANTIC_SEARCH_MAX_RESULTS", "200"))
+SEMANTIC_SEARCH_LOAD_BATCH_SIZE = 10_000
+
+
+class SemanticSearchDisabledError(Exception):
+    pass
+
+
+class SemanticSearch:
+    """Embedding-based search over message content, exact over every embedded message.
+
+    Embeddings are stored in the messageembedding table, and each worker holds all of them in a ``VectorIndex``: it
+    loads them on start, embeds the messages it persists itself in background batches, and loads the rows written by
+    other workers every ``refresh_interval`` seconds. Messages persisted before semantic search was enabled are
+    embedded by running this module. NumPy is only imported once semantic search is enabled.
+    """
+
+    def __init__(
+        self,
+        *,
+        enabled: bool = SEMANTIC_SEARCH_ENABLED,
+        model: str = EMBEDDING_MODEL,
+        dimensions: int = EMBEDDING_DIMENSIONS,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+    ) -> None:
+        self.enabled = enabled
+        self.model = model
+        self.dimensions = dimensions
+        self.batch_size = batch_size
+        self.flush_interval = EMBEDDING_FLUSH_INTERVAL
+        self.refresh_interval = SEMANTIC_SEARCH_REFRESH_INTERVAL
+        self.refresh_lookback = timedelta(seconds=SEMANTIC_SEARCH_REFRESH_LOOKBACK)
+        self.max_results = SEMANTIC_SEARCH_MAX_RESULTS
+        self.index: VectorIndex | None = None
+        self._pending: list[ChatMessageModel] = []
+        self._loaded_until: datetime | None = None
+        self._wake = asyncio.Event()
+        self._stopping = False
+        self._task: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        if not self.enabled or self._task is not None:
+            return
+        from chat_server.search.vectors import VectorIndex  # noqa: PLC0415
+
+        self.index = VectorIndex(self.dimensions)
+        await self.refresh()
+        logger.info(f"Loaded {len(self.index)} message embeddings")
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wake.set()
+        await self._task
+        self._task = None
+        while self._pending:
+            await self._index_pending()
+
+    def enqueue(self, messages: list[ChatMessageModel]) -> None:
+        """Embed and index ``messages`` in the background; a no-op when semantic search is disabled."""
+        if self.index is None:
+            return
+        self._pending.extend(message for message in messages if message.content)
+        if len(self._pending) >= self.batch_size:
+            self._wake.set()
+
+    async def search(self, query: str, limit: int, offset: int = 0) -> list[tuple[str, float]]:
+        """Return up to ``limit`` (message id, cosine similarity) pairs after the first ``offset``, best first."""
+        if self.index is None:
+            semantic_search_disabled_error = "Semantic search is not enabled"
+            raise SemanticSearchDisabledError(semantic_search_disabled_error)
+        k = min(offset + limit, self.max_results)
+        if k <= offset:
+            return []
+        [query_vector] = await self._embed([query])
+        # A million rows take tens of milliseconds to score, which must not stall the event loop
+        results = await asyncio.to_thread(self.index.search, query_vector, k)
+        return results[offset:]
+
+    async def refresh(self) -> None:
+        """Load embeddings written since the last refresh, by any worker."""
+        import numpy as np  # noqa: PLC0415
+
+        statement = (
+            select(MessageEmbedding)
+            .where(MessageEmbedding.model == self.model, MessageEmbedding.dimensions == self.dimensions)
+            .order_by(MessageEmbedding.created_at)
+        )
+        if self._loaded_until is not None:
+            statement = statement.where(MessageEmbedding.created_at > self._loaded_until - self.refresh_lookback)
+        async with async_session() as session:
+            rows = await session.stream_scalars(statement.execution_options(yield_per=SEMANTIC_SEARCH_LOAD_BATCH_SIZE))
+            async for batch in rows.partitions():
+                vectors = np.frombuffer(b"".join(row.vector for row in batch), dtype=np.float32)
+                self.index.add([row.message_id for row in batch], vectors.reshape(len(batch), self.dimensions))
+                self._loaded_until = batch[-1].created_at
+
+    async def backfill(self) -> int:
+        """Embed every message that has no embedding yet, returning how many were embedded."""
+        embedded = 0
+        while True:
+            statement = (
+                select(ChatMessageModel)
+                .where(~select(MessageEmbedding).where(MessageEmbedding.message_id == ChatMessageModel.id).exists())
+                .where(ChatMessageModel.content != "")
+                .limit(self.batch_size)
+            )
+            async with async_session() as session:
+                messages = list((await session.exec(statement)).all())
+            if not messages:
+                return embedded
+            await self._store(messages, await self._embed([message.content for message in messages]))
+            embedded += len(messages)
+            logger.info(f"Embedded {embedded} messages")
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        refreshed_at = loop.time()
+        while not self._stopping:
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            self._wake.clear()
+            await self._index_pending()
+            if loop.time() - refreshed_at >= self.refresh_interval:
+                refreshed_at = loop.time()
+                try:
+                    await self.refresh()
+                except Exception as e:  # noqa: BLE001
+                    sampled_logger.error(f"Failed to load new message embeddings: {e}")
+
+    async def _index_pending(self) -> None:
+        messages, self._pending = self._pending[: self.batch_size], self._pending[self.batch_size :]
+        if not messages:
+            return
+        try:
+            vectors = await self._embed([message.content for message in messages])
+            await self._store(messages, vectors)
+        except Exception as e:  # noqa: BLE001
+            # Messages that failed are left for the backfill
+            sampled_logger.error(f"Failed to embed {len(messages)} messages: {e}")
+            return
+        self.index.add([message.id for message in messages], vectors)
+
+    async def _store(self, messages: list[ChatMessageModel], vectors: "np.ndarray") -> None:
+        async with async_session() as session:
+            session.add_all(
+                MessageEmbedding(
+                    message_id=message.id,
+                    model=self.model,
+                    dimensions=self.dimensions,
+                    vector=vector.tobytes(),
+                )
+                for message, vector in zip(messages, vectors, strict=True)
+            )
+            await session.commit()
+
+    async def _embed(self, texts: list[str]) -> "np.ndarray":
+        import numpy as np  # noqa: PLC0415
+
+        response = await provider_clients.get_openai().embeddings.create(
+            model=self.model,
+            input=[text[:EMBEDDING_MAX_INPUT_CHARS] for text in texts],
+            dimensions=self.dimensions,
+        )
+        return np.array([item.embedding for item in response.data], dtype=np.float32)
+
+
+semantic_search = SemanticSearch()
+
+
+def main() -> None:
+    """Embed the messages persisted before semantic search was enabled."""
+
+    async def backfill() -> None:
+        embedded = await semantic_search.backfill()
+        await provider_clients.aclose()
+        logger.info(f"Backfill complete ({embedded} messages embedded)")
+
+    asyncio.run(backfill())
+
+
+if __name__ == "__main__":
+    main()
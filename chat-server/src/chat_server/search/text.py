@@ -0,0 +1,56 @@
+import os
+from datetime import datetime
+
+from sqlalchemy import func, literal_column, tuple_
+from sqlalchemy.exc import OperationalError
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from chat_server.models.chat import CONTENT_SEARCH_CONFIG
+from chat_server.models.chat import ChatMessage as ChatMessageModel
+from chat_server.models.thread import Thread as ThreadModel
+
+# Upper bound on the time spent answering one search request
+SEARCH_TIMEOUT = float(os.environ.get("SEARCH_TIMEOUT", "2"))
+QUERY_CANCELED_SQLSTATE = "57014"
+
+
+class SearchTimeoutError(Exception):
+    pass
+
+
+async def search_text(
+    session: AsyncSession,
+    query: str,
+    limit: int,
+    after: tuple[datetime, str] | None = None,
+    timeout: float = SEARCH_TIMEOUT,
+) -> list[tuple[ChatMessageModel, ThreadModel]]:
+    """Return up to ``limit`` messages matching ``query`` with their threads, newest first, after keyset ``after``.
+
+    On Postgres the query is parsed like a web search (quoted phrases, ``or``, ``-word``), matched through the GIN index
+    on message content and cancelled after ``timeout`` seconds. Other databases fall back to a substring match.
+    """
+    statement = (
+        select(ChatMessageModel, ThreadModel)
+        .join(ThreadModel, ThreadModel.id == ChatMessageModel.thread_id)
+        .order_by(ChatMessageModel.created_at.desc(), ChatMessageModel.id.desc())
+        .limit(limit)
+    )
+    if after is not None:
+        statement = statement.where(tuple_(ChatMessageModel.created_at, ChatMessageModel.id) < tuple_(*after))
+    if session.bind.dialect.name != "postgresql":
+        return list((await session.exec(statement.where(ChatMessageModel.content.icontains(query)))).all())
+
+    # The same expression as the index, so the planner can use it
+    config = literal_column(f"'{CONTENT_SEARCH_CONFIG}'::regconfig")
+    matches = func.to_tsvector(config, ChatMessageModel.content).op("@@")(func.websearch_to_tsquery(config, query))
+    # Unlike SET LOCAL, set_config accepts a bound parameter; either way the timeout ends with the transaction
+    await session.exec(select(func.set_config("statement_timeout", str(int(timeout * 1000)), True)))  # noqa: FBT003
+    try:
+        return list((await session.exec(statement.where(matches))).all())
+    except OperationalError as e:
+        if getattr(e.orig, "sqlstate", None) == QUERY_CANCELED_SQLSTATE:
+            search_timeout_error = f"Search timed out after {timeout:.1f}s"
+            raise SearchTimeoutError(search_timeout_error) from e
+        raise
@@ -0,0 +1,72 @@
+import os
+
+import numpy as np
+
+# Rows scored per matrix-vector product, so the temporary score array stays in cache however large the index grows
+VECTOR_SEARCH_BATCH_ROWS = int(os.environ.get("VECTOR_SEARCH_BATCH_ROWS", "65536"))
+MIN_CAPACITY = 1024
+
+
+class VectorIndex:
+    """In-memory nearest neighbour index of unit vectors, searched exactly by cosine similarity.
+
+    Vectors live in one float32 matrix whose capacity doubles as it fills, so adding a batch is amortized O(batch).
+    A search scores the matrix in blocks of ``batch_rows`` with one BLAS matrix-vector product per block, keeping only
+    each block's top k candidates. Rows are never modified once added, so a search can run in another thread while
+    vectors are being added.
+    """
+
+    def __init__(self, dimensions: int, batch_rows: int = VECTOR_SEARCH_BATCH_ROWS) -> None:
+        self.dimensions = dimensions
+        self.batch_rows = batch_rows
+        self.ids: list[str] = []
+        self._positions: dict[str, int] = {}
+        self._matrix = np.empty((0, dimensions), dtype=np.float32)
+
+    def __len__(self) -> int:
+        """Return the number of vectors in the index."""
+        return len(self.ids)
+
+    def add(self, ids: list[str], vectors: np.ndarray) -> None:
+        """Add vectors (one row per id), ignoring ids that are already indexed."""
+        new_rows = [row for row, item_id in enumerate(ids) if item_id not in self._positions]
+        if not new_rows:
+            return
+        vectors = _normalize(np.asarray(vectors, dtype=np.float32)[new_rows])
+        size = len(self.ids)
+        if size + len(new_rows) > len(self._matrix):
+            capacity = max(size + len(new_rows), 2 * len(self._matrix), MIN_CAPACITY)
+            matrix = np.empty((capacity, self.dimensions), dtype=np.float32)
+            matrix[:size] = self._matrix[:size]
+            self._matrix = matrix
+        self._matrix[size : size + len(new_rows)] = vectors
+        for offset, row in enumerate(new_rows):
+            self._positions[ids[row]] = size + offset
+            self.ids.append(ids[row])
+
+    def search(self, query: np.ndarray, k: int) -> list[tuple[str, float]]:
+        """Return the ``k`` most similar ids with their cosine similarity, most similar first."""
+        size = len(self.ids)
+        if size == 0 or k <= 0:
+            return []
+        query = _normalize(np.asarray(query, dtype=np.float32)[np.newaxis])[0]
+        best_positions = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+        for start in range(0, size, self.batch_rows):
+            scores = self._matrix[start : min(start + self.batch_rows, size)] @ query
+            positions = np.arange(start, start + len(scores))
+            if len(scores) > k:
+                top = np.argpartition(scores, -k)[-k:]
+                scores, positions = scores[top], positions[top]
+            best_scores = np.concatenate([best_scores, scores])
+            best_positions = np.concatenate([best_positions, positions])
+            if len(best_scores) > k:
+                top = np.argpartition(best_scores, -k)[-k:]
+                best_scores, best_positions = best_scores[top], best_positions[top]
+        order = np.argsort(-best_scores, kind="stable")
+        return [(self.ids[best_positions[i]], float(best_scores[i])) for i in order]
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
@@ -0,0 +1,59 @@
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import uvicorn
+
+from chat_server.utils.logging import configure_logging
+
+SERVER_HOST = os.environ.get("SERVER_HOST", "0.0.0.0")  # noqa: S104
+SERVER_PORT = int(os.environ.get("SERVER_PORT", "8000"))
+SERVER_WORKERS = int(os.environ.get("SERVER_WORKERS", str(os.cpu_count() or 1)))
+# How long a worker waits for open responses to complete after SIGTERM; detached generations are then drained by the
+# application's lifespan for up to GENERATION_DRAIN_TIMEOUT
+SERVER_GRACEFUL_SHUTDOWN_TIMEOUT = int(os.environ.get("SERVER_GRACEFUL_SHUTDOWN_TIMEOUT", "30"))
+
+
+def main() -> None:
+    """Run the API with ``SERVER_WORKERS`` worker processes.
+
+    The schema must already be up to date (``chat-server-migrate``). With more than one worker Prometheus metrics are
+    written to a shared directory so /metrics reports all workers. On SIGTERM the supervisor forwards the signal to
+    every worker, which stops accepting connections and drains before exiting. The provider stream caps
+    (``*_MAX_CONCURRENT_STREAMS``) are for the server as a whole, and each worker schedules within its share of them.
+    """
+    configure_logging()
+    # Workers read it to split the provider stream caps between them
+    os.environ["SERVER_WORKERS"] = str(SERVER_WORKERS)
+    metrics_dir = _prepare_metrics_dir() if SERVER_WORKERS > 1 else None
+    try:
+        uvicorn.run(
+            "chat_server.main:app",
+            host=SERVER_HOST,
+            port=SERVER_PORT,
+            workers=SERVER_WORKERS,
+            timeout_graceful_shutdown=SERVER_GRACEFUL_SHUTDOWN_TIMEOUT,
+            # uvicorn's own handlers would format and write every access log line on the event loop
+            log_config=None,
+        )
+    finally:
+        if metrics_dir is not None:
+            shutil.rmtree(metrics_dir, ignore_errors=True)
+
+
+def _prepare_metrics_dir() -> Path | None:
+    """Point workers at an empty multiprocess metrics directory, returning it if it was created here."""
+    configured = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if configured is None:
+        metrics_dir = Path(tempfile.mkdtemp(prefix="chat-server-metrics-"))
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = str(metrics_dir)
+        return metrics_dir
+    # Files left by a previous run would be aggregated with this one's
+    for stale in Path(configured).glob("*.db"):
+        stale.unlink()
+    return None
+
+
+if __name__ == "__main__":
+    main()
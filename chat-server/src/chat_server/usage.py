@@ -0,0 +1,253 @@
+import asyncio
+import contextlib
+import math
+import os
+import time
+from collections.abc import AsyncGenerator
+from dataclasses import dataclass, replace
+from datetime import date, datetime
+
+from sqlalchemy import Insert, func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from chat_server.context.window import CHARS_PER_TOKEN
+from chat_server.db import async_session
+from chat_server.generated.models import Model
+from chat_server.llm.llm import Usage
+from chat_server.llm.resilience import ResilientStream
+from chat_server.metrics import LLM_COST_USD, LLM_TOKENS
+from chat_server.models.usage import DailyUsage, ThreadUsage, UsageCounters
+from chat_server.utils.logging import logger
+
+USAGE_FLUSH_INTERVAL = float(os.environ.get("USAGE_FLUSH_INTERVAL", "2"))
+USAGE_FLUSH_MAX_ATTEMPTS = int(os.environ.get("USAGE_FLUSH_MAX_ATTEMPTS", "5"))
+COUNTERS = ("generations", "input_tokens", "cached_input_tokens", "output_tokens", "latency_seconds", "cost_usd")
+
+
+@dataclass(frozen=True)
+class ModelPrices:
+    # US dollars per million tokens
+    input: float
+    output: float
+    # None when the provider gives no discount for cached input
+    cached_input: float | None = None
+    # None when writing to the prompt cache costs the same as regular input
+    cache_write: float | None = None
+
+    def cost(self, usage: Usage) -> float:
+        cached_input = self.input if self.cached_input is None else self.cached_input
+        cache_write = self.input if self.cache_write is None else self.cache_write
+        return (
+            _uncached_input_tokens(usage) * self.input
+            + usage.cached_input_tokens * cached_input
+            + usage.cache_write_input_tokens * cache_write
+            + usage.output_tokens * self.output
+        ) / 1_000_000
+
+
+# List prices. Costs are computed when a generation is recorded, so a price change only applies to later ones.
+MODEL_PRICES = {
+    Model.gpt_3_5_turbo: ModelPrices(input=0.5, output=1.5),
+    Model.gpt_4_turbo: ModelPrices(input=10, output=30),
+    Model.gpt_4o: ModelPrices(input=2.5, output=10, cached_input=1.25),
+    Model.gpt_4o_mini: ModelPrices(input=0.15, output=0.6, cached_input=0.075),
+    Model.gpt_4_5_preview: ModelPrices(input=75, output=150, cached_input=37.5),
+    Model.o1: ModelPrices(input=15, output=60, cached_input=7.5),
+    Model.o1_mini: ModelPrices(input=1.1, output=4.4, cached_input=0.55),
+    Model.o3_mini: ModelPrices(input=1.1, output=4.4, cached_input=0.55),
+    Model.claude_2_1: ModelPrices(input=8, output=24),
+    Model.claude_3_opus_20240229: ModelPrices(input=15, output=75, cached_input=1.5, cache_write=18.75),
+    Model.claude_3_5_haiku_20241022: ModelPrices(input=0.8, output=4, cached_input=0.08, cache_write=1),
+    Model.claude_3_5_sonnet_20241022: ModelPrices(input=3, output=15, cached_input=0.3, cache_write=3.75),
+    Model.claude_3_7_sonnet_20250219: ModelPrices(input=3, output=15, cached_input=0.3, cache_write=3.75),
+}
+
+
+class UsageRecorder:
+    """Aggregates the usage of every generation in memory and adds it to the usage rollup tables in batches.
+
+    Every ``flush_interval`` seconds the pending totals are added, with one upsert per table, to a ThreadUsage row per
+    thread and model and a DailyUsage row per day and model. Rollups are then read from those few rows instead of
+    being computed from individual generations. Increments commute, so workers flush concurrently without
+    coordinating; a failed flush keeps its totals for the next one. Usage still pending when a worker dies is lost.
+    """
+
+    def __init__(
+        self,
+        *,
+        flush_interval: float = USAGE_FLUSH_INTERVAL,
+        max_attempts: int = USAGE_FLUSH_MAX_ATTEMPTS,
+    ) -> None:
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self._threads: dict[tuple[str, str], dict[str, float]] = {}
+        self._days: dict[tuple[date, str], dict[str, float]] = {}
+        self._attempts = 0
+        self._stopping = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._stopping.set()
+        await self._task
+        self._task = None
+        await self.flush()
+
+    def record(self, thread_id: str | None, model: Model, usage: Usage, latency_seconds: float) -> None:
+        """Add a generation's usage to the rollups of its thread, if it has one, and of the current day."""
+        cost = MODEL_PRICES[model].cost(usage)
+        increment = {
+            "generations": 1,
+            "input_tokens": usage.input_tokens,
+            "cached_input_tokens": usage.cached_input_tokens,
+            "output_tokens": usage.output_tokens,
+            "latency_seconds": latency_seconds,
+            "cost_usd": cost,
+        }
+        if thread_id is not None:
+            _accumulate(self._threads, (thread_id, model.value), increment)
+        # Naive UTC, like the models' own timestamps
+        _accumulate(self._days, (datetime.utcnow().date(), model.value), increment)  # noqa: DTZ003
+        LLM_TOKENS.labels(model.value, "input").inc(_uncached_input_tokens(usage))
+        LLM_TOKENS.labels(model.value, "cached_input").inc(usage.cached_input_tokens)
+        LLM_TOKENS.labels(model.value, "cache_write_input").inc(usage.cache_write_input_tokens)
+        LLM_TOKENS.labels(model.value, "output").inc(usage.output_tokens)
+        LLM_COST_USD.labels(model.value).inc(cost)
+
+    async def track(self, stream: ResilientStream, thread_id: str, usage: Usage) -> AsyncGenerator[str, None]:
+        """Pass ``stream`` through and record ``usage`` against the model that answered, however the stream ends.
+
+        ``usage`` is the sink the stream's provider calls report to. Providers report at the end of a stream, so for one
+        cancelled or failing part way, such as an unselected or orphaned compare branch, the input is estimated from
+        the prompt and the output from the text streamed so far. A stream that ends before the provider sent a chunk or
+        reported usage, such as one rejected by the scheduler or cancelled while waiting for a slot, is not recorded.
+        """
+        started = time.perf_counter()
+        streamed: list[str] = []
+        finished = False
+        try:
+            async for chunk in stream:
+                streamed.append(chunk)
+                yield chunk
+            finished = True
+        finally:
+            # Runs on cancellation too, and never awaits, so it cannot be interrupted by it
+            if finished or streamed or _reported(usage):
+                if not finished:
+                    usage = _with_estimates(usage, "".join(streamed))
+                self.record(thread_id, stream.model, usage, time.perf_counter() - started)
+
+    async def flush(self) -> None:
+        """Add the pending totals to the rollup tables."""
+        threads, self._threads = self._threads, {}
+        days, self._days = self._days, {}
+        if not threads and not days:
+            return
+        now = datetime.utcnow()  # noqa: DTZ003
+        try:
+            async with async_session() as session:
+                conn = await session.connection()
+                # Rows are locked in key order, so concurrent flushes from several workers cannot deadlock
+                if threads:
+                    await conn.execute(
+                        _upsert(conn.dialect.name, ThreadUsage, ["thread_id", "model"]),
+                        [
+                            {"thread_id": thread_id, "model": model, "updated_at": now, **totals}
+                            for (thread_id, model), totals in sorted(threads.items())
+                        ],
+                    )
+                if days:
+                    await conn.execute(
+                        _upsert(conn.dialect.name, DailyUsage, ["day", "model"]),
+                        [
+                            {"day": day, "model": model, "updated_at": now, **totals}
+                            for (day, model), totals in sorted(days.items())
+                        ],
+                    )
+                await session.commit()
+        except Exception as e:  # noqa: BLE001
+            self._attempts += 1
+            if self._attempts >= self.max_attempts:
+                logger.error(f"Dropping usage of {len(threads)} threads after {self._attempts} failed flushes: {e}")
+                self._attempts = 0
+                return
+            logger.warning(f"Usage flush failed, retrying: {e}")
+            for key, totals in threads.items():
+                _accumulate(self._threads, key, totals)
+            for key, totals in days.items():
+                _accumulate(self._days, key, totals)
+            return
+        self._attempts = 0
+
+    async def _run(self) -> None:
+        while not self._stopping.is_set():
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._stopping.wait(), timeout=self.flush_interval)
+            await self.flush()
+
+
+def _uncached_input_tokens(usage: Usage) -> int:
+    # Input neither read from nor written to the prompt cache
+    return usage.input_tokens - usage.cached_input_tokens - usage.cache_write_input_tokens
+
+
+def _reported(usage: Usage) -> bool:
+    return bool(usage.input_tokens or usage.output_tokens)
+
+
+def _with_estimates(usage: Usage, streamed: str) -> Usage:
+    # Keep whatever the provider did report
+    return replace(
+        usage,
+        input_tokens=usage.input_tokens or usage.estimated_input_tokens,
+        output_tokens=usage.output_tokens or math.ceil(len(streamed) / CHARS_PER_TOKEN),
+    )
+
+
+def _accumulate(pending: dict, key: tuple, increment: dict[str, float]) -> None:
+    totals = pending.setdefault(key, dict.fromkeys(COUNTERS, 0))
+    for counter in COUNTERS:
+        totals[counter] += increment[counter]
+
+
+def _upsert(dialect_name: str, model: type[UsageCounters], keys: list[str]) -> Insert:
+    insert = postgresql.insert if dialect_name == "postgresql" else sqlite.insert
+    statement = insert(model)
+    table = model.__table__
+    return statement.on_conflict_do_update(
+        index_elements=keys,
+        set_={
+            **{counter: table.c[counter] + statement.excluded[counter] for counter in COUNTERS},
+            "updated_at": statement.excluded.updated_at,
+        },
+    )
+
+
+async def get_thread_usage(session: AsyncSession, thread_id: str) -> dict[str, UsageCounters]:
+    """Return the usage of each model in a thread."""
+    statement = select(ThreadUsage).where(ThreadUsage.thread_id == thread_id).order_by(ThreadUsage.model)
+    return {row.model: row for row in (await session.exec(statement)).all()}
+
+
+async def get_model_usage(session: AsyncSession, since: date | None, until: date | None) -> dict[str, UsageCounters]:
+    """Return the usage of each model between ``since`` and ``until`` (UTC days, inclusive), summed over days."""
+    statement = select(
+        DailyUsage.model,
+        *(func.sum(getattr(DailyUsage, counter)).label(counter) for counter in COUNTERS),
+    ).group_by(DailyUsage.model)
+    if since is not None:
+        statement = statement.where(DailyUsage.day >= since)
+    if until is not None:
+        statement = statement.where(DailyUsage.day <= until)
+    rows = (await session.exec(statement.order_by(DailyUsage.model))).all()
+    return {row.model: UsageCounters(**{counter: getattr(row, counter) for counter in COUNTERS}) for row in rows}
+
+
+usage_recorder = UsageRecorder()
@@ -1,9 +1,141 @@
+import atexit
+import contextlib
+import json
 import logging
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
 
-# Configure the root logger
-logging.basicConfig(
-    level=logging.DEBUG, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", datefmt="%Y-%m-%d %H:%M:%S"
-)
+# Level of the application's own loggers
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+# Level of everything else (HTTP clients, SDKs, database drivers), which is very chatty at DEBUG
+LOG_LIBRARY_LEVEL = os.environ.get("LOG_LIBRARY_LEVEL", "WARNING").upper()
+# "text" for human-readable lines, "json" for one JSON object per line
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text").lower()
+# Repeated records from the same call site on a sampled logger are dropped for this many seconds after one is emitted
+LOG_SAMPLE_INTERVAL = float(os.environ.get("LOG_SAMPLE_INTERVAL", "10"))
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+TEXT_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Attributes every LogRecord has; anything else on a record was passed through ``extra`` and is kept in JSON output
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES})
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Lets through at most one record per call site every ``interval`` seconds.
+
+    The next record let through from a call site reports how many were dropped since the previous one, so a burst of
+    identical errors from a streaming loop costs one line instead of thousands.
+    """
+
+    def __init__(self, interval: float = LOG_SAMPLE_INTERVAL) -> None:
+        super().__init__()
+        self.interval = interval
+        self._last_emitted: dict[tuple[str, int], float] = {}
+        self._suppressed: dict[tuple[str, int], int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        call_site = (record.pathname, record.lineno)
+        now = time.monotonic()
+        last_emitted = self._last_emitted.get(call_site)
+        if last_emitted is not None and now - last_emitted < self.interval:
+            self._suppressed[call_site] = self._suppressed.get(call_site, 0) + 1
+            return False
+        self._last_emitted[call_site] = now
+        suppressed = self._suppressed.pop(call_site, 0)
+        if suppressed:
+            record.msg = f"{record.msg} ({suppressed} similar messages suppressed)"
+        return True
+
+
+class _OffloadingQueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only merge the message and render the traceback here, since neither can cross threads unrendered; the
+        # listener thread does the full formatting and I/O
+        exc_text = logging.Formatter().formatException(record.exc_info) if record.exc_info else None
+        record = super().prepare(record)
+        record.exc_text = exc_text
+        return record
+
+    def format(self, record: logging.LogRecord) -> str:
+        return record.getMessage()
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        with contextlib.suppress(queue.Full):
+            self.queue.put_nowait(record)
+
+
+_listener: QueueListener | None = None
+_lock = threading.Lock()
+
+
+def configure_logging() -> None:
+    """Route all logging through a queue to a listener thread that formats and writes to stderr.
+
+    Calls on the event loop only enqueue the record, so slow formatting or a blocked stderr never stalls streaming.
+    When the queue is full, new records are dropped rather than blocking the caller.
+    """
+    global _listener  # noqa: PLW0603
+    with _lock:
+        if _listener is not None:
+            return
+        stream_handler = logging.StreamHandler(sys.stderr)
+        if LOG_FORMAT == "json":
+            stream_handler.setFormatter(JsonFormatter())
+        else:
+            stream_handler.setFormatter(logging.Formatter(TEXT_FORMAT, datefmt=TEXT_DATE_FORMAT))
+
+        log_queue: queue.Queue[logging.LogRecord] = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        queue_handler = _OffloadingQueueHandler(log_queue)
+        root = logging.getLogger()
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+        root.addHandler(queue_handler)
+        root.setLevel(LOG_LIBRARY_LEVEL)
+        logging.getLogger("chat_server").setLevel(LOG_LEVEL)
+        # The server's startup and access logs, which uvicorn leaves to propagate here when run with log_config=None
+        logging.getLogger("uvicorn").setLevel(LOG_LEVEL)
+
+        _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(stop_logging)
+
+
+def stop_logging() -> None:
+    """Flush queued records and stop the listener thread."""
+    global _listener  # noqa: PLW0603
+    with _lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        _listener = None
+
+
+configure_logging()
 
-# Create a logger for your application
 logger = logging.getLogger("chat_server")
+# For errors raised per chunk or per attempt in streaming loops, which repeat at request rate during an outage
+sampled_logger = logger.getChild("sampled")
+sampled_logger.addFilter(SamplingFilter())
@@ -0,0 +1,45 @@
+import base64
+import json
+from datetime import datetime
+
+
+class InvalidCursorError(Exception):
+    pass
+
+
+def encode_cursor(created_at: datetime, row_id: str) -> str:
+    return _encode([created_at.isoformat(), row_id])
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, str]:
+    try:
+        created_at, row_id = _decode(cursor)
+        return datetime.fromisoformat(created_at), row_id
+    except (ValueError, TypeError) as e:
+        invalid_cursor_error = f"Invalid cursor: {cursor}"
+        raise InvalidCursorError(invalid_cursor_error) from e
+
+
+def encode_offset_cursor(offset: int) -> str:
+    """Cursor for a ranked list, which has no stable key to resume after."""
+    return _encode({"offset": offset})
+
+
+def decode_offset_cursor(cursor: str) -> int:
+    try:
+        offset = _decode(cursor)["offset"]
+    except (ValueError, TypeError, KeyError) as e:
+        invalid_cursor_error = f"Invalid cursor: {cursor}"
+        raise InvalidCursorError(invalid_cursor_error) from e
+    if not isinstance(offset, int) or offset < 0:
+        invalid_cursor_error = f"Invalid cursor: {cursor}"
+        raise InvalidCursorError(invalid_cursor_error)
+    return offset
+
+
+def _encode(payload: object) -> str:
+    return base64.urlsafe_b64encode(json.dumps(payload).encode("utf-8")).decode("ascii")
+
+
+def _decode(cursor: str) -> object:
+    return json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
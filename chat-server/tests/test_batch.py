@@ -0,0 +1,97 @@
+import asyncio
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+from sqlalchemy import event, update
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlmodel import SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from chat_server import batch
+from chat_server.batch import follow_results
+from chat_server.models.batch import BatchItem, BatchItemStatus, BatchJob
+
+# Naive UTC, as the runner stores finished_at
+STARTED = datetime(2026, 1, 1, 12)  # noqa: DTZ001
+POLL_INTERVAL = 0.01
+
+
+async def _create_job(session: AsyncSession, item_count: int) -> str:
+    job = BatchJob(models=["gpt-4o"], prompt_count=item_count)
+    session.add(job)
+    session.add_all(
+        BatchItem(job_id=job.id, position=i, prompt_index=i, model="gpt-4o", prompt=f"prompt {i}", queued_at=STARTED)
+        for i in range(item_count)
+    )
+    await session.commit()
+    return job.id
+
+
+async def _finish(session: AsyncSession, job_id: str, position: int, finished_at: datetime) -> None:
+    await session.exec(
+        update(BatchItem)
+        .where(BatchItem.job_id == job_id, BatchItem.position == position)
+        .values(status=BatchItemStatus.done.value, response=f"response {position}", finished_at=finished_at),
+    )
+    await session.commit()
+
+
+async def _follow(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    finishes: list[tuple[int, float]],
+) -> tuple[list[int], int]:
+    """Finish items one at a time as (position, seconds after STARTED), each once the previous one was yielded.
+
+    Return the positions in the order they were yielded, and how many item rows the polls fetched in all.
+    """
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/batch.db")
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all, tables=[BatchJob.__table__, BatchItem.__table__])
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    monkeypatch.setattr(batch, "async_session", session_factory)
+
+    async with session_factory() as session:
+        job_id = await _create_job(session, len(finishes))
+        yielded: asyncio.Queue[int] = asyncio.Queue()
+        fetched = []
+
+        async def follow() -> None:
+            async for item in follow_results(job_id, len(finishes), poll_interval=POLL_INTERVAL):
+                await yielded.put(item.position)
+
+        def on_load(item: BatchItem, _: object) -> None:
+            fetched.append(item.position)
+
+        event.listen(BatchItem, "load", on_load)
+        try:
+            following = asyncio.create_task(follow())
+            received = []
+            for position, seconds in finishes:
+                await _finish(session, job_id, position, STARTED + timedelta(seconds=seconds))
+                received.append(await asyncio.wait_for(yielded.get(), timeout=5))
+            await asyncio.wait_for(following, timeout=5)
+        finally:
+            event.remove(BatchItem, "load", on_load)
+    await engine.dispose()
+    return received, len(fetched)
+
+
+def test_follow_results_yields_each_item_once_as_it_finishes(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    received, fetched = asyncio.run(_follow(tmp_path, monkeypatch, [(2, 0), (0, 1), (3, 2), (1, 3)]))
+
+    assert received == [2, 0, 3, 1]
+    # No poll fetches an item that was already yielded, whichever items before it are still running
+    assert fetched == len(received)
+
+
+def test_follow_results_yields_items_that_commit_after_newer_ones(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    # Item 1 finished before item 2 but committed after it, as under a slow commit or clock skew between workers
+    received, fetched = asyncio.run(_follow(tmp_path, monkeypatch, [(0, 0), (2, 10), (1, 5), (3, 11)]))
+
+    assert received == [0, 2, 1, 3]
+    assert fetched == len(received)
@@ -0,0 +1,115 @@
+import asyncio
+import socket
+import uuid
+from collections.abc import AsyncGenerator, Coroutine
+from contextlib import asynccontextmanager
+
+import httpx
+import uvicorn
+from fakeredis.aioredis import FakeRedis
+from openai import AsyncOpenAI
+
+from benchmarks.fake_provider import FakeProviderConfig, create_fake_provider
+from chat_server.generation import GenerationLog
+
+HOST = "127.0.0.1"
+ORPHAN_TIMEOUT = 0.2
+HEARTBEAT_INTERVAL = 0.05
+# Slow enough that a generation is still streaming long after its client has gone
+SLOW_PROVIDER = FakeProviderConfig(ttft=0, tokens_per_second=20, response_tokens=1000)
+
+
+@asynccontextmanager
+async def _fake_provider(config: FakeProviderConfig) -> AsyncGenerator[str, None]:
+    with socket.socket() as s:
+        s.bind((HOST, 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(
+        uvicorn.Config(create_fake_provider(config), host=HOST, port=port, log_level="warning", ws="none")
+    )
+    serving = asyncio.create_task(server.serve())
+    # uvicorn signals readiness only through this flag
+    while not server.started:  # noqa: ASYNC110
+        await asyncio.sleep(0.01)
+    try:
+        yield f"http://{HOST}:{port}"
+    finally:
+        server.should_exit = True
+        await serving
+
+
+async def _settled_stats(provider_url: str) -> dict:
+    """Return the provider's stats once every stream has closed, which it sees a moment after the client does."""
+    async with httpx.AsyncClient(base_url=provider_url) as client:
+        for _ in range(100):
+            stats = (await client.get("/stats")).json()
+            if stats["open_streams"] == 0:
+                return stats
+            await asyncio.sleep(0.02)
+    return stats
+
+
+def _generate(log: GenerationLog, generation_id: str, provider_url: str) -> Coroutine[None, None, None]:
+    async def generate() -> None:
+        async with AsyncOpenAI(base_url=f"{provider_url}/v1", api_key="test", max_retries=0) as client:
+            stream = await client.chat.completions.create(
+                model="gpt-4o",
+                messages=[{"role": "user", "content": "hello"}],
+                stream=True,
+            )
+            async with stream:
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        await log.append(generation_id, chunk.choices[0].delta.content)
+        await log.finish(generation_id)
+
+    return generate()
+
+
+async def _read(log: GenerationLog, generation_id: str, chunks: int | None = None) -> list[str]:
+    """Tail the generation like a client would, disconnecting after ``chunks`` chunks if given."""
+    received = []
+    async for chunk in log.tail(generation_id):
+        received.append(chunk.content)
+        if len(received) == chunks:
+            break
+    return received
+
+
+async def _run(*, pinned: bool = False, read_chunks: int | None = None) -> tuple[bool, list[str], dict]:
+    log = GenerationLog(FakeRedis(), orphan_timeout=ORPHAN_TIMEOUT, heartbeat_interval=HEARTBEAT_INTERVAL)
+    generation_id = str(uuid.uuid4())
+    config = SLOW_PROVIDER if read_chunks is not None else FakeProviderConfig(ttft=0, response_tokens=10)
+    async with _fake_provider(config) as provider_url:
+        await log.start(generation_id)
+        if pinned:
+            await log.pin(generation_id)
+        reading = asyncio.create_task(_read(log, generation_id, read_chunks)) if not pinned else None
+        completed = await log.run_attached(generation_id, _generate(log, generation_id, provider_url))
+        received = await reading if reading is not None else []
+        return completed, received, await _settled_stats(provider_url)
+
+
+def test_generation_without_a_client_is_cancelled_and_closes_its_provider_stream() -> None:
+    completed, received, stats = asyncio.run(_run(read_chunks=3))
+
+    assert not completed
+    assert len(received) == 3
+    assert stats["total_streams"] == 1
+    assert stats["abandoned_streams"] == 1
+
+
+def test_generation_with_a_client_attached_runs_to_the_end() -> None:
+    completed, received, stats = asyncio.run(_run())
+
+    assert completed
+    assert "".join(received) == "".join(f"token{i} " for i in range(10))
+    assert stats["abandoned_streams"] == 0
+
+
+def test_pinned_generation_runs_to_the_end_without_a_client() -> None:
+    completed, _, stats = asyncio.run(_run(pinned=True))
+
+    assert completed
+    assert stats["total_streams"] == 1
+    assert stats["abandoned_streams"] == 0
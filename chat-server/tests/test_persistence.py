@@ -0,0 +1,69 @@
+import asyncio
+import uuid
+from collections.abc import AsyncGenerator
+from contextlib import asynccontextmanager
+
+import pytest
+from prometheus_client import REGISTRY
+
+from chat_server import persistence
+from chat_server.models.chat import ChatMessage as ChatMessageModel
+from chat_server.persistence import TurnPersister, TurnPersistError
+
+DROPPED_METRIC = "write_behind_dropped_messages_total"
+
+
+def _dropped() -> float:
+    return REGISTRY.get_sample_value(DROPPED_METRIC) or 0
+
+
+class FailingSession:
+    def __init__(self, commits: list[int]) -> None:
+        self.commits = commits
+
+    def add_all(self, rows: list[ChatMessageModel]) -> None:
+        pass
+
+    async def commit(self) -> None:
+        self.commits.append(1)
+        database_error = "database is unavailable"
+        raise ConnectionError(database_error)
+
+
+def _turn(thread_id: str) -> list[ChatMessageModel]:
+    return [
+        ChatMessageModel(content="question", thread_id=thread_id, role="user"),
+        ChatMessageModel(content="answer", thread_id=thread_id, role="ai", model="gpt-4o"),
+    ]
+
+
+async def _persist_and_wait(persister: TurnPersister, thread_ids: list[str]) -> list[BaseException | None]:
+    persister.start()
+    try:
+        for thread_id in thread_ids:
+            await persister.persist(thread_id, _turn(thread_id))
+        return await asyncio.gather(
+            *(persister.wait_for_thread(thread_id) for thread_id in thread_ids),
+            return_exceptions=True,
+        )
+    finally:
+        await persister.stop()
+
+
+def test_waiters_are_told_when_every_flush_fails(monkeypatch: pytest.MonkeyPatch) -> None:
+    commits: list[int] = []
+
+    @asynccontextmanager
+    async def failing_session() -> AsyncGenerator[FailingSession, None]:
+        yield FailingSession(commits)
+
+    monkeypatch.setattr(persistence, "async_session", failing_session)
+    dropped_before = _dropped()
+    persister = TurnPersister(write_behind=True, flush_interval=0.01, max_attempts=3)
+    thread_ids = [str(uuid.uuid4()), str(uuid.uuid4())]
+
+    results = asyncio.run(_persist_and_wait(persister, thread_ids))
+
+    assert [type(result) for result in results] == [TurnPersistError, TurnPersistError]
+    assert len(commits) == 3
+    assert _dropped() - dropped_before == 4
@@ -0,0 +1,97 @@
+from chat_server.context.window import window_start
+from chat_server.generated.models import ChatMessage, Model, Role
+from chat_server.llm.anthropic_models import AnthropicModels
+
+MODEL = Model.claude_3_5_sonnet_20241022
+
+
+def _turns(count: int) -> list[ChatMessage]:
+    messages = []
+    for turn in range(count):
+        messages.append(ChatMessage(content=f"question {turn}", role=Role.user))
+        messages.append(ChatMessage(content=f"answer {turn}", role=Role.ai, model=MODEL))
+    return messages
+
+
+def _breakpoints(formatted: list[dict]) -> list[int]:
+    return [i for i, message in enumerate(formatted) if not isinstance(message["content"], str)]
+
+
+def _texts(formatted: list[dict]) -> list[tuple[str, str]]:
+    # What the provider's cache is keyed on, whichever messages carry a breakpoint
+    return [
+        (message["role"], message["content"] if isinstance(message["content"], str) else message["content"][0]["text"])
+        for message in formatted
+    ]
+
+
+def test_no_breakpoints_without_prompt_caching() -> None:
+    llm = AnthropicModels(MODEL, max_tokens=1024)
+    history = llm.convert_messages(_turns(2))
+
+    formatted = llm.format_messages([ChatMessage(content="question 2", role=Role.user)], history)
+
+    assert _breakpoints(formatted) == []
+
+
+def test_breakpoints_on_the_new_prompt_and_where_the_previous_prompt_ended() -> None:
+    llm = AnthropicModels(MODEL, max_tokens=1024, prompt_caching=True)
+    history = llm.convert_messages(_turns(2))
+
+    formatted = llm.format_messages([ChatMessage(content="question 2", role=Role.user)], history)
+
+    # question 1 ended the previous turn's prompt, and question 2 ends this one
+    assert _breakpoints(formatted) == [2, 4]
+    assert formatted[4]["content"] == [
+        {"type": "text", "text": "question 2", "cache_control": {"type": "ephemeral"}},
+    ]
+
+
+def test_each_turn_reads_the_prefix_the_previous_turn_wrote() -> None:
+    llm = AnthropicModels(MODEL, max_tokens=1024, prompt_caching=True)
+    thread = _turns(3)
+
+    previous = llm.format_messages(thread[4:5], llm.convert_messages(thread[:4]))
+    current = llm.format_messages([ChatMessage(content="question 3", role=Role.user)], llm.convert_messages(thread))
+
+    written = len(previous) - 1
+    assert written in _breakpoints(current)
+    assert _texts(current[: written + 1]) == _texts(previous)
+
+
+def test_breakpoints_leave_the_shared_history_unchanged() -> None:
+    llm = AnthropicModels(MODEL, max_tokens=1024, prompt_caching=True)
+    history = llm.convert_messages(_turns(2))
+    before = [dict(message) for message in history]
+
+    llm.format_messages([ChatMessage(content="question 2", role=Role.user)], history)
+
+    assert history == before
+
+
+def test_window_keeps_the_whole_thread_within_budget() -> None:
+    messages = _turns(5)
+
+    assert window_start(messages, [10] * len(messages), token_budget=100) == 0
+
+
+def test_window_start_stays_put_while_the_thread_grows_by_less_than_a_step() -> None:
+    # A budget of 128 tokens and a step of a quarter of it: the start moves by 32 tokens at a time
+    starts = [window_start(_turns(count), [8] * count * 2, token_budget=128, trim_step=0.25) for count in range(9, 15)]
+
+    assert starts == [4, 4, 8, 8, 12, 12]
+
+
+def test_window_without_a_step_keeps_as_much_history_as_fits() -> None:
+    messages = _turns(10)
+
+    assert window_start(messages, [8] * len(messages), token_budget=128, trim_step=0) == 4
+
+
+def test_window_never_starts_on_an_ai_message() -> None:
+    messages = _turns(10)
+
+    start = window_start(messages, [8] * len(messages), token_budget=120, trim_step=0)
+
+    assert start == 6
+    assert messages[start].role == Role.user
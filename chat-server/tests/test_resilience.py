@@ -0,0 +1,153 @@
+import asyncio
+from collections.abc import AsyncGenerator, Callable
+
+import pytest
+
+from chat_server.generated.models import ChatMessage, Model
+from chat_server.llm import resilience
+from chat_server.llm.llm import LLM, Usage
+from chat_server.llm.resilience import FirstTokenLatencies, FirstTokenTimeoutError, ResilientStream, StreamPolicy
+from chat_server.llm.scheduler import LLMScheduler, Priority
+
+REQUESTED = Model.gpt_4o
+FALLBACK = Model.claude_3_5_sonnet_20241022
+POLICY = StreamPolicy(first_token_timeout=0.5, max_retries=2, retry_base_delay=0, retry_max_delay=0)
+
+
+class RetryableError(Exception):
+    pass
+
+
+class FatalError(Exception):
+    pass
+
+
+class ScriptedLLM(LLM[str]):
+    def convert_message(self, message: ChatMessage) -> str:
+        return message.content
+
+    async def response_generator(
+        self,
+        messages: list[str],  # noqa: ARG002
+        usage: Usage | None = None,  # noqa: ARG002
+    ) -> AsyncGenerator[str, None]:
+        # Streams are opened through ScriptedProvider.open_stream instead
+        raise NotImplementedError
+        yield
+
+    def is_retryable(self, error: Exception) -> bool:
+        return isinstance(error, RetryableError)
+
+
+class ScriptedProvider:
+    """Opens streams that each follow the next step scripted for their model.
+
+    A step is an exception to raise before the first chunk, a number of seconds to wait before answering, or None to
+    answer straight away.
+    """
+
+    def __init__(self, steps: dict[Model, list[Exception | float | None]]) -> None:
+        self.steps = steps
+        self.opened: list[Model] = []
+        self.closed = 0
+
+    def open_stream(self, _: LLM, model: Model) -> AsyncGenerator[str, None]:
+        self.opened.append(model)
+        return self._stream(model, self.steps[model].pop(0))
+
+    async def _stream(self, model: Model, step: Exception | float | None) -> AsyncGenerator[str, None]:
+        try:
+            if isinstance(step, Exception):
+                raise step
+            if step is not None:
+                await asyncio.sleep(step)
+            yield f"{model.value} "
+            yield "answered"
+        finally:
+            self.closed += 1
+
+
+def _stream(provider: ScriptedProvider, policy: StreamPolicy = POLICY, **kwargs: object) -> ResilientStream:
+    stream = ResilientStream(REQUESTED, lambda _: ScriptedLLM(), provider.open_stream, policy=policy, **kwargs)
+    stream.latencies = FirstTokenLatencies()
+    # One slot per model and provider, so tests can tell when a slot is held
+    stream.scheduler = LLMScheduler(workers=1000)
+    return stream
+
+
+async def _collect(stream: ResilientStream, during: Callable[[], None] | None = None) -> str:
+    chunks = []
+    async for chunk in stream:
+        chunks.append(chunk)
+        if during is not None:
+            during()
+    return "".join(chunks)
+
+
+def test_retries_retryable_errors_before_the_first_token() -> None:
+    provider = ScriptedProvider({REQUESTED: [RetryableError("503"), RetryableError("429"), None]})
+    stream = _stream(provider)
+
+    assert asyncio.run(_collect(stream)) == "gpt-4o answered"
+    assert provider.opened == [REQUESTED] * 3
+    assert stream.model is REQUESTED
+
+
+def test_does_not_retry_other_errors() -> None:
+    provider = ScriptedProvider({REQUESTED: [FatalError("400"), None]})
+
+    with pytest.raises(FatalError):
+        asyncio.run(_collect(_stream(provider)))
+    assert provider.opened == [REQUESTED]
+
+
+def test_retries_attempts_without_a_first_token_before_the_deadline() -> None:
+    provider = ScriptedProvider({REQUESTED: [1.0, 1.0, 1.0]})
+    policy = StreamPolicy(first_token_timeout=0.05, max_retries=2, retry_base_delay=0, retry_max_delay=0)
+
+    with pytest.raises(FirstTokenTimeoutError):
+        asyncio.run(_collect(_stream(provider, policy)))
+    assert provider.opened == [REQUESTED] * 3
+    assert provider.closed == 3
+
+
+def test_hedges_a_slow_attempt_and_closes_the_slower_one() -> None:
+    provider = ScriptedProvider({REQUESTED: [1.0, None]})
+    policy = StreamPolicy(first_token_timeout=0.5, hedge_percentile=0.5, hedge_min_samples=1)
+    stream = _stream(provider, policy)
+    stream.latencies.record(REQUESTED, 0.05)
+
+    assert asyncio.run(_collect(stream)) == "gpt-4o answered"
+    assert provider.opened == [REQUESTED, REQUESTED]
+    assert provider.closed == 2
+
+
+def test_falls_back_under_a_slot_held_until_the_stream_ends() -> None:
+    provider = ScriptedProvider({REQUESTED: [RetryableError("503")] * 3, FALLBACK: [None]})
+    stream = _stream(provider, fallback=FALLBACK)
+    fallback_pool = stream.scheduler.model_pools[FALLBACK]
+    slots_in_use = []
+
+    assert asyncio.run(_collect(stream, lambda: slots_in_use.append(fallback_pool.in_use))) == (
+        "claude-3-5-sonnet-20241022 answered"
+    )
+    assert stream.model is FALLBACK
+    assert slots_in_use == [1, 1]
+    assert fallback_pool.in_use == 0
+
+
+def test_fails_as_the_requested_model_when_the_fallback_has_no_free_slot(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(resilience, "LLM_FALLBACK_QUEUE_TIMEOUT", 0.05)
+    provider = ScriptedProvider({REQUESTED: [RetryableError("503")] * 3, FALLBACK: [None]})
+    stream = _stream(provider, fallback=FALLBACK)
+
+    async def run_with_fallback_busy() -> str:
+        lease = await stream.scheduler.acquire(FALLBACK, Priority.interactive)
+        try:
+            return await _collect(stream)
+        finally:
+            lease.release()
+
+    with pytest.raises(RetryableError):
+        asyncio.run(run_with_fallback_busy())
+    assert FALLBACK not in provider.opened
@@ -0,0 +1,85 @@
+import asyncio
+import json
+import time
+from collections.abc import AsyncGenerator
+
+from fakeredis.aioredis import FakeRedis
+
+from chat_server.generated.models import ChatMessage, Model, Role
+from chat_server.llm.llm import LLM, Usage
+from chat_server.llm.response_cache import ResponseCache
+
+MODEL = Model.gpt_4o
+MESSAGES = [ChatMessage(content="hello", role=Role.user)]
+CHUNKS = ["one ", "two ", "three"]
+PROVIDER_GAP = 0.2
+MAX_GAP = 0.05
+
+
+class PausingLLM(LLM[str]):
+    """Streams CHUNKS with PROVIDER_GAP seconds before each one after the first."""
+
+    def __init__(self) -> None:
+        self.calls = 0
+
+    def convert_message(self, message: ChatMessage) -> str:
+        return message.content
+
+    async def response_generator(
+        self,
+        messages: list[str],  # noqa: ARG002
+        usage: Usage | None = None,  # noqa: ARG002
+    ) -> AsyncGenerator[str, None]:
+        self.calls += 1
+        for i, chunk in enumerate(CHUNKS):
+            if i:
+                await asyncio.sleep(PROVIDER_GAP)
+            yield chunk
+
+
+async def _timed(stream: AsyncGenerator[str, None]) -> tuple[list[str], float]:
+    started = time.perf_counter()
+    chunks = [chunk async for chunk in stream]
+    return chunks, time.perf_counter() - started
+
+
+async def _miss_then_hit(cache: ResponseCache, llm: PausingLLM) -> tuple[list[str], float]:
+    await _timed(cache.get_stream_generator(MODEL, llm, MESSAGES))
+    return await _timed(cache.get_stream_generator(MODEL, llm, MESSAGES))
+
+
+def test_hit_replays_the_provider_pauses_up_to_the_cap() -> None:
+    llm = PausingLLM()
+    cache = ResponseCache(FakeRedis(), models=frozenset({MODEL}), replay_max_gap=MAX_GAP)
+
+    chunks, seconds = asyncio.run(_miss_then_hit(cache, llm))
+
+    assert chunks == CHUNKS
+    assert llm.calls == 1
+    # Two capped pauses, well short of the provider's own
+    assert MAX_GAP * 2 <= seconds < PROVIDER_GAP
+
+
+def test_hit_replays_at_once_without_a_cap() -> None:
+    llm = PausingLLM()
+    cache = ResponseCache(FakeRedis(), models=frozenset({MODEL}), replay_max_gap=0)
+
+    chunks, seconds = asyncio.run(_miss_then_hit(cache, llm))
+
+    assert chunks == CHUNKS
+    assert seconds < MAX_GAP
+
+
+def test_hit_replays_entries_stored_without_pauses() -> None:
+    llm = PausingLLM()
+    redis = FakeRedis()
+    cache = ResponseCache(redis, models=frozenset({MODEL}), replay_max_gap=MAX_GAP)
+
+    async def replay_bare_chunks() -> tuple[list[str], float]:
+        await redis.set(ResponseCache.key(MODEL, llm.format_messages(MESSAGES)), json.dumps(CHUNKS))
+        return await _timed(cache.get_stream_generator(MODEL, llm, MESSAGES))
+
+    chunks, _ = asyncio.run(replay_bare_chunks())
+
+    assert chunks == CHUNKS
+    assert llm.calls == 0
@@ -0,0 +1,102 @@
+import asyncio
+from collections.abc import AsyncGenerator, AsyncIterator
+
+import pytest
+
+from chat_server.generated.models import Model
+from chat_server.llm.llm import Usage
+from chat_server.llm.scheduler import SchedulerRejectedError
+from chat_server.usage import UsageRecorder
+
+MODEL = Model.gpt_4o
+THREAD_ID = "thread"
+
+
+class RecordingUsageRecorder(UsageRecorder):
+    def __init__(self) -> None:
+        super().__init__()
+        self.recorded: list[Usage] = []
+
+    def record(self, thread_id: str | None, model: Model, usage: Usage, latency_seconds: float) -> None:  # noqa: ARG002
+        self.recorded.append(usage)
+
+
+class ScriptedStream:
+    """Stands in for a ResilientStream: yields ``chunks``, then raises ``error`` or waits forever if given."""
+
+    def __init__(self, chunks: list[str], error: Exception | None = None, *, hang: bool = False) -> None:
+        self.model = MODEL
+        self.chunks = chunks
+        self.error = error
+        self.hang = hang
+
+    def __aiter__(self) -> AsyncIterator[str]:
+        """Each iteration replays the script from the start."""
+        return self._stream()
+
+    async def _stream(self) -> AsyncGenerator[str, None]:
+        for chunk in self.chunks:
+            yield chunk
+        if self.error is not None:
+            raise self.error
+        if self.hang:
+            await asyncio.Event().wait()
+
+
+async def _consume(recorder: UsageRecorder, stream: ScriptedStream, usage: Usage) -> None:
+    async for _ in recorder.track(stream, THREAD_ID, usage):
+        pass
+
+
+async def _cancel_after(recorder: UsageRecorder, stream: ScriptedStream, usage: Usage, chunks: int) -> None:
+    """Consume ``chunks`` chunks, then cancel the consumer while it waits for the next one."""
+    received = asyncio.Queue()
+
+    async def consume() -> None:
+        async for chunk in recorder.track(stream, THREAD_ID, usage):
+            await received.put(chunk)
+
+    consuming = asyncio.create_task(consume())
+    for _ in range(chunks):
+        await received.get()
+    # Let the consumer reach its wait for a chunk that never comes
+    await asyncio.sleep(0.01)
+    consuming.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await consuming
+
+
+def test_stream_cancelled_before_the_provider_started_is_not_recorded() -> None:
+    recorder = RecordingUsageRecorder()
+
+    asyncio.run(_cancel_after(recorder, ScriptedStream([], hang=True), Usage(estimated_input_tokens=100), 0))
+
+    assert recorder.recorded == []
+
+
+def test_stream_rejected_by_the_scheduler_is_not_recorded() -> None:
+    recorder = RecordingUsageRecorder()
+    stream = ScriptedStream([], SchedulerRejectedError("No free slot for gpt-4o"))
+
+    with pytest.raises(SchedulerRejectedError):
+        asyncio.run(_consume(recorder, stream, Usage(estimated_input_tokens=100)))
+    assert recorder.recorded == []
+
+
+def test_stream_cancelled_part_way_is_recorded_with_estimates() -> None:
+    recorder = RecordingUsageRecorder()
+
+    asyncio.run(_cancel_after(recorder, ScriptedStream(["abcd" * 10], hang=True), Usage(estimated_input_tokens=100), 1))
+
+    assert len(recorder.recorded) == 1
+    assert recorder.recorded[0].input_tokens == 100
+    assert recorder.recorded[0].output_tokens > 0
+
+
+def test_stream_failing_after_the_provider_reported_usage_is_recorded() -> None:
+    recorder = RecordingUsageRecorder()
+    usage = Usage(input_tokens=100)
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(_consume(recorder, ScriptedStream([], ConnectionError("reset")), usage))
+    assert recorder.recorded == [usage]
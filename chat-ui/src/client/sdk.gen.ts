@@ -1,7 +1,7 @@
 // This file is auto-generated by @hey-api/openapi-ts
 
 import type { Options as ClientOptions, TDataShape, Client } from '@hey-api/client-fetch';
-import type { GetChatMessagesData, GetChatMessagesResponse, SubmitChatMessageData, SubmitChatMessageResponse, SubmitChatMessageError, SubmitChatMessageCompareData, SubmitChatMessageCompareResponse, SubmitChatMessageCompareError, SubmitChatMessageSelectData, SubmitChatMessageSelectError, GetThreadsData, GetThreadsResponse, CreateThreadData, CreateThreadResponse } from './types.gen';
+import type { GetChatMessagesData, GetChatMessagesResponse, GetChatMessagesError, SubmitChatMessageData, SubmitChatMessageResponse, SubmitChatMessageError, SubmitChatMessageCompareData, SubmitChatMessageCompareResponse, SubmitChatMessageCompareError, SubmitChatMessageSelectData, SubmitChatMessageSelectError, GetGenerationData, GetGenerationResponse, GetGenerationError, GetThreadsData, GetThreadsResponse, GetThreadsError, CreateThreadData, CreateThreadResponse, SearchMessagesData, SearchMessagesResponse, SearchMessagesError, GetThreadUsageData, GetThreadUsageResponse, GetThreadUsageError, GetUsageData, GetUsageResponse, CreateBatchJobData, CreateBatchJobResponse, CreateBatchJobError, GetBatchJobData, GetBatchJobResponse, GetBatchJobError, GetBatchResultsData, GetBatchResultsResponse, GetBatchResultsError } from './types.gen';
 import { client as _heyApiClient } from './client.gen';
 
 export type Options<TData extends TDataShape = TDataShape, ThrowOnError extends boolean = boolean> = ClientOptions<TData, ThrowOnError> & {
@@ -19,10 +19,11 @@ export type Options<TData extends TDataShape = TDataShape, ThrowOnError extends
 };
 
 /**
- * Get all chat messages
+ * Get a page of chat messages, oldest first
+ * Messages are paginated with an opaque keyset cursor. Clients that send `Accept: application/x-ndjson` instead receive every message from the cursor onward as newline-delimited JSON, streamed from the database.
  */
 export const getChatMessages = <ThrowOnError extends boolean = false>(options: Options<GetChatMessagesData, ThrowOnError>) => {
-    return (options.client ?? _heyApiClient).get<GetChatMessagesResponse, unknown, ThrowOnError>({
+    return (options.client ?? _heyApiClient).get<GetChatMessagesResponse, GetChatMessagesError, ThrowOnError>({
         url: '/thread/{thread_id}/chat',
         ...options
     });
@@ -58,6 +59,7 @@ export const submitChatMessageCompare = <ThrowOnError extends boolean = false>(o
 
 /**
  * Submit a chat message selection
+ * Selects one model's answer to a comparison, which is added to the thread with its prompt. A model can be selected while the comparison is still streaming: the other models are cancelled, and the selected one runs to the end and is added to the thread when it finishes, whether or not a client is still attached. Selecting the same model again succeeds without adding the answer twice.
  */
 export const submitChatMessageSelect = <ThrowOnError extends boolean = false>(options: Options<SubmitChatMessageSelectData, ThrowOnError>) => {
     return (options.client ?? _heyApiClient).post<unknown, SubmitChatMessageSelectError, ThrowOnError>({
@@ -71,10 +73,21 @@ export const submitChatMessageSelect = <ThrowOnError extends boolean = false>(op
 };
 
 /**
- * Get all threads
+ * Reattach to an in-flight or recently finished generation
+ * Replays the generation's chunks after the given entry id and keeps tailing live output until it finishes. Every event carries an SSE id that can be passed back as `after` or `Last-Event-ID` to resume.
+ */
+export const getGeneration = <ThrowOnError extends boolean = false>(options: Options<GetGenerationData, ThrowOnError>) => {
+    return (options.client ?? _heyApiClient).get<GetGenerationResponse, GetGenerationError, ThrowOnError>({
+        url: '/generation/{generation_id}',
+        ...options
+    });
+};
+
+/**
+ * Get a page of threads, newest first
  */
 export const getThreads = <ThrowOnError extends boolean = false>(options?: Options<GetThreadsData, ThrowOnError>) => {
-    return (options?.client ?? _heyApiClient).get<GetThreadsResponse, unknown, ThrowOnError>({
+    return (options?.client ?? _heyApiClient).get<GetThreadsResponse, GetThreadsError, ThrowOnError>({
         url: '/thread',
         ...options
     });
@@ -88,4 +101,72 @@ export const createThread = <ThrowOnError extends boolean = false>(options?: Opt
         url: '/thread',
         ...options
     });
+};
+
+/**
+ * Search the messages of all threads
+ * In `text` mode (the default) messages containing the query's words are returned newest first; the query supports quoted phrases, `or` and `-word`. In `semantic` mode, available when the server has semantic search enabled, messages are ranked by embedding similarity to the query and each result carries its score.
+ */
+export const searchMessages = <ThrowOnError extends boolean = false>(options: Options<SearchMessagesData, ThrowOnError>) => {
+    return (options.client ?? _heyApiClient).get<SearchMessagesResponse, SearchMessagesError, ThrowOnError>({
+        url: '/search',
+        ...options
+    });
+};
+
+/**
+ * Get the token usage and cost of a thread
+ * Totals per model over every generation in the thread, including retries, fallbacks and every branch of a comparison. Generations still streaming are not included.
+ */
+export const getThreadUsage = <ThrowOnError extends boolean = false>(options: Options<GetThreadUsageData, ThrowOnError>) => {
+    return (options.client ?? _heyApiClient).get<GetThreadUsageResponse, GetThreadUsageError, ThrowOnError>({
+        url: '/thread/{thread_id}/usage',
+        ...options
+    });
+};
+
+/**
+ * Get the token usage and cost of each model
+ */
+export const getUsage = <ThrowOnError extends boolean = false>(options?: Options<GetUsageData, ThrowOnError>) => {
+    return (options?.client ?? _heyApiClient).get<GetUsageResponse, unknown, ThrowOnError>({
+        url: '/usage',
+        ...options
+    });
+};
+
+/**
+ * Queue a batch job running every prompt on every model
+ * The job runs in the background on a bounded pool of workers, behind interactive chat for provider capacity, and each result is stored as soon as it is ready. Poll the job for progress and page through its results.
+ */
+export const createBatchJob = <ThrowOnError extends boolean = false>(options: Options<CreateBatchJobData, ThrowOnError>) => {
+    return (options.client ?? _heyApiClient).post<CreateBatchJobResponse, CreateBatchJobError, ThrowOnError>({
+        url: '/batch',
+        ...options,
+        headers: {
+            'Content-Type': 'application/json',
+            ...options?.headers
+        }
+    });
+};
+
+/**
+ * Get the progress of a batch job
+ */
+export const getBatchJob = <ThrowOnError extends boolean = false>(options: Options<GetBatchJobData, ThrowOnError>) => {
+    return (options.client ?? _heyApiClient).get<GetBatchJobResponse, GetBatchJobError, ThrowOnError>({
+        url: '/batch/{job_id}',
+        ...options
+    });
+};
+
+/**
+ * Get a page of the finished results of a batch job, in prompt order
+ * Results still running are skipped, so a page may be followed by results that finish later. Clients that send `Accept: application/x-ndjson` instead receive every result as newline-delimited JSON as it finishes, until the job is completed.
+ */
+export const getBatchResults = <ThrowOnError extends boolean = false>(options: Options<GetBatchResultsData, ThrowOnError>) => {
+    return (options.client ?? _heyApiClient).get<GetBatchResultsResponse, GetBatchResultsError, ThrowOnError>({
+        url: '/batch/{job_id}/results',
+        ...options
+    });
 };
\ No newline at end of file
@@ -6,6 +6,14 @@ export type Thread = {
     created_at: string;
 };
 
+export type ThreadPage = {
+    items: Array<Thread>;
+    /**
+     * Cursor for the next page, absent on the last page
+     */
+    next_cursor?: string;
+};
+
 /**
  * Available AI models
  */
@@ -25,6 +33,114 @@ export type ChatMessage = {
     model?: Model;
 };
 
+export type ChatMessagePage = {
+    items: Array<ChatMessage>;
+    /**
+     * Cursor for the next page, absent on the last page
+     */
+    next_cursor?: string;
+};
+
+export type UsageRollup = {
+    /**
+     * The model, absent on the total
+     */
+    model?: string;
+    generations: number;
+    /**
+     * Prompt tokens, including cached ones
+     */
+    input_tokens: number;
+    /**
+     * Prompt tokens served from the provider's prompt cache
+     */
+    cached_input_tokens: number;
+    output_tokens: number;
+    /**
+     * Estimated cost in US dollars at list prices
+     */
+    cost_usd: number;
+    /**
+     * Average time to stream a whole response, absent when there are no generations
+     */
+    average_latency_seconds?: number;
+};
+
+export type UsageReport = {
+    items: Array<UsageRollup>;
+    total: UsageRollup;
+};
+
+export type CreateBatchJobRequest = {
+    /**
+     * The prompts to run, each as the only message of a new conversation
+     */
+    prompts: Array<string>;
+    /**
+     * The models to run every prompt on
+     */
+    models: Array<Model>;
+};
+
+export type BatchJobStatus = 'running' | 'completed';
+
+export type BatchJob = {
+    id: string;
+    created_at: string;
+    models: Array<Model>;
+    prompt_count: number;
+    status: BatchJobStatus;
+    /**
+     * Results waiting for a worker
+     */
+    pending: number;
+    /**
+     * Results being generated
+     */
+    running: number;
+    /**
+     * Results generated
+     */
+    done: number;
+    /**
+     * Results that failed after every retry and fallback
+     */
+    failed: number;
+};
+
+export type BatchResultStatus = 'done' | 'error';
+
+export type BatchResult = {
+    /**
+     * The position of the prompt in the job's prompts
+     */
+    prompt_index: number;
+    model: Model;
+    status: BatchResultStatus;
+    /**
+     * The generated response, when done
+     */
+    response?: string;
+    /**
+     * Why the result failed, on error
+     */
+    error?: string;
+    input_tokens?: number;
+    output_tokens?: number;
+    /**
+     * Time to stream the whole response
+     */
+    latency_seconds?: number;
+};
+
+export type BatchResultPage = {
+    items: Array<BatchResult>;
+    /**
+     * Cursor for the next page, absent on the last page
+     */
+    next_cursor?: string;
+};
+
 export type SubmitChatMessageRequest = {
     content: string;
     model: Model;
@@ -51,6 +167,32 @@ export type SubmitChatMessageSelectRequest = {
     selected_model: Model;
 };
 
+/**
+ * How messages are matched against a search query
+ */
+export type SearchMode = 'text' | 'semantic';
+
+export type SearchResult = {
+    message: ChatMessage;
+    thread: Thread;
+    /**
+     * When the message was sent
+     */
+    created_at: string;
+    /**
+     * Similarity to the query between -1 and 1, in semantic mode only
+     */
+    score?: number;
+};
+
+export type SearchResultPage = {
+    items: Array<SearchResult>;
+    /**
+     * Cursor for the next page, absent on the last page
+     */
+    next_cursor?: string;
+};
+
 export type GetChatMessagesData = {
     body?: never;
     path: {
@@ -59,15 +201,41 @@ export type GetChatMessagesData = {
          */
         thread_id: string;
     };
-    query?: never;
+    query?: {
+        /**
+         * The maximum number of messages to return
+         */
+        limit?: number;
+        /**
+         * The next_cursor of the previous page
+         */
+        cursor?: string;
+    };
     url: '/thread/{thread_id}/chat';
 };
 
+export type GetChatMessagesErrors = {
+    /**
+     * Invalid cursor
+     */
+    400: _Error;
+    /**
+     * Thread not found
+     */
+    404: _Error;
+    /**
+     * The thread's previous turn could not be saved
+     */
+    503: _Error;
+};
+
+export type GetChatMessagesError = GetChatMessagesErrors[keyof GetChatMessagesErrors];
+
 export type GetChatMessagesResponses = {
     /**
      * Chat messages
      */
-    200: Array<ChatMessage>;
+    200: ChatMessagePage;
 };
 
 export type GetChatMessagesResponse = GetChatMessagesResponses[keyof GetChatMessagesResponses];
@@ -89,6 +257,14 @@ export type SubmitChatMessageErrors = {
      * Invalid input
      */
     400: _Error;
+    /**
+     * Too many generations in flight; retry after the Retry-After delay
+     */
+    429: _Error;
+    /**
+     * The thread's previous turn could not be saved
+     */
+    503: _Error;
 };
 
 export type SubmitChatMessageError = SubmitChatMessageErrors[keyof SubmitChatMessageErrors];
@@ -119,6 +295,14 @@ export type SubmitChatMessageCompareErrors = {
      * Invalid input
      */
     400: _Error;
+    /**
+     * Too many generations in flight; retry after the Retry-After delay
+     */
+    429: _Error;
+    /**
+     * The thread's previous turn could not be saved
+     */
+    503: _Error;
 };
 
 export type SubmitChatMessageCompareError = SubmitChatMessageCompareErrors[keyof SubmitChatMessageCompareErrors];
@@ -146,6 +330,14 @@ export type SubmitChatMessageSelectErrors = {
      * Invalid input
      */
     400: _Error;
+    /**
+     * Comparison not found in the thread, expired, or without the selected model
+     */
+    404: _Error;
+    /**
+     * Another model has already been selected, or the selected model failed
+     */
+    409: _Error;
 };
 
 export type SubmitChatMessageSelectError = SubmitChatMessageSelectErrors[keyof SubmitChatMessageSelectErrors];
@@ -157,18 +349,77 @@ export type SubmitChatMessageSelectResponses = {
     200: unknown;
 };
 
+export type GetGenerationData = {
+    body?: never;
+    headers?: {
+        /**
+         * Takes precedence over after, as sent by EventSource on reconnect
+         */
+        'Last-Event-ID'?: string;
+    };
+    path: {
+        /**
+         * The X-Generation-Id of a chat response, or the comparison_message_id of a compare response
+         */
+        generation_id: string;
+    };
+    query?: {
+        /**
+         * Entry id of the last event already received
+         */
+        after?: string;
+    };
+    url: '/generation/{generation_id}';
+};
+
+export type GetGenerationErrors = {
+    /**
+     * Generation not found or expired
+     */
+    404: _Error;
+};
+
+export type GetGenerationError = GetGenerationErrors[keyof GetGenerationErrors];
+
+export type GetGenerationResponses = {
+    /**
+     * Generation chunks as Server-Sent Events
+     */
+    200: Blob | File;
+};
+
+export type GetGenerationResponse = GetGenerationResponses[keyof GetGenerationResponses];
+
 export type GetThreadsData = {
     body?: never;
     path?: never;
-    query?: never;
+    query?: {
+        /**
+         * The maximum number of threads to return
+         */
+        limit?: number;
+        /**
+         * The next_cursor of the previous page
+         */
+        cursor?: string;
+    };
     url: '/thread';
 };
 
+export type GetThreadsErrors = {
+    /**
+     * Invalid cursor
+     */
+    400: _Error;
+};
+
+export type GetThreadsError = GetThreadsErrors[keyof GetThreadsErrors];
+
 export type GetThreadsResponses = {
     /**
      * Threads
      */
-    200: Array<Thread>;
+    200: ThreadPage;
 };
 
 export type GetThreadsResponse = GetThreadsResponses[keyof GetThreadsResponses];
@@ -189,6 +440,193 @@ export type CreateThreadResponses = {
 
 export type CreateThreadResponse = CreateThreadResponses[keyof CreateThreadResponses];
 
+export type SearchMessagesData = {
+    body?: never;
+    path?: never;
+    query: {
+        /**
+         * The search query
+         */
+        q: string;
+        mode?: SearchMode;
+        /**
+         * The maximum number of results to return
+         */
+        limit?: number;
+        /**
+         * The next_cursor of the previous page
+         */
+        cursor?: string;
+    };
+    url: '/search';
+};
+
+export type SearchMessagesErrors = {
+    /**
+     * Invalid cursor, or semantic search is not enabled
+     */
+    400: _Error;
+    /**
+     * The search did not complete within the server's time limit
+     */
+    503: _Error;
+};
+
+export type SearchMessagesError = SearchMessagesErrors[keyof SearchMessagesErrors];
+
+export type SearchMessagesResponses = {
+    /**
+     * Matching messages
+     */
+    200: SearchResultPage;
+};
+
+export type SearchMessagesResponse = SearchMessagesResponses[keyof SearchMessagesResponses];
+
+export type GetThreadUsageData = {
+    body?: never;
+    path: {
+        thread_id: string;
+    };
+    query?: never;
+    url: '/thread/{thread_id}/usage';
+};
+
+export type GetThreadUsageErrors = {
+    /**
+     * Thread not found
+     */
+    404: _Error;
+};
+
+export type GetThreadUsageError = GetThreadUsageErrors[keyof GetThreadUsageErrors];
+
+export type GetThreadUsageResponses = {
+    /**
+     * Usage of the thread
+     */
+    200: UsageReport;
+};
+
+export type GetThreadUsageResponse = GetThreadUsageResponses[keyof GetThreadUsageResponses];
+
+export type GetUsageData = {
+    body?: never;
+    path?: never;
+    query?: {
+        /**
+         * The first UTC day to include
+         */
+        since?: string;
+        /**
+         * The last UTC day to include
+         */
+        until?: string;
+    };
+    url: '/usage';
+};
+
+export type GetUsageResponses = {
+    /**
+     * Usage per model
+     */
+    200: UsageReport;
+};
+
+export type GetUsageResponse = GetUsageResponses[keyof GetUsageResponses];
+
+export type CreateBatchJobData = {
+    body: CreateBatchJobRequest;
+    path?: never;
+    query?: never;
+    url: '/batch';
+};
+
+export type CreateBatchJobErrors = {
+    /**
+     * Too many prompts across all models
+     */
+    400: _Error;
+};
+
+export type CreateBatchJobError = CreateBatchJobErrors[keyof CreateBatchJobErrors];
+
+export type CreateBatchJobResponses = {
+    /**
+     * Batch job queued
+     */
+    202: BatchJob;
+};
+
+export type CreateBatchJobResponse = CreateBatchJobResponses[keyof CreateBatchJobResponses];
+
+export type GetBatchJobData = {
+    body?: never;
+    path: {
+        job_id: string;
+    };
+    query?: never;
+    url: '/batch/{job_id}';
+};
+
+export type GetBatchJobErrors = {
+    /**
+     * Batch job not found
+     */
+    404: _Error;
+};
+
+export type GetBatchJobError = GetBatchJobErrors[keyof GetBatchJobErrors];
+
+export type GetBatchJobResponses = {
+    /**
+     * Batch job
+     */
+    200: BatchJob;
+};
+
+export type GetBatchJobResponse = GetBatchJobResponses[keyof GetBatchJobResponses];
+
+export type GetBatchResultsData = {
+    body?: never;
+    path: {
+        job_id: string;
+    };
+    query?: {
+        /**
+         * The maximum number of results to return
+         */
+        limit?: number;
+        /**
+         * The next_cursor of the previous page
+         */
+        cursor?: string;
+    };
+    url: '/batch/{job_id}/results';
+};
+
+export type GetBatchResultsErrors = {
+    /**
+     * Invalid cursor
+     */
+    400: _Error;
+    /**
+     * Batch job not found
+     */
+    404: _Error;
+};
+
+export type GetBatchResultsError = GetBatchResultsErrors[keyof GetBatchResultsErrors];
+
+export type GetBatchResultsResponses = {
+    /**
+     * Batch results
+     */
+    200: BatchResultPage;
+};
+
+export type GetBatchResultsResponse = GetBatchResultsResponses[keyof GetBatchResultsResponses];
+
 export type ClientOptions = {
     baseUrl: 'https://chat.chrissreesangkom.com/api' | 'http://localhost:8000' | (string & {});
 };
\ No newline at end of file
@@ -1,6 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import styles from './ChatSidebar.module.css';
-import { getThreads, Thread as ThreadType, ChatMessage, getChatMessages } from '../client';
+import { getThreads, Thread as ThreadType, ThreadPage, ChatMessage, ChatMessagePage, getChatMessages } from '../client';
 import { useCurrentThread } from '../hooks/useCurrentThread';
 import { ChatThread, DisplayChatMessage } from '../types/types';
 
@@ -16,9 +16,9 @@ const ChatSidebar: React.FC<ChatSidebarProps> = ({ setMessages, threads, setThre
 
   useEffect(() => {
     const fetchThreadsAndInitiateEmptyConversation = async () => {
-      const response = await getThreads();
-      if (response.data) {
-        const threadsData: ChatThread[] = response.data.map((thread: ThreadType) => ({
+      const fetchedThreads = await fetchAllThreads();
+      if (fetchedThreads) {
+        const threadsData: ChatThread[] = fetchedThreads.map((thread: ThreadType) => ({
           id: thread.id,
           name: thread.name,
           created_at: thread.created_at,
@@ -32,13 +32,27 @@ const ChatSidebar: React.FC<ChatSidebarProps> = ({ setMessages, threads, setThre
         } else {
           handleThreadSelect(threadId, threadsData);
         }
-      } else {
-        console.error(response.error);
       }
     };
     fetchThreadsAndInitiateEmptyConversation();
   }, []);
 
+  // Threads are paginated by the API; follow next_cursor until every page is loaded
+  const fetchAllThreads = async (): Promise<ThreadType[] | null> => {
+    const allThreads: ThreadType[] = [];
+    let cursor: string | undefined = undefined;
+    do {
+      const { data, error }: { data?: ThreadPage; error?: unknown } = await getThreads({ query: { cursor } });
+      if (!data) {
+        console.error(error);
+        return null;
+      }
+      allThreads.push(...data.items);
+      cursor = data.next_cursor;
+    } while (cursor);
+    return allThreads;
+  };
+
   const [isOpen, setIsOpen] = useState(true);
   const [searchQuery, setSearchQuery] = useState("");
   
@@ -60,12 +74,21 @@ const ChatSidebar: React.FC<ChatSidebarProps> = ({ setMessages, threads, setThre
     if (id === null) {
       return;
     }
-    const response = await getChatMessages({ path: { thread_id: id } });
-    if (response.data) {
-      setMessages(response.data.map((msg: ChatMessage) => ({ messages: [msg], role: msg.role })));
-    } else {
-      console.error(response.error);
-    }
+    const allMessages: ChatMessage[] = [];
+    let cursor: string | undefined = undefined;
+    do {
+      const { data, error }: { data?: ChatMessagePage; error?: unknown } = await getChatMessages({
+        path: { thread_id: id },
+        query: { cursor },
+      });
+      if (!data) {
+        console.error(error);
+        return;
+      }
+      allMessages.push(...data.items);
+      cursor = data.next_cursor;
+    } while (cursor);
+    setMessages(allMessages.map((msg: ChatMessage) => ({ messages: [msg], role: msg.role })));
   };
 
   // Handle thread selection
@@ -74,7 +74,6 @@ const MessageList = ({ messages, setMessages }: MessageListProps) => {
                     <button 
                       className={styles.selectVersionButton}
                       onClick={() => handleSelectVersion(msg.comparison_message_id!, m.model as Model, index)}
-                      disabled={msg.isLoading}
                     >
                       select this version
                     </button>
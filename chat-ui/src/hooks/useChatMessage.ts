@@ -104,8 +104,6 @@ export const useChatMessages = (
     const userMessage: ChatMessage = { content: text, role: 'user' };
     setMessages((prev: DisplayChatMessage[]) => [...prev, { messages: [userMessage], role: 'user'}]);
     
-    const model_to_message_index = Object.fromEntries(models.map((model, index) => [model, index]));
-    
     try {
       // Create placeholders for the AI message
       const aiPlaceholders: ChatMessage[] = models.map((model) => ({ content: '', role: 'ai', model: model }));
@@ -140,6 +138,9 @@ export const useChatMessages = (
             const lines = text.split('\n').filter(line => line.trim() !== '');
             
             for (const line of lines) {
+              // Only data lines carry messages; SSE id/event lines are for reattaching
+              if (!line.startsWith('data: ')) continue;
+
               // Strip data: from the beginning of the string and trim all whitespace
               const text_without_data = line.replace('data: ', '').trim();
               
@@ -158,16 +159,19 @@ export const useChatMessages = (
                   continue;
                 }
                 
+                // Per-model completion events carry a status instead of content
+                if (typeof new_message.content !== 'string') continue;
+
                 const model = new_message.model;
-                const model_index = model_to_message_index[model];
                 
                 // Append the new content to our accumulated content for this model
                 modelContentMap[model] += new_message.content;
                 
-                // Update the AI message with the accumulated content for this model
+                // Update the AI message with the accumulated content for this model, unless another was selected
                 setMessages((prev: DisplayChatMessage[]) => {
                   const updated = [...prev];
-                  updated[updated.length - 1].messages[model_index].content = modelContentMap[model];
+                  const message = updated[updated.length - 1].messages.find(m => m.model === model);
+                  if (message) message.content = modelContentMap[model];
                   return updated;
                 });
               } catch (parseError) {